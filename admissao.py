@@ -0,0 +1,202 @@
+"""
+Controle de admissão para as capturas que abrem navegador
+
+Limita quantas capturas rodam ao mesmo tempo no processo (total e por
+plataforma). Quem não cabe espera numa fila limitada, em ordem de chegada;
+com a fila cheia, ou depois de ``espera_max`` segundos na fila, a captura é
+recusada com AdmissaoRecusadaError (a API responde 429 + Retry-After).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_ESPERA_PADRAO = object()
+
+
+class AdmissaoRecusadaError(Exception):
+    """Capacidade de captura esgotada; ``retry_after`` é a espera sugerida em segundos"""
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+def _ler_limites(texto: str) -> Dict[str, int]:
+    """'vivareal=2,zapimoveis=1' -> {'vivareal': 2, 'zapimoveis': 1}"""
+    limites = {}
+    for parte in (texto or '').split(','):
+        nome, _, valor = parte.partition('=')
+        if nome.strip() and valor.strip():
+            limites[nome.strip().casefold()] = int(valor)
+    return limites
+
+
+class ControleAdmissao:
+    """
+    Até ``max_global`` capturas simultâneas e até ``max_por_plataforma`` por
+    plataforma (``limites_plataforma`` sobrepõe por nome). Excedentes esperam
+    numa fila de até ``max_fila`` entradas por no máximo ``espera_max`` s.
+
+    Ao liberar uma vaga, ela é entregue ao primeiro da fila cuja plataforma
+    ainda tem espaço, para que uma plataforma lotada não trave as outras.
+    """
+
+    def __init__(self, nome: str, max_global: int = 4, max_por_plataforma: int = 2,
+                 max_fila: int = 20, espera_max: float = 15,
+                 limites_plataforma: Optional[Dict[str, int]] = None):
+        self.nome = nome
+        self.max_global = max_global
+        self.max_por_plataforma = max_por_plataforma
+        self.max_fila = max_fila
+        self.espera_max = espera_max
+        self.limites_plataforma = {k.casefold(): v for k, v in (limites_plataforma or {}).items()}
+
+        self._em_uso = 0
+        self._por_plataforma: Dict[str, int] = {}
+        self._fila: Deque[List[Any]] = deque()
+        # Média móvel da duração de uma captura, para estimar o Retry-After
+        self._duracao_media = 10.0
+        self._stats = {
+            'admitidas': 0,
+            'enfileiradas': 0,
+            'recusadas_fila_cheia': 0,
+            'recusadas_espera': 0,
+            'espera_total_s': 0.0,
+        }
+
+    def limite(self, plataforma: str) -> int:
+        return self.limites_plataforma.get(plataforma, self.max_por_plataforma)
+
+    def _cabe(self, plataforma: str) -> bool:
+        return (self._em_uso < self.max_global
+                and self._por_plataforma.get(plataforma, 0) < self.limite(plataforma))
+
+    def _ocupar(self, plataforma: str):
+        self._em_uso += 1
+        self._por_plataforma[plataforma] = self._por_plataforma.get(plataforma, 0) + 1
+
+    def _liberar(self, plataforma: str):
+        self._em_uso -= 1
+        restantes = self._por_plataforma.get(plataforma, 1) - 1
+        if restantes:
+            self._por_plataforma[plataforma] = restantes
+        else:
+            self._por_plataforma.pop(plataforma, None)
+
+        # Entrega as vagas livres aos primeiros da fila que cabem
+        for entrada in list(self._fila):
+            if self._em_uso >= self.max_global:
+                break
+            plataforma_fila, futuro = entrada
+            if futuro.done():
+                self._fila.remove(entrada)
+            elif self._cabe(plataforma_fila):
+                self._fila.remove(entrada)
+                self._ocupar(plataforma_fila)
+                futuro.set_result(True)
+
+    def retry_after(self) -> int:
+        """Segundos estimados até a fila atual andar"""
+        rodadas = (len(self._fila) + 1) / max(1, self.max_global)
+        return max(1, math.ceil(rodadas * self._duracao_media))
+
+    def _recusar(self, motivo: str, contador: str) -> AdmissaoRecusadaError:
+        self._stats[contador] += 1
+        retry = self.retry_after()
+        logger.warning(f"🚦 {self.nome}: captura recusada ({motivo}), Retry-After {retry}s")
+        return AdmissaoRecusadaError(
+            f"Capacidade de captura esgotada ({motivo}); tente novamente em {retry}s", retry
+        )
+
+    async def _aguardar_vaga(self, plataforma: str, espera: Optional[float]):
+        futuro = asyncio.get_running_loop().create_future()
+        entrada = [plataforma, futuro]
+        self._fila.append(entrada)
+        self._stats['enfileiradas'] += 1
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(futuro), timeout=espera)
+        except asyncio.TimeoutError:
+            if not futuro.done():
+                futuro.cancel()
+                if entrada in self._fila:
+                    self._fila.remove(entrada)
+                raise self._recusar(f"{espera:g}s na fila", 'recusadas_espera')
+        except asyncio.CancelledError:
+            # Cliente desistiu: devolve a vaga se ela já tinha sido entregue
+            if futuro.done() and not futuro.cancelled():
+                self._liberar(plataforma)
+            else:
+                futuro.cancel()
+                if entrada in self._fila:
+                    self._fila.remove(entrada)
+            raise
+        finally:
+            self._stats['espera_total_s'] += time.perf_counter() - inicio
+
+    @asynccontextmanager
+    async def admitir(self, plataforma: str, espera: Any = _ESPERA_PADRAO):
+        """
+        Ocupa uma vaga para ``plataforma`` durante o bloco. ``espera`` sobrepõe
+        ``espera_max``; ``espera=None`` espera sem prazo e ignora o limite da
+        fila (para chamadores já limitados, como os workers de jobs).
+        """
+        plataforma = (plataforma or '').strip().casefold()
+        if espera is _ESPERA_PADRAO:
+            espera = self.espera_max
+
+        if self._cabe(plataforma):
+            self._ocupar(plataforma)
+        else:
+            if espera is not None and len(self._fila) >= self.max_fila:
+                raise self._recusar(f"fila cheia ({self.max_fila})", 'recusadas_fila_cheia')
+            await self._aguardar_vaga(plataforma, espera)
+
+        self._stats['admitidas'] += 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._duracao_media = 0.8 * self._duracao_media + 0.2 * (time.perf_counter() - inicio)
+            self._liberar(plataforma)
+
+    def metricas(self) -> List[Any]:
+        """Famílias para um coletor de metricas.py"""
+        return [
+            ('imoveis_admission_in_use', 'gauge', 'Capturas admitidas em andamento por plataforma',
+             [({'plataforma': p}, n) for p, n in self._por_plataforma.items()]),
+            ('imoveis_admission_queue_depth', 'gauge', 'Capturas esperando vaga', [({}, len(self._fila))]),
+            ('imoveis_admission_rejected_total', 'counter', 'Capturas recusadas com 429', [
+                ({'motivo': 'fila_cheia'}, self._stats['recusadas_fila_cheia']),
+                ({'motivo': 'espera'}, self._stats['recusadas_espera']),
+            ]),
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['em_uso'] = self._em_uso
+        stats['por_plataforma'] = dict(self._por_plataforma)
+        stats['fila'] = len(self._fila)
+        stats['max_global'] = self.max_global
+        stats['max_por_plataforma'] = self.max_por_plataforma
+        stats['max_fila'] = self.max_fila
+        stats['duracao_media_s'] = self._duracao_media
+        return stats
+
+
+admissao_capturas = ControleAdmissao(
+    'capturas',
+    max_global=int(os.getenv('ADMISSAO_MAX_CAPTURAS', '4')),
+    max_por_plataforma=int(os.getenv('ADMISSAO_MAX_POR_PLATAFORMA', '2')),
+    max_fila=int(os.getenv('ADMISSAO_MAX_FILA', '20')),
+    espera_max=float(os.getenv('ADMISSAO_ESPERA_MAX', '15')),
+    limites_plataforma=_ler_limites(os.getenv('ADMISSAO_LIMITES_PLATAFORMA', '')),
+)
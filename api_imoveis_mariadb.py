@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
 import asyncio
 import json
+import time
 from datetime import datetime
 from browser_use import Agent
 from browser_use.browser.context import BrowserContext
@@ -10,10 +13,25 @@ from playwright.async_api import async_playwright
 from src.utils.llm_provider import get_llm_model
 import os
 from dotenv import load_dotenv
-from database import db, get_plataformas_ativas
+from database import (db, refdata, aupsert_links_unicos, abuscar_link_unico,
+                      normalizar_nome_municipio, slug_municipio)
+from migracoes import verificar_schema
+from browser_pool import browser_pool
+from single_flight import SingleFlight, SingleFlightEntreWorkers
+from estado_compartilhado import estado_compartilhado
+from cache_links import cache_links
+from src.utils.asset_cache import asset_cache
+from prontidao import aguardar_pagina_pronta, estatisticas_prontidao
+from extracao import extrair_dados_pagina, seletores_vencedores
+from captura_http import captura_http, estatisticas_tiers
+from metricas import metricas, instalar_metricas, carregamento_pagina
+from admissao import admissao_capturas, AdmissaoRecusadaError
+from saude import VerificadorProntidao, SnapshotTabelas, verificar_banco, verificar_llm
+from respostas import CorpoPreparado, ler_campos, projetar, resposta_json, serializar
 import logging
 import urllib.parse
-import unicodedata
+import base64
+import hashlib
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -22,7 +40,32 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="API de Imóveis VivaReal - MariaDB", version="2.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicialização e encerramento dos recursos compartilhados da API"""
+    try:
+        await asyncio.to_thread(verificar_schema)
+    except Exception as e:
+        logger.error(f"Não foi possível verificar o schema: {e}")
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        logger.error(f"Não foi possível iniciar o pool de navegadores: {e}")
+    # Aquecimento do worker: cada processo carrega o seu cache e o seu cliente LLM
+    try:
+        await refdata.aget()
+        get_llm()
+    except Exception as e:
+        logger.warning(f"⚠️ Aquecimento incompleto: {e}")
+    contagens_tabelas.start()
+    yield
+    await contagens_tabelas.close()
+    await browser_pool.close()
+    await captura_http.aclose()
+    await db.aclose()
+
+app = FastAPI(title="API de Imóveis VivaReal - MariaDB", version="2.0.0", lifespan=lifespan)
+instalar_metricas(app)
 
 class BuscaUnica(BaseModel):
     """Modelo para busca única de imóveis"""
@@ -30,6 +73,7 @@ class BuscaUnica(BaseModel):
     estado: str
     tipo_operacao: str = "venda"  # venda ou aluguel
     plataforma: str = "VivaReal"  # plataforma específica
+    force_refresh: bool = False  # ignora o cache e captura de novo
 
 class ResultadoBuscaUnica(BaseModel):
     """Resultado da busca única"""
@@ -43,63 +87,49 @@ class ResultadoBuscaUnica(BaseModel):
     data_busca: str
     status: str
     observacoes: Optional[str] = None
+    tier: Optional[str] = None  # http, browser ou agent (None para link padrão/cache)
+
+_llm = None
 
 def get_llm():
-    """Configura e retorna o modelo LLM"""
-    try:
-        return get_llm_model(
-            provider="openai",
-            model="gpt-4o",
-            temperature=0.1,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao configurar LLM: {str(e)}")
+    """Modelo LLM do processo, configurado na primeira chamada e reaproveitado"""
+    global _llm
+    if _llm is None:
+        try:
+            _llm = get_llm_model(
+                provider="openai",
+                model="gpt-4o",
+                temperature=0.1,
+                api_key=os.getenv("OPENAI_API_KEY")
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao configurar LLM: {str(e)}")
+    return _llm
 
-def get_cidades_ativas():
-    """Busca cidades ativas do banco MariaDB"""
-    try:
-        query = """
-            SELECT m.id, m.nome, m.estado_id, 
-                   e.nome as estado_nome, e.sigla as estado_sigla
-            FROM municipios m
-            JOIN estados e ON m.estado_id = e.id
-            WHERE m.ativo = 1 AND e.ativo = 1
-            ORDER BY e.sigla, m.nome
-        """
-        return db.execute_query(query)
-    except Exception as e:
-        logger.error(f"Erro ao buscar cidades ativas: {e}")
-        return []
+CAMPOS_CIDADE = ('id', 'nome', 'estado_id', 'estado_nome', 'estado_sigla')
+# Corpos prontos de /cidades-ativas por projeção, refeitos quando o cache de referência recarrega
+_corpos_cidades = {'ref': None, 'corpos': {}}
+
+async def corpo_cidades_ativas(campos: Optional[List[str]]) -> CorpoPreparado:
+    """Lista de cidades ativas (do cache de referência) já serializada"""
+    ref = await refdata.aget()
+    if _corpos_cidades['ref'] is not ref:
+        _corpos_cidades.update(ref=ref, corpos={})
+    chave = tuple(campos) if campos else None
+    corpo = _corpos_cidades['corpos'].get(chave)
+    if corpo is None:
+        cidades = projetar(ref.cidades_ativas(), campos)
+        corpo = CorpoPreparado(serializar({"total": len(cidades), "cidades": cidades}))
+        _corpos_cidades['corpos'][chave] = corpo
+    return corpo
 
-def get_plataforma_id(nome_plataforma: str):
-    """Busca ID da plataforma no banco"""
+async def get_plataforma_id(nome_plataforma: str):
+    """Busca ID da plataforma (nome exato, alias como VIVA-REAL ou parcial)"""
     try:
-        # Tentar buscar pelo nome exato primeiro
-        result = db.execute_query(
-            "SELECT id FROM plataformas WHERE nome = %s AND ativo = 1",
-            (nome_plataforma,)
-        )
-        
-        # Se não encontrar, tentar variações
-        if not result:
-            # Tentar com hífen
-            nome_alternativo = nome_plataforma.replace("VivaReal", "VIVA-REAL")
-            result = db.execute_query(
-                "SELECT id FROM plataformas WHERE nome = %s AND ativo = 1",
-                (nome_alternativo,)
-            )
-        
-        # Se ainda não encontrar, tentar com LIKE
-        if not result:
-            result = db.execute_query(
-                "SELECT id FROM plataformas WHERE nome LIKE %s AND ativo = 1",
-                (f"%{nome_plataforma.replace('-', '')}%",)
-            )
-        
-        if result:
-            logger.info(f"✅ Plataforma encontrada: ID={result[0]['id']}")
-            return result[0]['id']
+        plataforma_id = (await refdata.aget()).plataforma_id(nome_plataforma)
+        if plataforma_id:
+            logger.info(f"✅ Plataforma encontrada: ID={plataforma_id}")
+            return plataforma_id
         else:
             logger.error(f"❌ Plataforma '{nome_plataforma}' não encontrada no banco")
             return None
@@ -107,167 +137,125 @@ def get_plataforma_id(nome_plataforma: str):
         logger.error(f"Erro ao buscar plataforma {nome_plataforma}: {e}")
         return None
 
-def get_tipo_busca_id(nome_tipo: str):
-    """Busca ID do tipo de busca no banco"""
+async def get_tipo_busca_id(nome_tipo: str):
+    """Busca ID do tipo de busca no cache de dados de referência"""
     try:
-        result = db.execute_query(
-            "SELECT id FROM tipos_busca WHERE nome = %s",
-            (nome_tipo.upper(),)
-        )
-        return result[0]['id'] if result else None
+        return (await refdata.aget()).tipo_busca_id(nome_tipo)
     except Exception as e:
         logger.error(f"Erro ao buscar tipo de busca {nome_tipo}: {e}")
         return None
 
+# Seletores específicos do contador de resultados do VivaReal (também usados na espera da página)
+SELETORES_RESULTADOS_VIVAREAL = [
+    '[data-testid="results-title"]',
+    'h1[class*="results"]',
+    'span[class*="results"]',
+    'div[class*="results-summary"]',
+    'div[class*="listing-counter"]',
+    'strong[class*="results"]',
+    '.results__title'
+]
+
+async def montar_url_vivareal(cidade: str, estado: str, tipo_operacao: str) -> str:
+    """
+    URL da página da cidade no VivaReal, com o slug pré-calculado do índice de
+    municípios; se a cidade não for resolvida, o slug é gerado pela mesma regra
+    """
+    try:
+        resolvido = (await refdata.aget()).resolver_municipio(cidade, estado, 'VivaReal')
+    except Exception as e:
+        logger.warning(f"⚠️ Índice de municípios indisponível: {e}")
+        resolvido = None
+    if resolvido:
+        slug, sigla = resolvido['slug'], resolvido['sigla']
+    else:
+        slug, sigla = slug_municipio(cidade, 'VivaReal', estado), estado
+    return f"https://www.vivareal.com.br/{tipo_operacao}/{sigla.lower()}/{slug}/"
+
+def normalizar_link_capturado(url: str) -> str:
+    """Decodifica, remove a query string e garante a barra final"""
+    url = urllib.parse.unquote(url)
+    if '?' in url:
+        url = url.split('?')[0]
+    if not url.endswith('/'):
+        url += '/'
+    return url
+
+async def capturar_link_http(cidade: str, estado: str, tipo_operacao: str) -> Optional[dict]:
+    """
+    Tier 1: busca o HTML com o cliente HTTP compartilhado, sem navegador.
+    Retorna None quando a página exige JavaScript ou o total não está no HTML.
+    """
+    url = await montar_url_vivareal(cidade, estado, tipo_operacao)
+    logger.info(f"🌐 Captura HTTP: Acessando {url}")
+    try:
+        dados = await captura_http.capturar(url)
+    except Exception as e:
+        logger.error(f"❌ Erro na captura HTTP: {e}")
+        return None
+    if not dados:
+        return None
+    
+    url_atual = normalizar_link_capturado(dados['url_final'])
+    logger.info(f"✅ Captura HTTP bem-sucedida: {url_atual} ({dados['total']} imóveis)")
+    return {
+        'link_capturado': url_atual,
+        'titulo': dados['titulo'] or dados['og_titulo'] or dados['h1'] or f"Imóveis para {tipo_operacao} em {cidade}, {estado}",
+        'total_imoveis': dados['total']
+    }
+
 async def capturar_link_direto(cidade: str, estado: str, tipo_operacao: str) -> dict:
     """
     Função auxiliar para capturar o link diretamente usando Playwright
     sem usar o Agent, como fallback mais simples
     """
-    playwright = None
-    browser = None
-    page = None
-    
     try:
-        # Formatar URL - usar normalização melhor para caracteres especiais
-        cidade_formatada = cidade.lower().replace(" ", "-")
-        # Remover acentos e caracteres especiais
-        cidade_formatada = ''.join(
-            c for c in unicodedata.normalize('NFD', cidade_formatada)
-            if unicodedata.category(c) != 'Mn'
-        )
-        estado_formatado = estado.lower()
-        url = f"https://www.vivareal.com.br/{tipo_operacao}/{estado_formatado}/{cidade_formatada}/"
+        url = await montar_url_vivareal(cidade, estado, tipo_operacao)
         
         logger.info(f"🌐 Captura direta: Acessando {url}")
         
-        # Iniciar navegador
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(
-            headless=True,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox'
-            ]
-        )
-        
-        # Criar contexto com user agent real
-        context = await browser.new_context(
+        # Contexto anônimo novo num navegador quente do pool, com user agent real
+        async with browser_pool.lease(
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             viewport={'width': 1920, 'height': 1080}
-        )
-        
-        page = await context.new_page()
+        ) as context:
+            await asset_cache.install(context)
+            page = await context.new_page()
         
-        # Configurar timeout
-        page.set_default_timeout(30000)
+            # Configurar timeout
+            page.set_default_timeout(30000)
         
-        # Navegar para a URL
-        response = await page.goto(url, wait_until='domcontentloaded')
-        
-        # Aguardar carregamento completo
-        try:
-            # Aguardar algum elemento específico do VivaReal
-            await page.wait_for_selector('body', state='visible', timeout=5000)
-            await page.wait_for_timeout(3000)
-        except:
-            pass
+            # Navegar para a URL
+            inicio_carga = time.perf_counter()
+            response = await page.goto(url, wait_until='domcontentloaded')
         
-        # Capturar informações
-        titulo = await page.title()
-        url_atual = page.url
+            # Aguardar o contador de resultados do VivaReal, rede ociosa ou DOM estável
+            await aguardar_pagina_pronta(
+                page, SELETORES_RESULTADOS_VIVAREAL, prazo=10, quieto_ms=1000, rotulo='captura_direta'
+            )
+            carregamento_pagina.observar(time.perf_counter() - inicio_carga, rotulo='captura_direta')
         
-        # Se título vazio, tentar capturar de outras formas
-        if not titulo or titulo == "":
+            # Capturar informações (título, og:title, h1 e total numa única chamada)
+            url_atual = page.url
+            titulo = None
+            total_imoveis = None
             try:
-                # Tentar meta title
-                meta_title = await page.query_selector('meta[property="og:title"]')
-                if meta_title:
-                    titulo = await meta_title.get_attribute('content')
-                
-                # Se ainda vazio, tentar h1
-                if not titulo:
-                    h1 = await page.query_selector('h1')
-                    if h1:
-                        titulo = await h1.text_content()
-                
-                # Se ainda vazio, criar título padrão
-                if not titulo:
-                    titulo = f"Imóveis para {tipo_operacao} em {cidade}, {estado}"
-            except:
-                titulo = f"Imóveis para {tipo_operacao} em {cidade}, {estado}"
-        
-        logger.info(f"📝 Título capturado: {titulo}")
+                dados = await extrair_dados_pagina(
+                    page, 'vivareal', SELETORES_RESULTADOS_VIVAREAL + ['[class*="Title"]', 'h1', 'h2']
+                )
+                titulo = dados['titulo'] or dados['og_titulo'] or dados['h1']
+                total_imoveis = dados['total']
+                if total_imoveis is not None:
+                    logger.info(f"📊 Total encontrado: {total_imoveis} ({dados['seletor'] or 'texto da página'})")
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível extrair dados da página: {e}")
         
-        # Tentar capturar total de imóveis
-        total_imoveis = None
-        try:
-            # Aguardar um pouco mais para elementos dinâmicos
-            await page.wait_for_timeout(2000)
-            
-            # Seletores comuns para contador de imóveis no VivaReal
-            seletores = [
-                '[data-testid="results-title"]',
-                'h1[class*="results"]',
-                'span[class*="results"]',
-                'div[class*="results-summary"]',
-                'div[class*="listing-counter"]',
-                'strong[class*="results"]',
-                '.results__title',
-                '[class*="Title"]',
-                'h1',
-                'h2'
-            ]
-            
-            for seletor in seletores:
-                try:
-                    elementos = await page.query_selector_all(seletor)
-                    for elemento in elementos:
-                        texto = await elemento.text_content()
-                        if texto and ('imóve' in texto.lower() or 'resultado' in texto.lower() or 'anúncio' in texto.lower()):
-                            total_imoveis = texto.strip()
-                            logger.info(f"📊 Total encontrado: {total_imoveis}")
-                            break
-                    if total_imoveis:
-                        break
-                except:
-                    continue
-            
-            # Se ainda não encontrou, tentar capturar via JavaScript
-            if not total_imoveis:
-                try:
-                    total_imoveis = await page.evaluate('''
-                        () => {
-                            const elements = document.querySelectorAll('*');
-                            for (let el of elements) {
-                                const text = el.textContent || '';
-                                if (text.match(/\\d+\\s*(imóveis?|resultados?|anúncios?)/i)) {
-                                    return text.trim();
-                                }
-                            }
-                            return null;
-                        }
-                    ''')
-                    if total_imoveis:
-                        logger.info(f"📊 Total encontrado via JS: {total_imoveis}")
-                except:
-                    pass
-                    
-        except Exception as e:
-            logger.warning(f"⚠️ Não foi possível capturar total de imóveis: {e}")
+            if not titulo:
+                titulo = f"Imóveis para {tipo_operacao} em {cidade}, {estado}"
+            logger.info(f"📝 Título capturado: {titulo}")
         
         # Limpar e normalizar URL
-        # Decodificar caracteres especiais
-        url_atual = urllib.parse.unquote(url_atual)
-        
-        # Remover parâmetros de query
-        if '?' in url_atual:
-            url_atual = url_atual.split('?')[0]
-        
-        # Garantir que termina com /
-        if not url_atual.endswith('/'):
-            url_atual += '/'
+        url_atual = normalizar_link_capturado(url_atual)
         
         logger.info(f"✅ Captura direta bem-sucedida: {url_atual}")
         
@@ -280,99 +268,66 @@ async def capturar_link_direto(cidade: str, estado: str, tipo_operacao: str) ->
     except Exception as e:
         logger.error(f"❌ Erro na captura direta: {e}")
         return None
+
+async def capturar_em_camadas(cidade: str, estado: str, tipo_operacao: str) -> Optional[dict]:
+    """
+    Tenta HTTP puro (tier 1) e só sobe para o navegador do pool (tier 2) se
+    o HTML não bastar. O dict retornado traz o tier que serviu a captura.
+    """
+    for tier, capturar in (('http', capturar_link_http), ('browser', capturar_link_direto)):
+        dados = await capturar(cidade, estado, tipo_operacao)
+        estatisticas_tiers.registrar(tier, bool(dados))
+        if dados:
+            dados['tier'] = tier
+            return dados
+    return None
+
+def captura_real(resultado: ResultadoBuscaUnica) -> bool:
+    """Link vindo de uma captura (http, browser ou agent), e não do link padrão montado localmente"""
+    return resultado.status == "sucesso" and resultado.tier is not None
+
+async def preparar_link_unico(resultado: ResultadoBuscaUnica) -> Optional[dict]:
+    """Resolve os IDs do resultado e monta o item para aupsert_links_unicos"""
+    if not captura_real(resultado):
+        # Link padrão após falha de captura: não vira link salvo
+        logger.info(f"Link padrão de {resultado.cidade}/{resultado.estado} não será salvo")
+        return None
+
+    # Busca IDs necessários
+    plataforma_id = await get_plataforma_id(resultado.plataforma)
+    tipo_busca_id = await get_tipo_busca_id(resultado.tipo_operacao)
     
-    finally:
-        # Limpar recursos
-        if page:
-            await page.close()
-        if browser:
-            await browser.close()
-        if playwright:
-            await playwright.stop()
+    if not plataforma_id or not tipo_busca_id:
+        logger.error(f"Plataforma ou tipo de busca não encontrado")
+        return None
+    
+    # Busca cidade e estado
+    municipio = (await refdata.aget()).municipio(resultado.cidade, resultado.estado)
+    
+    if not municipio:
+        logger.error(f"Cidade {resultado.cidade}/{resultado.estado} não encontrada")
+        return None
+    
+    return {
+        'url': resultado.link_unico,
+        'plataforma_id': plataforma_id,
+        'tipo_busca_id': tipo_busca_id,
+        'estado_id': municipio['estado_id'],
+        'municipio_id': municipio['id'],
+        'termo_busca': f"{resultado.tipo_operacao} {resultado.cidade} {resultado.estado}",
+        'motor_busca': 'webui',
+        'observacao': f"Link único encontrado: {resultado.link_unico}"
+    }
 
-def salvar_link_unico(resultado: ResultadoBuscaUnica):
-    """Salva o link único no banco MariaDB"""
+async def salvar_link_unico(resultado: ResultadoBuscaUnica):
+    """Salva o link único no banco MariaDB (upsert do link + log numa transação)"""
     try:
-        # Busca IDs necessários
-        plataforma_id = get_plataforma_id(resultado.plataforma)
-        tipo_busca_id = get_tipo_busca_id(resultado.tipo_operacao)
-        
-        if not plataforma_id or not tipo_busca_id:
-            logger.error(f"Plataforma ou tipo de busca não encontrado")
-            return False
-        
-        # Busca cidade e estado
-        cidade_result = db.execute_query(
-            "SELECT m.id as municipio_id, e.id as estado_id FROM municipios m JOIN estados e ON m.estado_id = e.id WHERE m.nome = %s AND e.sigla = %s",
-            (resultado.cidade, resultado.estado)
-        )
-        
-        if not cidade_result:
-            logger.error(f"Cidade {resultado.cidade}/{resultado.estado} não encontrada")
+        item = await preparar_link_unico(resultado)
+        if not item:
             return False
         
-        municipio_id = cidade_result[0]['municipio_id']
-        estado_id = cidade_result[0]['estado_id']
-        
-        # Verifica se já existe um link para esta combinação
-        existe = db.execute_query(
-            "SELECT id FROM links_duckduckgo WHERE plataforma_id = %s AND tipo_busca_id = %s AND estado_id = %s AND municipio_id = %s",
-            (plataforma_id, tipo_busca_id, estado_id, municipio_id)
-        )
-        
-        if existe:
-            # Atualiza o link existente
-            update_query = """
-                UPDATE links_duckduckgo 
-                SET url = %s, updated_at = NOW()
-                WHERE plataforma_id = %s AND tipo_busca_id = %s AND estado_id = %s AND municipio_id = %s
-            """
-            db.execute_update(update_query, (
-                resultado.link_unico,
-                plataforma_id, tipo_busca_id, estado_id, municipio_id
-            ))
-            logger.info(f"Link atualizado para {resultado.cidade}/{resultado.estado}")
-        else:
-            # Insere novo link
-            insert_query = """
-                INSERT INTO links_duckduckgo 
-                (url, plataforma_id, tipo_busca_id, estado_id, municipio_id, 
-                 distrito_id, termo_busca, posicao_busca, processado, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """
-            db.execute_update(insert_query, (
-                resultado.link_unico,
-                plataforma_id,
-                tipo_busca_id,
-                estado_id,
-                municipio_id,
-                None,  # distrito_id
-                f"{resultado.tipo_operacao} {resultado.cidade} {resultado.estado}",  # termo_busca
-                1,  # posicao_busca (sempre 1 para link único)
-                0  # processado
-            ))
-            logger.info(f"Novo link inserido para {resultado.cidade}/{resultado.estado}")
-        
-        # Registra no log de busca
-        try:
-            log_query = """
-                INSERT INTO logs_busca 
-                (motor_busca, query, plataforma_id, municipio_id, 
-                 links_encontrados, links_salvos, data_execucao, observacao)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s)
-            """
-            db.execute_update(log_query, (
-                'webui',
-                f"{resultado.tipo_operacao} {resultado.cidade} {resultado.estado}",
-                plataforma_id,
-                municipio_id,
-                1,  # sempre 1 link único
-                1,  # sempre 1 link salvo
-                f"Link único encontrado: {resultado.link_unico}"
-            ))
-        except Exception as e:
-            logger.warning(f"Erro ao salvar log: {e}")
-        
+        await aupsert_links_unicos([item])
+        logger.info(f"Link salvo para {resultado.cidade}/{resultado.estado}")
         return True
         
     except Exception as e:
@@ -386,28 +341,82 @@ async def root():
         "version": "2.0.0",
         "endpoints": {
             "status": "/status",
+            "healthz": "/healthz",
+            "readyz": "/readyz",
+            "metrics": "/metrics",
             "cidades": "/cidades-ativas",
             "buscar-unico": "/buscar-link-unico",
+            "buscar-lote": "/buscar-links-lote",
             "docs": "/docs"
         }
     }
 
+# Probes: /readyz reaproveita o resultado por READYZ_CACHE_TTL segundos
+verificador_prontidao = VerificadorProntidao(
+    ttl=float(os.getenv('READYZ_CACHE_TTL', '5')),
+    timeout=float(os.getenv('READYZ_TIMEOUT', '2'))
+)
+# Contagens de tabelas do /status, recalculadas em background
+contagens_tabelas = SnapshotTabelas(db, intervalo=float(os.getenv('STATUS_SNAPSHOT_INTERVALO', '60')))
+
+@verificador_prontidao.verificacao('banco')
+async def banco_pronto():
+    return await verificar_banco(db)
+
+@verificador_prontidao.verificacao('navegadores')
+async def navegadores_prontos():
+    stats = browser_pool.stats()
+    if stats['navegadores_ativos'] < stats['tamanho']:
+        # Slots vazios só seriam relançados num lease, que não chega a uma instância fora do ar
+        browser_pool.reparar_em_segundo_plano()
+    return {
+        'ok': stats['navegadores_ativos'] > 0,
+        'ativos': stats['navegadores_ativos'],
+        'livres': stats['livres'],
+        'aguardando': stats['aguardando']
+    }
+
+verificador_prontidao.verificacao('llm')(verificar_llm)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: o processo está respondendo (sem I/O)"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """Readiness: banco (ping no pool), navegadores e chave do LLM; 503 se algo falhar"""
+    resultado = await verificador_prontidao.verificar()
+    if not resultado['pronto']:
+        response.status_code = 503
+    return resultado
+
 @app.get("/status")
 async def status():
-    """Verificar status da API e conectividade com banco"""
+    """Status da API: prontidão (em cache), contagens do snapshot e stats dos componentes"""
     try:
-        # Testa conexão com banco
-        cidades = get_cidades_ativas()
-        plataformas = get_plataformas_ativas()
+        prontidao_api = await verificador_prontidao.verificar()
+        verificacoes = prontidao_api['verificacoes']
+        contagens = contagens_tabelas.snapshot()
         
         return {
             "status": "online",
             "timestamp": datetime.now().isoformat(),
-            "llm_configured": bool(os.getenv("OPENAI_API_KEY")),
-            "browser_available": True,
-            "database_connected": True,
-            "cidades_ativas": len(cidades),
-            "plataformas_ativas": len(plataformas)
+            "llm_configured": verificacoes['llm']['ok'],
+            "browser_available": verificacoes['navegadores']['ok'],
+            "database_connected": verificacoes['banco']['ok'],
+            "cidades_ativas": contagens.get('cidades_ativas'),
+            "plataformas_ativas": contagens.get('plataformas_ativas'),
+            "contagens": contagens,
+            "browser_pool": browser_pool.stats(),
+            "single_flight": buscas_em_andamento.stats(),
+            "estado_compartilhado": estado_compartilhado.stats() if estado_compartilhado else None,
+            "cache_links": cache_links.stats(),
+            "asset_cache": asset_cache.stats(),
+            "prontidao": estatisticas_prontidao.snapshot(),
+            "seletores_total": seletores_vencedores(),
+            "tiers_captura": estatisticas_tiers.snapshot(),
+            "admissao": admissao_capturas.stats()
         }
     except Exception as e:
         return {
@@ -417,23 +426,201 @@ async def status():
         }
 
 @app.get("/cidades-ativas")
-async def cidades_ativas():
-    """Lista todas as cidades ativas do banco"""
+async def cidades_ativas(fields: Optional[str] = None, accept_encoding: Optional[str] = Header(None)):
+    """
+    Lista todas as cidades ativas. ``fields`` (ex.: ``id,nome,estado_sigla``)
+    limita os campos de cada cidade; o corpo sai do cache, comprimido com br
+    ou gzip conforme o Accept-Encoding
+    """
+    campos = ler_campos(fields, CAMPOS_CIDADE)
     try:
-        cidades = get_cidades_ativas()
-        return {
-            "total": len(cidades),
-            "cidades": cidades
-        }
+        corpo = await corpo_cidades_ativas(campos)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar cidades: {str(e)}")
+    return resposta_json(corpo, accept_encoding)
+
+# Buscas idênticas simultâneas compartilham a mesma captura (entre workers, com API_WORKERS > 1)
+if estado_compartilhado is not None:
+    buscas_em_andamento = SingleFlightEntreWorkers(
+        'buscar-link-unico', estado_compartilhado,
+        serializar=lambda resultado: resultado.model_dump_json(),
+        desserializar=ResultadoBuscaUnica.model_validate_json
+    )
+else:
+    buscas_em_andamento = SingleFlight('buscar-link-unico')
+
+@metricas.coletor
+def coletar_metricas_captura():
+    """Tiers de captura, navegadores, filas e caches, lidos dos stats de cada módulo"""
+    pool = browser_pool.stats()
+    voos = buscas_em_andamento.stats()
+    tiers = estatisticas_tiers.snapshot()
+    cache = cache_links.stats()
+    return [
+        ('imoveis_capture_attempts_total', 'counter', 'Tentativas de captura por tier e resultado', [
+            ({'tier': tier, 'resultado': resultado}, valor)
+            for tier, stats in tiers.items()
+            for resultado, valor in (('sucesso', stats['sucessos']),
+                                     ('falha', stats['tentativas'] - stats['sucessos']))
+        ]),
+        ('imoveis_browsers', 'gauge', 'Navegadores do pool por estado', [
+            ({'estado': 'em_uso'}, pool['em_uso']),
+            ({'estado': 'livres'}, pool['livres']),
+            ({'estado': 'ativos'}, pool['navegadores_ativos']),
+        ]),
+        ('imoveis_browser_pool_waiting', 'gauge', 'Capturas esperando um navegador livre',
+         [({}, pool['aguardando'])]),
+        ('imoveis_browser_pool_lease_timeouts_total', 'counter', 'Leases que esgotaram o tempo de espera',
+         [({}, pool['timeouts_lease'])]),
+        ('imoveis_single_flight', 'gauge', 'Capturas em andamento e requisições aguardando por elas', [
+            ({'estado': 'em_andamento'}, voos['em_andamento']),
+            ({'estado': 'aguardando'}, voos['aguardando']),
+        ]),
+        ('imoveis_single_flight_coalesced_total', 'counter', 'Requisições atendidas por uma captura já em andamento',
+         [({}, voos['coalescidas'])]),
+        ('imoveis_link_cache_entries', 'gauge', 'Entradas no cache de links em memória',
+         [({}, cache.get('entradas'))]),
+    ] + admissao_capturas.metricas()
+
+async def chave_busca(busca: BuscaUnica) -> tuple:
+    """
+    Chave do single-flight e do cache de links. A cidade passa pelo índice de
+    municípios ('Embu' e 'Embu das Artes' dão a mesma chave); sem resolução,
+    cai no nome normalizado com a UF informada
+    """
+    try:
+        municipio = (await refdata.aget()).resolver_municipio(busca.cidade, busca.estado, busca.plataforma)
+    except Exception as e:
+        logger.warning(f"⚠️ Erro ao resolver município da chave de busca: {e}")
+        municipio = None
+    if municipio:
+        cidade, uf = municipio['municipio_id'], municipio['sigla'].upper()
+    else:
+        cidade, uf = normalizar_nome_municipio(busca.cidade), busca.estado.strip().upper()
+    return (
+        cidade,
+        uf,
+        busca.tipo_operacao.strip().lower(),
+        busca.plataforma.strip().casefold()
+    )
+
+async def carregar_link_salvo(busca: BuscaUnica) -> Optional[tuple]:
+    """Link único já salvo no banco para a combinação, como (resultado, atualizado_em)"""
+    ref = await refdata.aget()
+    plataforma_id = ref.plataforma_id(busca.plataforma)
+    tipo_busca_id = ref.tipo_busca_id(busca.tipo_operacao)
+    municipio = ref.municipio(busca.cidade, busca.estado)
+    if not plataforma_id or not tipo_busca_id or not municipio:
+        return None
+
+    link = await abuscar_link_unico(plataforma_id, tipo_busca_id, municipio['estado_id'], municipio['id'])
+    if not link or not link['atualizado_em']:
+        return None
+
+    resultado = ResultadoBuscaUnica(
+        cidade=busca.cidade,
+        estado=busca.estado,
+        tipo_operacao=busca.tipo_operacao,
+        plataforma=busca.plataforma,
+        link_unico=link['url'],
+        titulo_pagina=f"Imóveis para {busca.tipo_operacao} em {busca.cidade}, {busca.estado}",
+        total_imoveis="N/A",
+        data_busca=link['atualizado_em'].isoformat(),
+        status="sucesso",
+        observacoes=f"Link salvo no banco em {link['atualizado_em'].isoformat()}"
+    )
+    return resultado, link['atualizado_em']
+
+def aplicar_headers_cache(response: Response, resultado: ResultadoBuscaUnica,
+                          atualizado_em: datetime, origem: str, cacheavel: bool = True) -> Optional[str]:
+    """
+    ETag do corpo e Cache-Control pelo frescor restante. Erros e links padrão
+    (``cacheavel=False``) saem com no-store e sem ETag. Retorna o ETag.
+    """
+    response.headers["X-Cache"] = origem
+    if resultado.status != "sucesso" or not cacheavel:
+        response.headers["Cache-Control"] = "no-store"
+        return None
+    restante = max(0, int(cache_links.max_idade - cache_links.idade(atualizado_em)))
+    response.headers["Cache-Control"] = f"private, max-age={restante}"
+    etag = '"' + hashlib.sha1(resultado.model_dump_json().encode()).hexdigest()[:16] + '"'
+    response.headers["ETag"] = etag
+    return etag
+
+def etag_confere(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match (lista, '*' ou ETags fracos) casa com o ETag da resposta"""
+    if not if_none_match or not etag:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(',')]
+    return '*' in candidatos or etag in [c[2:] if c.startswith('W/') else c for c in candidatos]
+
+def nao_modificado(response: Response) -> Response:
+    """304 com os mesmos cabeçalhos de cache da resposta completa"""
+    return Response(status_code=304, headers={
+        k: v for k, v in response.headers.items() if k.lower() in ('etag', 'cache-control', 'x-cache')
+    })
+
+async def buscar_em_cache(busca: BuscaUnica, chave: tuple) -> Optional[tuple]:
+    """(resultado, atualizado_em, origem) se houver link fresco em memória ou no banco"""
+    try:
+        return await cache_links.aget(chave, lambda: carregar_link_salvo(busca))
+    except Exception as e:
+        logger.warning(f"⚠️ Erro ao consultar cache de links: {e}")
+        return None
+
+async def capturar_e_cachear(busca: BuscaUnica, chave: tuple) -> ResultadoBuscaUnica:
+    """
+    Captura, grava e põe em cache. Roda dentro do voo do single-flight, então
+    o resultado é gravado uma vez, qualquer que seja o chamador (requisição
+    única ou lote) e mesmo que ele desista
+    """
+    # Uma vaga por captura: requisições coalescidas no single-flight não ocupam vaga
+    async with admissao_capturas.admitir(chave[3]):
+        resultado = await executar_busca_link_unico(busca)
+    # Link padrão após falha de captura não fica em cache: a próxima requisição tenta de novo
+    if captura_real(resultado):
+        cache_links.put(chave, resultado, datetime.now())
+    return resultado
 
 @app.post("/buscar-link-unico", response_model=ResultadoBuscaUnica)
-async def buscar_link_unico(busca: BuscaUnica):
+async def buscar_link_unico(busca: BuscaUnica, response: Response,
+                            if_none_match: Optional[str] = Header(None)):
     """
     Busca APENAS O LINK ÚNICO da página principal de imóveis
-    para uma cidade específica, não todas as variações
+    para uma cidade específica, não todas as variações.
+
+    Se a combinação tem link fresco (mais novo que LINK_CACHE_MAX_AGE), ele
+    é devolvido do cache em memória ou do banco sem abrir navegador, a menos
+    que ``force_refresh`` seja enviado. Requisições simultâneas para a mesma
+    (cidade, estado, tipo_operacao, plataforma) aguardam uma única captura.
+
+    Capturas novas passam pelo controle de admissão (ADMISSAO_*): sem vaga
+    dentro do prazo de espera, a resposta é 429 com Retry-After.
+
+    Respostas cacheáveis levam ETag; com If-None-Match igual, a resposta é 304.
     """
+    chave = await chave_busca(busca)
+    if not busca.force_refresh:
+        em_cache = await buscar_em_cache(busca, chave)
+        if em_cache:
+            resultado, atualizado_em, origem = em_cache
+            logger.info(f"⚡ Link em cache ({origem}): {resultado.link_unico}")
+            etag = aplicar_headers_cache(response, resultado, atualizado_em, f"HIT-{origem}")
+            if etag_confere(if_none_match, etag):
+                return nao_modificado(response)
+            return resultado
+
+    try:
+        resultado = await buscas_em_andamento.executar(chave, lambda: capturar_e_cachear(busca, chave))
+    except AdmissaoRecusadaError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    etag = aplicar_headers_cache(response, resultado, datetime.now(), "MISS", cacheavel=captura_real(resultado))
+    if etag_confere(if_none_match, etag):
+        return nao_modificado(response)
+    return resultado
+
+async def executar_busca_link_unico(busca: BuscaUnica) -> ResultadoBuscaUnica:
+    """Captura o link único de uma busca (sem coalescência) e o salva no banco"""
     browser_context = None
     playwright = None
     use_agent = True  # Flag para decidir se usa Agent ou captura direta
@@ -442,18 +629,16 @@ async def buscar_link_unico(busca: BuscaUnica):
         logger.info(f"🔍 Buscando link único: {busca.tipo_operacao} em {busca.cidade}, {busca.estado}")
         
         # Construir URL esperada
-        cidade_formatada = busca.cidade.lower().replace(" ", "-")
-        estado_formatado = busca.estado.lower()
-        url_esperada = f"https://www.vivareal.com.br/{busca.tipo_operacao}/{estado_formatado}/{cidade_formatada}/"
+        url_esperada = await montar_url_vivareal(busca.cidade, busca.estado, busca.tipo_operacao)
         
         logger.info(f"📍 URL esperada: {url_esperada}")
         
         json_data = None
         
-        # Tentar primeiro com captura direta (mais rápido e confiável)
+        # Tentar primeiro HTTP puro e depois o navegador do pool (mais rápido e confiável)
         if not use_agent or True:  # Forçar uso da captura direta por enquanto
-            logger.info("🎯 Usando captura direta com Playwright...")
-            dados_capturados = await capturar_link_direto(
+            logger.info("🎯 Usando captura direta (HTTP, depois Playwright)...")
+            dados_capturados = await capturar_em_camadas(
                 busca.cidade, 
                 busca.estado, 
                 busca.tipo_operacao
@@ -461,7 +646,7 @@ async def buscar_link_unico(busca: BuscaUnica):
             
             if dados_capturados:
                 json_data = dados_capturados
-                logger.info(f"✅ Captura direta bem-sucedida: {json_data}")
+                logger.info(f"✅ Captura direta bem-sucedida ({json_data['tier']}): {json_data}")
         
         # Se a captura direta falhar, tentar com o Agent
         if not json_data and use_agent:
@@ -554,6 +739,10 @@ async def buscar_link_unico(busca: BuscaUnica):
                 
             except Exception as e:
                 logger.error(f"❌ Erro ao usar Agent: {e}")
+            
+            estatisticas_tiers.registrar('agent', bool(json_data))
+            if isinstance(json_data, dict):
+                json_data['tier'] = 'agent'
         
         # Se conseguimos extrair dados JSON
         if json_data:
@@ -563,12 +752,13 @@ async def buscar_link_unico(busca: BuscaUnica):
                 titulo = json_data.get('titulo', '')
                 total_imoveis = json_data.get('total_imoveis')
                 
+                tier = json_data.get('tier')
+                
                 # Validar e limpar o link
                 if not link_capturado or 'vivareal.com.br' not in link_capturado:
-                    # Se não capturou corretamente, usar o link esperado
-                    cidade_formatada = busca.cidade.lower().replace(" ", "-")
-                    estado_formatado = busca.estado.lower()
-                    link_capturado = f"https://www.vivareal.com.br/{busca.tipo_operacao}/{estado_formatado}/{cidade_formatada}/"
+                    # Se não capturou corretamente, usar o link esperado (não é uma captura real)
+                    link_capturado = url_esperada
+                    tier = None
                     logger.warning(f"⚠️ Link não capturado corretamente, usando padrão: {link_capturado}")
                 
                 # Limpar o link (remover parâmetros desnecessários)
@@ -592,14 +782,17 @@ async def buscar_link_unico(busca: BuscaUnica):
                     total_imoveis=str(total_imoveis) if total_imoveis else "N/A",
                     data_busca=datetime.now().isoformat(),
                     status="sucesso",
-                    observacoes="Link capturado com sucesso pelo agente"
+                    observacoes=(f"Link capturado com sucesso (tier {tier})" if tier
+                                 else f"Link padrão (tier {json_data.get('tier')} não capturou o link)"),
+                    tier=tier
                 )
                 
-                # Salvar no banco MariaDB
-                if salvar_link_unico(resultado_obj):
-                    logger.info(f"✅ Link único salvo no banco: {resultado_obj.link_unico}")
-                else:
-                    logger.warning("⚠️ Erro ao salvar no banco, mas retornando resultado")
+                # Salvar no banco MariaDB (só capturas reais)
+                if captura_real(resultado_obj):
+                    if await salvar_link_unico(resultado_obj):
+                        logger.info(f"✅ Link único salvo no banco: {resultado_obj.link_unico}")
+                    else:
+                        logger.warning("⚠️ Erro ao salvar no banco, mas retornando resultado")
                 
                 return resultado_obj
                 
@@ -608,9 +801,7 @@ async def buscar_link_unico(busca: BuscaUnica):
         
         # Se não conseguimos extrair nada, criar resultado padrão
         logger.warning("⚠️ Não foi possível extrair dados do agente, usando link padrão")
-        cidade_formatada = busca.cidade.lower().replace(" ", "-")
-        estado_formatado = busca.estado.lower()
-        link_padrao = f"https://www.vivareal.com.br/{busca.tipo_operacao}/{estado_formatado}/{cidade_formatada}/"
+        link_padrao = url_esperada
         
         resultado_padrao = ResultadoBuscaUnica(
             cidade=busca.cidade,
@@ -625,9 +816,7 @@ async def buscar_link_unico(busca: BuscaUnica):
             observacoes="Link padrão gerado (agente não retornou dados)"
         )
         
-        # Tentar salvar no banco
-        salvar_link_unico(resultado_padrao)
-        
+        # Link padrão não é salvo nem cacheado: a próxima busca tenta capturar de novo
         return resultado_padrao
             
     except Exception as e:
@@ -637,9 +826,7 @@ async def buscar_link_unico(busca: BuscaUnica):
         
         # Em caso de erro, ainda tentar retornar um link padrão
         try:
-            cidade_formatada = busca.cidade.lower().replace(" ", "-")
-            estado_formatado = busca.estado.lower()
-            link_padrao = f"https://www.vivareal.com.br/{busca.tipo_operacao}/{estado_formatado}/{cidade_formatada}/"
+            link_padrao = await montar_url_vivareal(busca.cidade, busca.estado, busca.tipo_operacao)
             
             resultado_erro = ResultadoBuscaUnica(
                 cidade=busca.cidade,
@@ -654,9 +841,6 @@ async def buscar_link_unico(busca: BuscaUnica):
                 observacoes=f"Erro no agente: {str(e)[:200]}. Link padrão retornado."
             )
             
-            # Tentar salvar mesmo com erro
-            salvar_link_unico(resultado_erro)
-            
             return resultado_erro
         except:
             raise HTTPException(status_code=500, detail=f"Erro na busca: {str(e)}")
@@ -676,30 +860,276 @@ async def buscar_link_unico(busca: BuscaUnica):
             except:
                 pass
 
+class BuscaLote(BaseModel):
+    """Lote de buscas únicas para /buscar-links-lote"""
+    itens: List[BuscaUnica]
+    concorrencia: Optional[int] = None  # padrão: tamanho do pool de navegadores
+
+LOTE_MAX_ITENS = int(os.getenv('LOTE_MAX_ITENS', '500'))
+LOTE_MAX_CONCORRENCIA = int(os.getenv('LOTE_MAX_CONCORRENCIA', '8'))
+
+class RitmoPorDominio:
+    """
+    Espaça em pelo menos ``intervalo`` segundos o início das capturas de um
+    mesmo domínio. Com ``estado`` a reserva vale para todos os workers.
+    """
+
+    def __init__(self, intervalo: float, estado=None):
+        self.intervalo = intervalo
+        self.estado = estado
+        self._proximo: Dict[str, float] = {}
+
+    async def aguardar(self, dominio: str):
+        if self.estado is not None:
+            espera = await self.estado.areservar_ritmo(dominio, self.intervalo)
+            if espera > 0:
+                await asyncio.sleep(espera)
+            return
+        agora = time.monotonic()
+        inicio = max(agora, self._proximo.get(dominio, 0.0))
+        # Reserva o horário antes de dormir, para que capturas concorrentes entrem na fila
+        self._proximo[dominio] = inicio + self.intervalo
+        if inicio > agora:
+            await asyncio.sleep(inicio - agora)
+
+# Compartilhado entre lotes simultâneos
+ritmo_dominios = RitmoPorDominio(float(os.getenv('LOTE_INTERVALO_DOMINIO', '2')), estado_compartilhado)
+
+def dominio_plataforma(ref, nome_plataforma: str) -> str:
+    plataforma = ref.plataforma(nome_plataforma, somente_ativas=False)
+    if plataforma and plataforma.get('url_base'):
+        return urllib.parse.urlparse(plataforma['url_base']).netloc or plataforma['url_base']
+    return nome_plataforma.strip().casefold()
+
+async def buscar_item_lote(busca: BuscaUnica, dominio: str, semaforo: asyncio.Semaphore) -> ResultadoBuscaUnica:
+    """Resultado de um item do lote: do cache, ou de uma captura (gravada dentro do voo)"""
+    chave = await chave_busca(busca)
+    if not busca.force_refresh:
+        em_cache = await buscar_em_cache(busca, chave)
+        if em_cache:
+            return em_cache[0]
+    # O ritmo vem antes da vaga: itens esperando o intervalo de um domínio
+    # não seguram vagas dos itens de outros domínios
+    await ritmo_dominios.aguardar(dominio)
+    async with semaforo:
+        return await buscas_em_andamento.executar(chave, lambda: capturar_e_cachear(busca, chave))
+
+async def executar_lote(lote: BuscaLote, concorrencia: int):
+    """Roda os itens com no máximo ``concorrencia`` capturas simultâneas e emite NDJSON na ordem de término"""
+    semaforo = asyncio.Semaphore(concorrencia)
+    ref = await refdata.aget()
+
+    async def processar(busca: BuscaUnica) -> ResultadoBuscaUnica:
+        try:
+            return await buscar_item_lote(busca, dominio_plataforma(ref, busca.plataforma), semaforo)
+        except Exception as e:
+            logger.error(f"❌ Erro no item do lote {busca.cidade}/{busca.estado}: {e}")
+            return ResultadoBuscaUnica(
+                cidade=busca.cidade,
+                estado=busca.estado,
+                tipo_operacao=busca.tipo_operacao,
+                plataforma=busca.plataforma,
+                link_unico="",
+                titulo_pagina="",
+                total_imoveis="N/A",
+                data_busca=datetime.now().isoformat(),
+                status="erro",
+                observacoes=f"Erro no lote: {str(e)[:200]}"
+            )
+
+    tarefas = [asyncio.create_task(processar(busca)) for busca in lote.itens]
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            resultado = await proxima
+            yield resultado.model_dump_json() + "\n"
+    finally:
+        # Cliente desconectou ou o lote terminou: cancela o que falta. Capturas
+        # já em voo para outra requisição continuam e são gravadas por ela
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+@app.post("/buscar-links-lote")
+async def buscar_links_lote(lote: BuscaLote):
+    """
+    Busca o link único de vários itens (cidade, estado, tipo_operacao, plataforma).
+
+    Os itens rodam em paralelo (até ``concorrencia`` capturas, limitado por
+    LOTE_MAX_CONCORRENCIA), com intervalo mínimo entre capturas do mesmo
+    domínio. Cada ResultadoBuscaUnica é enviado como uma linha NDJSON assim
+    que termina; cada captura é gravada assim que termina.
+    """
+    if not lote.itens:
+        raise HTTPException(status_code=400, detail="Lote vazio")
+    if len(lote.itens) > LOTE_MAX_ITENS:
+        raise HTTPException(status_code=400, detail=f"Lote com mais de {LOTE_MAX_ITENS} itens")
+
+    concorrencia = max(1, min(lote.concorrencia or browser_pool.tamanho, LOTE_MAX_CONCORRENCIA))
+    logger.info(f"📦 Lote com {len(lote.itens)} itens (concorrência {concorrencia})")
+    return StreamingResponse(executar_lote(lote, concorrencia), media_type="application/x-ndjson")
+
+LIMITE_PADRAO_LINKS = 100
+LIMITE_MAXIMO_LINKS = 1000
+
+CAMPOS_LINK = ('id', 'url', 'created_at', 'updated_at', 'termo_busca',
+               'plataforma', 'tipo_busca', 'estado', 'cidade')
+
+QUERY_LINKS_SALVOS = """
+    SELECT l.id, l.url, l.created_at, l.updated_at, l.termo_busca,
+           p.nome as plataforma, t.nome as tipo_busca,
+           e.sigla as estado, m.nome as cidade
+    FROM links_duckduckgo l
+    JOIN plataformas p ON l.plataforma_id = p.id
+    JOIN tipos_busca t ON l.tipo_busca_id = t.id
+    JOIN estados e ON l.estado_id = e.id
+    JOIN municipios m ON l.municipio_id = m.id
+    {where}
+    ORDER BY l.created_at DESC, l.id DESC
+    {limite}
+"""
+
+def codificar_cursor(link: dict) -> str:
+    """Cursor opaco com a posição (created_at, id) do último link da página"""
+    bruto = f"{link['created_at'].isoformat()}|{link['id']}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+def decodificar_cursor(cursor: str) -> tuple:
+    try:
+        created_at, link_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(link_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+async def montar_query_links_salvos(cursor: Optional[str], estado: Optional[str],
+                                    plataforma: Optional[str], tipo: Optional[str],
+                                    since: Optional[datetime], limite: Optional[int]) -> tuple:
+    """
+    Monta a query de /links-salvos. Os filtros são resolvidos para IDs pelo
+    cache de referência, para que o banco use os índices (coluna, created_at, id)
+    """
+    ref = await refdata.aget()
+    condicoes = []
+    params = []
+
+    if estado:
+        dados_estado = ref.estado(estado)
+        if not dados_estado:
+            raise HTTPException(status_code=400, detail=f"Estado '{estado}' não encontrado")
+        condicoes.append("l.estado_id = %s")
+        params.append(dados_estado['id'])
+    if plataforma:
+        dados_plataforma = ref.plataforma(plataforma, somente_ativas=False)
+        if not dados_plataforma:
+            raise HTTPException(status_code=400, detail=f"Plataforma '{plataforma}' não encontrada")
+        condicoes.append("l.plataforma_id = %s")
+        params.append(dados_plataforma['id'])
+    if tipo:
+        tipo_busca_id = ref.tipo_busca_id(tipo)
+        if not tipo_busca_id:
+            raise HTTPException(status_code=400, detail=f"Tipo de busca '{tipo}' não encontrado")
+        condicoes.append("l.tipo_busca_id = %s")
+        params.append(tipo_busca_id)
+    if since:
+        condicoes.append("l.created_at >= %s")
+        params.append(since)
+    if cursor:
+        # Keyset: tudo que vem depois do último (created_at, id) na ordem DESC
+        created_at, link_id = decodificar_cursor(cursor)
+        condicoes.append("(l.created_at < %s OR (l.created_at = %s AND l.id < %s))")
+        params.extend([created_at, created_at, link_id])
+
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    sql_limite = ""
+    if limite:
+        sql_limite = "LIMIT %s"
+        params.append(limite)
+    return QUERY_LINKS_SALVOS.format(where=where, limite=sql_limite), tuple(params)
+
+async def stream_links_ndjson(query: str, params: tuple, campos: Optional[List[str]] = None,
+                             limite: Optional[int] = None):
+    """
+    Uma linha JSON por link, lida do cursor no servidor conforme o cliente consome.
+
+    Com ``limite``, a query traz um link a mais; se ele existir, a última linha
+    é ``{"proximo_cursor": ...}`` para continuar a exportação. Um erro no meio
+    do stream é propagado: a conexão é abortada em vez de terminar como se a
+    exportação estivesse completa.
+    """
+    enviados = 0
+    ultimo = None
+    try:
+        async for link in db.astream(query, params):
+            if limite and enviados == limite:
+                # O link extra (LIMIT limite + 1) é o último da query: o loop termina aqui
+                yield serializar({"proximo_cursor": codificar_cursor(ultimo)}) + b"\n"
+                continue
+            ultimo = link
+            enviados += 1
+            yield serializar(projetar([link], campos)[0]) + b"\n"
+    except Exception as e:
+        logger.error(f"Erro no streaming de links salvos após {enviados} links: {e}")
+        raise
+
 @app.get("/links-salvos")
-async def links_salvos():
-    """Lista todos os links únicos salvos no banco"""
+async def links_salvos(
+    cursor: Optional[str] = None,
+    limite: Optional[int] = Query(None, ge=1),
+    estado: Optional[str] = None,
+    plataforma: Optional[str] = None,
+    tipo: Optional[str] = None,
+    since: Optional[datetime] = None,
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+    fields: Optional[str] = None,
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    Lista os links salvos, do mais recente para o mais antigo.
+
+    - formato=json: uma página de até ``limite`` links (padrão 100, máximo 1000)
+      e ``proximo_cursor`` para pedir a próxima página
+    - formato=ndjson: todos os links que casam com os filtros (ou até ``limite``),
+      um por linha, via cursor no servidor; com ``limite`` e mais links, a
+      última linha é ``{"proximo_cursor": ...}``
+
+    ``fields`` (ex.: ``id,url,cidade``) limita os campos de cada link. A
+    página JSON é comprimida com br ou gzip conforme o Accept-Encoding.
+    """
+    campos = ler_campos(fields, CAMPOS_LINK)
     try:
-        query = """
-            SELECT l.url, l.created_at, l.updated_at, l.termo_busca,
-                   p.nome as plataforma, t.nome as tipo_busca, 
-                   e.sigla as estado, m.nome as cidade
-            FROM links_duckduckgo l
-            JOIN plataformas p ON l.plataforma_id = p.id
-            JOIN tipos_busca t ON l.tipo_busca_id = t.id
-            JOIN estados e ON l.estado_id = e.id
-            JOIN municipios m ON l.municipio_id = m.id
-            ORDER BY l.created_at DESC
-        """
-        links = db.execute_query(query)
-        
-        return {
+        if formato == "ndjson":
+            query, params = await montar_query_links_salvos(
+                cursor, estado, plataforma, tipo, since, limite + 1 if limite else None
+            )
+            return StreamingResponse(stream_links_ndjson(query, params, campos, limite),
+                                     media_type="application/x-ndjson")
+
+        limite = min(limite or LIMITE_PADRAO_LINKS, LIMITE_MAXIMO_LINKS)
+        # Um link a mais para saber se existe próxima página
+        query, params = await montar_query_links_salvos(cursor, estado, plataforma, tipo, since, limite + 1)
+        links = await db.afetch(query, params)
+
+        proximo_cursor = None
+        if len(links) > limite:
+            links = links[:limite]
+            proximo_cursor = codificar_cursor(links[-1])
+
+        return resposta_json({
             "total": len(links),
-            "links": links
-        }
+            "limite": limite,
+            "proximo_cursor": proximo_cursor,
+            "links": projetar(links, campos)
+        }, accept_encoding)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar links: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8002)  # Porta 8002 para não conflitar
+    workers = int(os.getenv('API_WORKERS', '1'))
+    if workers > 1:
+        # Os workers são processos novos que importam o módulo; herdam o ambiente
+        os.environ.setdefault('ESTADO_COMPARTILHADO_PATH', 'estado_compartilhado.db')
+        logger.info(f"🚀 Subindo {workers} workers")
+        uvicorn.run("api_imoveis_mariadb:app", host="127.0.0.1", port=8002, workers=workers)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=8002)  # Porta 8002 para não conflitar
@@ -3,9 +3,11 @@
 API de busca de imóveis usando WebUI (browser_use) para busca real na internet
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
 import asyncio
 import json
 from datetime import datetime
@@ -13,7 +15,13 @@ from browser_use import Agent
 from src.utils.llm_provider import get_llm_model
 import os
 from dotenv import load_dotenv
-from database import db, get_plataformas_ativas
+from database import db, refdata, aupsert_links_unicos
+from migracoes import verificar_schema
+from jobs import JobManager, JobQueueFullError
+from estado_compartilhado import estado_compartilhado
+from metricas import metricas, instalar_metricas
+from admissao import admissao_capturas, AdmissaoRecusadaError
+from saude import VerificadorProntidao, verificar_banco, verificar_llm
 import logging
 from urllib.parse import quote, unquote
 
@@ -24,7 +32,29 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="API de Imóveis WebUI - Busca Real", version="3.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Schema, fila de jobs e pool assíncrono do banco"""
+    try:
+        await asyncio.to_thread(verificar_schema)
+    except Exception as e:
+        logger.error(f"Não foi possível verificar o schema: {e}")
+    # Aquecimento do worker: cada processo carrega o seu cache e o seu cliente LLM
+    try:
+        await refdata.aget()
+        get_llm()
+    except Exception as e:
+        logger.warning(f"⚠️ Aquecimento incompleto: {e}")
+    try:
+        await jobs.start()
+    except Exception as e:
+        logger.error(f"Não foi possível iniciar a fila de jobs: {e}")
+    yield
+    await jobs.close()
+    await db.aclose()
+
+app = FastAPI(title="API de Imóveis WebUI - Busca Real", version="3.0.0", lifespan=lifespan)
+instalar_metricas(app)
 
 class BuscaUnica(BaseModel):
     """Modelo para busca única de imóveis"""
@@ -46,46 +76,30 @@ class ResultadoBuscaUnica(BaseModel):
     status: str
     observacoes: Optional[str] = None
 
+_llm = None
+
 def get_llm():
-    """Configura e retorna o modelo LLM"""
-    try:
-        return get_llm_model(
-            provider="openai",
-            model="gpt-4o",
-            temperature=0.1,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao configurar LLM: {str(e)}")
+    """Modelo LLM do processo, configurado na primeira chamada e reaproveitado"""
+    global _llm
+    if _llm is None:
+        try:
+            _llm = get_llm_model(
+                provider="openai",
+                model="gpt-4o",
+                temperature=0.1,
+                api_key=os.getenv("OPENAI_API_KEY")
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao configurar LLM: {str(e)}")
+    return _llm
 
-def get_plataforma_id(nome_plataforma: str):
-    """Busca ID da plataforma no banco"""
+async def get_plataforma_id(nome_plataforma: str):
+    """Busca ID da plataforma (nome exato, alias como VIVA-REAL ou parcial)"""
     try:
-        # Tentar buscar pelo nome exato primeiro
-        result = db.execute_query(
-            "SELECT id FROM plataformas WHERE nome = %s AND ativo = 1",
-            (nome_plataforma,)
-        )
-        
-        # Se não encontrar, tentar variações
-        if not result:
-            # Tentar com hífen
-            nome_alternativo = nome_plataforma.replace("VivaReal", "VIVA-REAL")
-            result = db.execute_query(
-                "SELECT id FROM plataformas WHERE nome = %s AND ativo = 1",
-                (nome_alternativo,)
-            )
-        
-        # Se ainda não encontrar, tentar com LIKE
-        if not result:
-            result = db.execute_query(
-                "SELECT id FROM plataformas WHERE nome LIKE %s AND ativo = 1",
-                (f"%{nome_plataforma.replace('-', '')}%",)
-            )
-        
-        if result:
-            logger.info(f"✅ Plataforma encontrada: ID={result[0]['id']}")
-            return result[0]['id']
+        plataforma_id = (await refdata.aget()).plataforma_id(nome_plataforma)
+        if plataforma_id:
+            logger.info(f"✅ Plataforma encontrada: ID={plataforma_id}")
+            return plataforma_id
         else:
             logger.error(f"❌ Plataforma '{nome_plataforma}' não encontrada no banco")
             return None
@@ -93,80 +107,41 @@ def get_plataforma_id(nome_plataforma: str):
         logger.error(f"Erro ao buscar plataforma {nome_plataforma}: {e}")
         return None
 
-def get_tipo_busca_id(nome_tipo: str):
-    """Busca ID do tipo de busca no banco"""
+async def get_tipo_busca_id(nome_tipo: str):
+    """Busca ID do tipo de busca no cache de dados de referência"""
     try:
-        result = db.execute_query(
-            "SELECT id FROM tipos_busca WHERE nome = %s",
-            (nome_tipo.upper(),)
-        )
-        return result[0]['id'] if result else None
+        return (await refdata.aget()).tipo_busca_id(nome_tipo)
     except Exception as e:
         logger.error(f"Erro ao buscar tipo de busca {nome_tipo}: {e}")
         return None
 
-def salvar_link_unico(resultado: ResultadoBuscaUnica):
-    """Salva o link único no banco MariaDB"""
+async def salvar_link_unico(resultado: ResultadoBuscaUnica):
+    """Salva o link único no banco MariaDB (upsert pela combinação)"""
     try:
         # Busca IDs necessários
-        plataforma_id = get_plataforma_id(resultado.plataforma)
-        tipo_busca_id = get_tipo_busca_id(resultado.tipo_operacao)
+        plataforma_id = await get_plataforma_id(resultado.plataforma)
+        tipo_busca_id = await get_tipo_busca_id(resultado.tipo_operacao)
         
         if not plataforma_id or not tipo_busca_id:
             logger.error(f"Plataforma ou tipo de busca não encontrado")
             return False
         
         # Busca cidade e estado
-        cidade_result = db.execute_query(
-            "SELECT m.id as municipio_id, e.id as estado_id FROM municipios m JOIN estados e ON m.estado_id = e.id WHERE m.nome = %s AND e.sigla = %s",
-            (resultado.cidade, resultado.estado)
-        )
+        municipio = (await refdata.aget()).municipio(resultado.cidade, resultado.estado)
         
-        if not cidade_result:
+        if not municipio:
             logger.error(f"Cidade {resultado.cidade}/{resultado.estado} não encontrada")
             return False
         
-        municipio_id = cidade_result[0]['municipio_id']
-        estado_id = cidade_result[0]['estado_id']
-        
-        # Verifica se já existe um link para esta combinação
-        existe = db.execute_query(
-            "SELECT id FROM links_duckduckgo WHERE plataforma_id = %s AND tipo_busca_id = %s AND estado_id = %s AND municipio_id = %s",
-            (plataforma_id, tipo_busca_id, estado_id, municipio_id)
-        )
-        
-        if existe:
-            # Atualiza o link existente
-            update_query = """
-                UPDATE links_duckduckgo 
-                SET url = %s, updated_at = NOW()
-                WHERE plataforma_id = %s AND tipo_busca_id = %s AND estado_id = %s AND municipio_id = %s
-            """
-            db.execute_update(update_query, (
-                resultado.link_unico,
-                plataforma_id, tipo_busca_id, estado_id, municipio_id
-            ))
-            logger.info(f"Link atualizado para {resultado.cidade}/{resultado.estado}")
-        else:
-            # Insere novo link
-            insert_query = """
-                INSERT INTO links_duckduckgo 
-                (url, plataforma_id, tipo_busca_id, estado_id, municipio_id, 
-                 distrito_id, termo_busca, posicao_busca, processado, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """
-            db.execute_update(insert_query, (
-                resultado.link_unico,
-                plataforma_id,
-                tipo_busca_id,
-                estado_id,
-                municipio_id,
-                None,  # distrito_id
-                f"{resultado.tipo_operacao} {resultado.cidade} {resultado.estado}",  # termo_busca
-                1,  # posicao_busca (sempre 1 para link único)
-                0  # processado
-            ))
-            logger.info(f"Novo link inserido para {resultado.cidade}/{resultado.estado}")
+        await aupsert_links_unicos([{
+            'url': resultado.link_unico,
+            'plataforma_id': plataforma_id,
+            'tipo_busca_id': tipo_busca_id,
+            'estado_id': municipio['estado_id'],
+            'municipio_id': municipio['id'],
+            'termo_busca': f"{resultado.tipo_operacao} {resultado.cidade} {resultado.estado}"
+        }])
+        logger.info(f"Link salvo para {resultado.cidade}/{resultado.estado}")
         
         return True
         
@@ -181,21 +156,60 @@ async def root():
         "version": "3.0.0",
         "endpoints": {
             "status": "/status",
+            "healthz": "/healthz",
+            "readyz": "/readyz",
+            "metrics": "/metrics",
             "buscar-unico": "/buscar-link-unico",
+            "jobs": "/jobs",
             "docs": "/docs"
         }
     }
 
+# Probes: /readyz reaproveita o resultado por READYZ_CACHE_TTL segundos
+verificador_prontidao = VerificadorProntidao(
+    ttl=float(os.getenv('READYZ_CACHE_TTL', '5')),
+    timeout=float(os.getenv('READYZ_TIMEOUT', '2'))
+)
+
+@verificador_prontidao.verificacao('banco')
+async def banco_pronto():
+    return await verificar_banco(db)
+
+@verificador_prontidao.verificacao('jobs')
+async def jobs_prontos():
+    stats = jobs.stats()
+    return {'ok': stats['workers_ativos'] > 0, 'workers_ativos': stats['workers_ativos'],
+            'pendentes': stats['pendentes']}
+
+verificador_prontidao.verificacao('llm')(verificar_llm)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: o processo está respondendo (sem I/O)"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """Readiness: banco (ping no pool), workers de jobs e chave do LLM; 503 se algo falhar"""
+    resultado = await verificador_prontidao.verificar()
+    if not resultado['pronto']:
+        response.status_code = 503
+    return resultado
+
 @app.get("/status")
 async def status():
-    """Verificar status da API"""
+    """Verificar status da API (prontidão vem do cache do /readyz)"""
     try:
+        verificacoes = (await verificador_prontidao.verificar())['verificacoes']
         return {
             "status": "online",
             "timestamp": datetime.now().isoformat(),
-            "llm_configured": bool(os.getenv("OPENAI_API_KEY")),
+            "llm_configured": verificacoes['llm']['ok'],
             "browser_available": True,
-            "database_connected": True
+            "database_connected": verificacoes['banco']['ok'],
+            "jobs": jobs.stats(),
+            "estado_compartilhado": estado_compartilhado.stats() if estado_compartilhado else None,
+            "admissao": admissao_capturas.stats()
         }
     except Exception as e:
         return {
@@ -204,11 +218,42 @@ async def status():
             "error": str(e)
         }
 
+def resumir_passo(state, output, step_num: int) -> Dict[str, Any]:
+    """Dados de um passo do Agent para o evento de progresso do job"""
+    brain = getattr(output, 'current_state', None)
+    acoes = []
+    for action in getattr(output, 'action', None) or []:
+        try:
+            acoes.extend(action.model_dump(exclude_unset=True).keys())
+        except Exception:
+            continue
+    return {
+        'passo': step_num,
+        'url': getattr(state, 'url', None),
+        'avaliacao': getattr(brain, 'evaluation_previous_goal', None),
+        'objetivo': getattr(brain, 'next_goal', None),
+        'acoes': acoes
+    }
+
 @app.post("/buscar-link-unico", response_model=ResultadoBuscaUnica)
 async def buscar_link_unico(busca: BuscaUnica):
     """
     Busca o link oficial do VivaReal através de pesquisa real na internet
-    usando o browser_use Agent para navegar e encontrar a página correta
+    usando o browser_use Agent para navegar e encontrar a página correta.
+
+    Responde 429 com Retry-After quando já há capturas demais em andamento
+    e a fila de espera está cheia ou o tempo de espera se esgotou.
+    """
+    try:
+        async with admissao_capturas.admitir(busca.plataforma):
+            return await executar_busca(busca)
+    except AdmissaoRecusadaError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def executar_busca(busca: BuscaUnica, ao_passo=None) -> ResultadoBuscaUnica:
+    """
+    Roda o Agent para uma busca e salva o link encontrado. ``ao_passo(dados)``,
+    se informado, é chamado a cada passo do Agent (usado pelos jobs)
     """
     try:
         logger.info(f"🔍 Iniciando busca real para: {busca.tipo_operacao} em {busca.cidade}, {busca.estado}")
@@ -273,10 +318,18 @@ async def buscar_link_unico(busca: BuscaUnica):
         
         logger.info("🤖 Iniciando Agent com browser_use...")
         
+        async def step_callback(state, output, step_num: int):
+            if ao_passo:
+                try:
+                    await ao_passo(resumir_passo(state, output, step_num))
+                except Exception as e:
+                    logger.warning(f"⚠️ Erro ao registrar passo {step_num}: {e}")
+        
         # Executar a tarefa com o Agent
         agent = Agent(
             task=task,
-            llm=llm
+            llm=llm,
+            register_new_step_callback=step_callback
         )
         
         # Executar com mais passos para permitir navegação completa
@@ -310,7 +363,7 @@ async def buscar_link_unico(busca: BuscaUnica):
                             resultado = ResultadoBuscaUnica(**dados)
                             
                             # Salvar no banco
-                            if salvar_link_unico(resultado):
+                            if await salvar_link_unico(resultado):
                                 logger.info(f"✅ Link salvo no banco de dados")
                             
                             return resultado
@@ -338,6 +391,82 @@ async def buscar_link_unico(busca: BuscaUnica):
         logger.error(f"❌ Erro na busca: {e}")
         raise HTTPException(status_code=500, detail=f"Erro na busca: {str(e)}")
 
+async def executar_job_busca(parametros: Dict[str, Any], emitir) -> Dict[str, Any]:
+    """Executor dos jobs 'buscar-link-unico': cada passo do Agent vira um evento 'passo'"""
+    busca = BuscaUnica(**parametros)
+    # Os workers já são limitados por JOBS_WORKERS: esperam a vaga sem prazo
+    async with admissao_capturas.admitir(busca.plataforma, espera=None):
+        resultado = await executar_busca(busca, ao_passo=lambda dados: emitir('passo', dados))
+    return resultado.model_dump()
+
+jobs = JobManager(
+    db, 'buscar-link-unico', executar_job_busca,
+    workers=int(os.getenv('JOBS_WORKERS', '2')),
+    max_pendentes=int(os.getenv('JOBS_MAX_PENDENTES', '100')),
+    max_tentativas=int(os.getenv('JOBS_MAX_TENTATIVAS', '3')),
+    estado=estado_compartilhado
+)
+
+@metricas.coletor
+def coletar_metricas_jobs():
+    stats = jobs.stats()
+    return [
+        ('imoveis_jobs_queue_depth', 'gauge', 'Jobs pendentes na fila', [({}, stats['pendentes'])]),
+        ('imoveis_jobs_running', 'gauge', 'Jobs executando (cada um com um navegador do Agent)',
+         [({}, stats['em_execucao'])]),
+        ('imoveis_jobs_total', 'counter', 'Jobs por resultado', [
+            ({'resultado': 'criados'}, stats['criados']),
+            ({'resultado': 'concluidos'}, stats['concluidos']),
+            ({'resultado': 'erros'}, stats['erros']),
+        ]),
+    ] + admissao_capturas.metricas()
+
+@app.post("/jobs", status_code=202)
+async def criar_job(busca: BuscaUnica):
+    """
+    Enfileira uma busca e retorna o job na hora. Acompanhe por
+    GET /jobs/{id} ou pelos eventos em GET /jobs/{id}/events (SSE)
+    """
+    try:
+        job = await jobs.criar(busca.model_dump())
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao criar job: {str(e)}")
+    logger.info(f"📥 Job {job['id']} criado: {busca.tipo_operacao} em {busca.cidade}, {busca.estado}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def obter_job(job_id: str):
+    """Status, parâmetros e, quando terminar, resultado ou erro do job"""
+    job = await jobs.obter(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def eventos_job(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events com o progresso do job (status e passos do Agent).
+    Reconexões com Last-Event-ID continuam do último evento recebido.
+    """
+    if not await jobs.obter(job_id):
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    try:
+        depois_de = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        depois_de = 0
+
+    async def stream():
+        async for evento in jobs.eventos(job_id, depois_de):
+            if evento is None:
+                yield ": keepalive\n\n"
+                continue
+            dados = json.dumps(evento['dados'], ensure_ascii=False, default=str)
+            yield f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Iniciando API de Busca Real com WebUI...")
@@ -345,4 +474,11 @@ if __name__ == "__main__":
     print("🌐 O navegador será aberto para realizar as buscas")
     print("⏳ Cada busca pode levar 1-2 minutos para ser concluída")
     print("-" * 60)
-    uvicorn.run(app, host="127.0.0.1", port=8003)
\ No newline at end of file
+    workers = int(os.getenv('API_WORKERS', '1'))
+    if workers > 1:
+        # Os workers são processos novos que importam o módulo; herdam o ambiente
+        os.environ.setdefault('ESTADO_COMPARTILHADO_PATH', 'estado_compartilhado.db')
+        print(f"👷 {workers} workers")
+        uvicorn.run("api_imoveis_webui:app", host="127.0.0.1", port=8003, workers=workers)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=8003)
\ No newline at end of file
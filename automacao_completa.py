@@ -13,7 +13,8 @@ import os
 from browser_use import Agent, Browser, BrowserConfig
 from src.utils.llm_provider import get_llm_model
 from dotenv import load_dotenv
-from database import db
+from database import db, log_busca, aupsert_links_unicos, aplanejar_ciclo
+from migracoes import verificar_schema
 import json
 import signal
 import sys
@@ -41,6 +42,7 @@ class AutomacaoBuscaCompleta:
         self.ciclo_numero = 0
         self.intervalo_horas = 12  # Intervalo entre ciclos em horas
         self.delay_entre_buscas = 30  # Delay entre cada busca em segundos
+        self.max_idade_link_horas = 24  # Links mais novos que isso não são buscados de novo
         
         # Configurar LLM
         self.llm = get_llm_model(
@@ -61,81 +63,6 @@ class AutomacaoBuscaCompleta:
         self.gerar_relatorio_final()
         sys.exit(0)
     
-    def get_configuracoes_ativas(self) -> Dict:
-        """Busca todas as configurações ativas do banco"""
-        try:
-            # Buscar cidades ativas
-            query_cidades = """
-                SELECT DISTINCT m.id as municipio_id, m.nome as cidade, 
-                       e.id as estado_id, e.nome as estado_nome, e.sigla as estado_sigla
-                FROM municipios m
-                JOIN estados e ON m.estado_id = e.id
-                WHERE m.ativo = 1 AND e.ativo = 1
-                ORDER BY e.sigla, m.nome
-            """
-            cidades = db.execute_query(query_cidades)
-            
-            # Buscar plataformas ativas
-            query_plataformas = """
-                SELECT id, nome, url_base 
-                FROM plataformas 
-                WHERE ativo = 1
-                ORDER BY nome
-            """
-            plataformas = db.execute_query(query_plataformas)
-            
-            # Buscar tipos de busca
-            query_tipos = """
-                SELECT id, nome 
-                FROM tipos_busca
-                ORDER BY nome
-            """
-            tipos_busca = db.execute_query(query_tipos)
-            
-            logger.info(f"📊 Configurações encontradas:")
-            logger.info(f"   • {len(cidades)} cidades ativas")
-            logger.info(f"   • {len(plataformas)} plataformas ativas")
-            logger.info(f"   • {len(tipos_busca)} tipos de busca")
-            
-            total_combinacoes = len(cidades) * len(plataformas) * len(tipos_busca)
-            logger.info(f"   • Total de combinações possíveis: {total_combinacoes}")
-            
-            return {
-                'cidades': cidades,
-                'plataformas': plataformas,
-                'tipos_busca': tipos_busca,
-                'total_combinacoes': total_combinacoes
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Erro ao buscar configurações: {e}")
-            return None
-    
-    def verificar_link_existente(self, municipio_id: int, estado_id: int, 
-                                plataforma_id: int, tipo_busca_id: int) -> bool:
-        """Verifica se já existe um link recente para esta combinação"""
-        try:
-            # Verifica se já existe link atualizado nas últimas 24h
-            query = """
-                SELECT id, url, updated_at 
-                FROM links_duckduckgo 
-                WHERE plataforma_id = %s 
-                AND tipo_busca_id = %s 
-                AND estado_id = %s 
-                AND municipio_id = %s
-                AND (updated_at > DATE_SUB(NOW(), INTERVAL 24 HOUR) 
-                     OR created_at > DATE_SUB(NOW(), INTERVAL 24 HOUR))
-            """
-            
-            resultado = db.execute_query(query, 
-                (plataforma_id, tipo_busca_id, estado_id, municipio_id))
-            
-            return len(resultado) > 0
-            
-        except Exception as e:
-            logger.error(f"❌ Erro ao verificar link existente: {e}")
-            return False
-    
     async def buscar_link_plataforma(self, cidade: str, estado: str, 
                                     plataforma: str, tipo_busca: str) -> Dict:
         """Busca o link de uma plataforma específica usando browser_use"""
@@ -252,7 +179,7 @@ class AutomacaoBuscaCompleta:
             logger.error(f"❌ Erro na busca: {e}")
             return None
     
-    def salvar_link(self, dados: Dict, municipio_id: int, estado_id: int, 
+    async def salvar_link(self, dados: Dict, municipio_id: int, estado_id: int, 
                    plataforma_id: int, tipo_busca_id: int) -> bool:
         """Salva o link encontrado no banco de dados"""
         try:
@@ -262,42 +189,16 @@ class AutomacaoBuscaCompleta:
             
             logger.info(f"💾 Tentando salvar link: {dados.get('link')[:50]}...")
             
-            # Verificar se já existe
-            logger.debug(f"Verificando se existe link para: plataforma={plataforma_id}, tipo={tipo_busca_id}, estado={estado_id}, municipio={municipio_id}")
-            existe = db.execute_query(
-                "SELECT id FROM links_duckduckgo WHERE plataforma_id = %s AND tipo_busca_id = %s AND estado_id = %s AND municipio_id = %s",
-                (plataforma_id, tipo_busca_id, estado_id, municipio_id)
-            )
-            
-            logger.debug(f"Resultado da verificação: {existe}")
-            
-            if existe:
-                # Atualizar existente
-                query = """
-                    UPDATE links_duckduckgo 
-                    SET url = %s, updated_at = NOW()
-                    WHERE plataforma_id = %s AND tipo_busca_id = %s 
-                    AND estado_id = %s AND municipio_id = %s
-                """
-                db.execute_update(query, (
-                    dados['link'], plataforma_id, tipo_busca_id, 
-                    estado_id, municipio_id
-                ))
-                logger.info(f"🔄 Link atualizado no banco")
-            else:
-                # Inserir novo
-                query = """
-                    INSERT INTO links_duckduckgo 
-                    (url, plataforma_id, tipo_busca_id, estado_id, municipio_id,
-                     termo_busca, posicao_busca, processado, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                """
-                termo = f"{dados.get('tipo_busca', '')} {dados.get('cidade', '')} {dados.get('estado', '')}"
-                db.execute_update(query, (
-                    dados['link'], plataforma_id, tipo_busca_id, 
-                    estado_id, municipio_id, termo, 1, 0
-                ))
-                logger.info(f"💾 Novo link salvo no banco")
+            termo = f"{dados.get('tipo_busca', '')} {dados.get('cidade', '')} {dados.get('estado', '')}"
+            await aupsert_links_unicos([{
+                'url': dados['link'],
+                'plataforma_id': plataforma_id,
+                'tipo_busca_id': tipo_busca_id,
+                'estado_id': estado_id,
+                'municipio_id': municipio_id,
+                'termo_busca': termo
+            }])
+            logger.info(f"💾 Link salvo no banco")
             
             return True
             
@@ -315,73 +216,81 @@ class AutomacaoBuscaCompleta:
         logger.info(f"📅 {inicio_ciclo.strftime('%d/%m/%Y %H:%M:%S')}")
         logger.info(f"{'='*80}\n")
         
-        # Buscar configurações ativas
-        config = self.get_configuracoes_ativas()
-        if not config:
-            logger.error("❌ Não foi possível obter configurações")
+        # Planejar o ciclo: combinações sem link recente, numa única query
+        try:
+            plano = await aplanejar_ciclo(max_idade_horas=self.max_idade_link_horas)
+        except Exception as e:
+            logger.error(f"❌ Não foi possível planejar o ciclo: {e}")
             return
         
-        total_processados = 0
+        pendentes = plano['pendentes']
         total_sucesso = 0
-        total_pulados = 0
+        total_pulados = plano['total_combinacoes'] - len(pendentes)
+        total_processados = total_pulados
         total_erros = 0
         
-        # Processar cada combinação
-        for cidade in config['cidades']:
-            for plataforma in config['plataformas']:
-                for tipo_busca in config['tipos_busca']:
-                    
-                    # Verificar se deve continuar
-                    if not self.running:
-                        logger.info("⏸️ Execução interrompida pelo usuário")
-                        return
-                    
-                    total_processados += 1
-                    
-                    # Verificar se já existe link recente
-                    if self.verificar_link_existente(
-                        cidade['municipio_id'], cidade['estado_id'],
-                        plataforma['id'], tipo_busca['id']
-                    ):
-                        logger.info(f"⏭️ Pulando (link recente existe): {plataforma['nome']} - {tipo_busca['nome']} - {cidade['cidade']}/{cidade['estado_sigla']}")
-                        total_pulados += 1
-                        continue
-                    
-                    # Fazer a busca
-                    logger.info(f"\n[{total_processados}/{config['total_combinacoes']}] Processando:")
-                    logger.info(f"   📍 {cidade['cidade']}, {cidade['estado_sigla']}")
-                    logger.info(f"   🏢 {plataforma['nome']}")
-                    logger.info(f"   🏠 {tipo_busca['nome']}")
-                    
-                    resultado = await self.buscar_link_plataforma(
-                        cidade['cidade'], 
-                        cidade['estado_sigla'],
-                        plataforma['nome'],
-                        tipo_busca['nome']
-                    )
-                    
-                    if resultado:
-                        logger.info(f"📝 Resultado obtido: {resultado}")
-                        # Salvar no banco mesmo sem verificar tem_imoveis
-                        if self.salvar_link(
-                            resultado,
-                            cidade['municipio_id'],
-                            cidade['estado_id'],
-                            plataforma['id'],
-                            tipo_busca['id']
-                        ):
-                            total_sucesso += 1
-                            logger.info(f"✅ Sucesso!")
-                        else:
-                            total_erros += 1
-                            logger.error(f"❌ Erro ao salvar")
-                    else:
-                        total_erros += 1
-                        logger.warning(f"⚠️ Sem resultados ou sem imóveis")
-                    
-                    # Delay entre buscas
-                    logger.info(f"⏳ Aguardando {self.delay_entre_buscas}s antes da próxima busca...")
-                    await asyncio.sleep(self.delay_entre_buscas)
+        logger.info(f"📊 {plano['total_combinacoes']} combinações ativas")
+        logger.info(f"   • ⏭️ {total_pulados} com link recente (puladas)")
+        logger.info(f"   • 🔍 {len(pendentes)} a buscar")
+        
+        # Processar cada combinação pendente (nunca capturadas primeiro, depois as mais antigas)
+        for item in pendentes:
+            
+            # Verificar se deve continuar
+            if not self.running:
+                logger.info("⏸️ Execução interrompida pelo usuário")
+                return
+            
+            total_processados += 1
+            
+            # Fazer a busca
+            logger.info(f"\n[{total_processados}/{plano['total_combinacoes']}] Processando:")
+            logger.info(f"   📍 {item['cidade']}, {item['estado_sigla']}")
+            logger.info(f"   🏢 {item['plataforma_nome']}")
+            logger.info(f"   🏠 {item['tipo_busca']}")
+            
+            resultado = await self.buscar_link_plataforma(
+                item['cidade'], 
+                item['estado_sigla'],
+                item['plataforma_nome'],
+                item['tipo_busca']
+            )
+            
+            salvo = False
+            if resultado:
+                logger.info(f"📝 Resultado obtido: {resultado}")
+                # Salvar no banco mesmo sem verificar tem_imoveis
+                salvo = await self.salvar_link(
+                    resultado,
+                    item['municipio_id'],
+                    item['estado_id'],
+                    item['plataforma_id'],
+                    item['tipo_busca_id']
+                )
+                if salvo:
+                    total_sucesso += 1
+                    logger.info(f"✅ Sucesso!")
+                else:
+                    total_erros += 1
+                    logger.error(f"❌ Erro ao salvar")
+            else:
+                total_erros += 1
+                logger.warning(f"⚠️ Sem resultados ou sem imóveis")
+            
+            # Telemetria da busca (write-behind, não bloqueia o ciclo)
+            log_busca.registrar(
+                'browser_use',
+                f"{item['plataforma_nome']} {item['tipo_busca']} {item['cidade']} {item['estado_sigla']}",
+                item['plataforma_id'],
+                item['municipio_id'],
+                1 if resultado else 0,
+                1 if salvo else 0,
+                f"Ciclo #{self.ciclo_numero}" if salvo else f"Ciclo #{self.ciclo_numero}: sem resultado"
+            )
+            
+            # Delay entre buscas
+            logger.info(f"⏳ Aguardando {self.delay_entre_buscas}s antes da próxima busca...")
+            await asyncio.sleep(self.delay_entre_buscas)
         
         # Estatísticas do ciclo
         fim_ciclo = datetime.now()
@@ -470,6 +379,10 @@ class AutomacaoBuscaCompleta:
             if hoje:
                 logger.info(f"   • Atualizados hoje: {hoje[0]['total']}")
             
+            # Latência por query (só quando DB_QUERY_STATS=true)
+            if db.query_stats.enabled:
+                db.query_stats.log_resumo()
+            
             logger.info("="*80)
             
         except Exception as e:
@@ -484,6 +397,11 @@ class AutomacaoBuscaCompleta:
         logger.info(f"⏱️ Delay entre buscas: {self.delay_entre_buscas} segundos")
         logger.info("Pressione Ctrl+C para parar\n")
         
+        try:
+            await asyncio.to_thread(verificar_schema)
+        except Exception as e:
+            logger.error(f"❌ Não foi possível verificar o schema: {e}")
+        
         while self.running:
             try:
                 # Executar ciclo completo
@@ -534,6 +452,7 @@ async def main():
         automacao.running = False
     finally:
         automacao.gerar_relatorio_final()
+        await db.aclose()
 
 if __name__ == "__main__":
     # Executar o sistema
@@ -0,0 +1,263 @@
+"""
+Pool de navegadores Chromium do Playwright compartilhado pela API
+
+Mantém N navegadores quentes e entrega um contexto anônimo novo (sem
+cookies nem cache de outras requisições) a cada lease. Cada navegador é
+reciclado depois de ``paginas_por_browser`` leases ou quando cai.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from playwright.async_api import async_playwright
+
+from metricas import lancamento_navegador
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolExhaustedError(Exception):
+    """Nenhum navegador ficou livre dentro do tempo limite de lease"""
+
+
+class _BrowserSlot:
+    """Um processo Chromium do pool e quantas páginas ele já serviu"""
+
+    def __init__(self, indice: int):
+        self.indice = indice
+        self.browser = None
+        self.paginas = 0
+        self.lancado_em = 0.0
+
+    def saudavel(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    Pool de ``tamanho`` navegadores Chromium.
+
+    ``lease()`` espera um navegador livre por até ``timeout_lease`` segundos
+    (senão levanta ``BrowserPoolExhaustedError``), abre um contexto anônimo
+    novo e o fecha ao final. Navegadores desconectados ou que já serviram
+    ``paginas_por_browser`` leases são relançados antes do próximo uso.
+    ``reparar_em_segundo_plano()`` relança slots vazios sem esperar um lease
+    (chamado pela readiness, para a instância não ficar presa fora do ar).
+    """
+
+    LAUNCH_ARGS = [
+        '--disable-blink-features=AutomationControlled',
+        '--disable-dev-shm-usage',
+        '--no-sandbox'
+    ]
+
+    def __init__(self, tamanho: int = 2, paginas_por_browser: int = 50,
+                 timeout_lease: float = 30, headless: bool = True, intervalo_reparo: float = 10):
+        self.tamanho = tamanho
+        self.paginas_por_browser = paginas_por_browser
+        self.timeout_lease = timeout_lease
+        self.headless = headless
+        self.intervalo_reparo = intervalo_reparo
+
+        self._playwright = None
+        self._slots: List[_BrowserSlot] = []
+        self._livres: Optional[asyncio.Queue] = None
+        self._lock_inicio: Optional[asyncio.Lock] = None
+        self._iniciado = False
+        self._encerrando = False
+        self._aguardando = 0
+        self._tarefa_reparo: Optional[asyncio.Task] = None
+        self._ultimo_reparo = 0.0
+        self._stats = {
+            'leases': 0,
+            'lancamentos': 0,
+            'reciclagens': 0,
+            'quedas': 0,
+            'falhas_lancamento': 0,
+            'timeouts_lease': 0,
+            'reparos': 0,
+            'espera_total_s': 0.0,
+            'espera_max_s': 0.0,
+        }
+
+    async def start(self):
+        """Inicia o Playwright e lança os navegadores (idempotente)"""
+        if self._lock_inicio is None:
+            self._lock_inicio = asyncio.Lock()
+        async with self._lock_inicio:
+            if self._iniciado:
+                return
+            self._encerrando = False
+            self._playwright = await async_playwright().start()
+            self._livres = asyncio.Queue()
+            self._slots = [_BrowserSlot(i) for i in range(self.tamanho)]
+            for slot in self._slots:
+                try:
+                    await self._lancar(slot)
+                except Exception as e:
+                    # O slot fica vazio e é relançado no próximo lease
+                    logger.error(f"❌ Falha ao lançar navegador {slot.indice} do pool: {e}")
+                self._livres.put_nowait(slot)
+            self._iniciado = True
+            logger.info(f"🌐 Pool de navegadores iniciado ({self.tamanho} navegadores)")
+
+    async def _lancar(self, slot: _BrowserSlot):
+        inicio = time.perf_counter()
+        try:
+            slot.browser = await self._playwright.chromium.launch(
+                headless=self.headless,
+                args=self.LAUNCH_ARGS
+            )
+        except Exception:
+            slot.browser = None
+            self._stats['falhas_lancamento'] += 1
+            raise
+        lancamento_navegador.observar(time.perf_counter() - inicio)
+        slot.paginas = 0
+        slot.lancado_em = time.monotonic()
+        self._stats['lancamentos'] += 1
+
+    async def _fechar_browser(self, slot: _BrowserSlot):
+        browser, slot.browser = slot.browser, None
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.debug(f"Erro ao fechar navegador {slot.indice}: {e}")
+
+    async def _preparar(self, slot: _BrowserSlot):
+        """Relança o navegador do slot se ele caiu ou atingiu o limite de páginas"""
+        if slot.browser is not None and not slot.browser.is_connected():
+            logger.warning(f"⚠️ Navegador {slot.indice} do pool caiu, relançando")
+            self._stats['quedas'] += 1
+            await self._fechar_browser(slot)
+        elif slot.browser is not None and slot.paginas >= self.paginas_por_browser:
+            logger.info(f"♻️ Reciclando navegador {slot.indice} após {slot.paginas} páginas")
+            self._stats['reciclagens'] += 1
+            await self._fechar_browser(slot)
+        if slot.browser is None:
+            await self._lancar(slot)
+
+    def reparar_em_segundo_plano(self) -> bool:
+        """
+        Agenda o relançamento dos navegadores vazios ou caídos que estão livres
+        (ou o start, se ele falhou), no máximo uma vez a cada ``intervalo_reparo``
+        segundos. Retorna True se uma tentativa foi agendada.
+        """
+        if self._encerrando or (self._tarefa_reparo is not None and not self._tarefa_reparo.done()):
+            return False
+        if time.monotonic() - self._ultimo_reparo < self.intervalo_reparo:
+            return False
+        self._ultimo_reparo = time.monotonic()
+        self._tarefa_reparo = asyncio.create_task(self._reparar())
+        return True
+
+    async def _reparar(self):
+        self._stats['reparos'] += 1
+        if not self._iniciado:
+            try:
+                await self.start()
+            except Exception as e:
+                logger.error(f"❌ Falha ao iniciar o pool de navegadores: {e}")
+            return
+        # Só mexe nos slots livres; os emprestados são tratados no próximo lease
+        vazios = []
+        for _ in range(self._livres.qsize()):
+            slot = self._livres.get_nowait()
+            if slot.saudavel():
+                # Volta para o fim da fila: cada slot livre é visto uma vez
+                self._livres.put_nowait(slot)
+            else:
+                vazios.append(slot)
+        for slot in vazios:
+            try:
+                await self._preparar(slot)
+                logger.info(f"🌐 Navegador {slot.indice} do pool relançado")
+            except Exception as e:
+                logger.error(f"❌ Falha ao relançar navegador {slot.indice} do pool: {e}")
+            finally:
+                self._livres.put_nowait(slot)
+
+    @asynccontextmanager
+    async def lease(self, **context_options):
+        """
+        Empresta um navegador do pool e entrega um contexto anônimo novo,
+        criado com ``context_options`` (user_agent, viewport...)
+        """
+        if not self._iniciado:
+            await self.start()
+        if self._encerrando:
+            raise BrowserPoolExhaustedError("Pool de navegadores encerrado")
+
+        inicio = time.perf_counter()
+        self._aguardando += 1
+        try:
+            slot = await asyncio.wait_for(self._livres.get(), timeout=self.timeout_lease)
+        except asyncio.TimeoutError:
+            self._stats['timeouts_lease'] += 1
+            raise BrowserPoolExhaustedError(
+                f"Nenhum navegador livre em {self.timeout_lease}s (tamanho={self.tamanho})"
+            )
+        finally:
+            self._aguardando -= 1
+        espera = time.perf_counter() - inicio
+        self._stats['leases'] += 1
+        self._stats['espera_total_s'] += espera
+        self._stats['espera_max_s'] = max(self._stats['espera_max_s'], espera)
+
+        context = None
+        try:
+            await self._preparar(slot)
+            context = await slot.browser.new_context(**context_options)
+            yield context
+        finally:
+            slot.paginas += 1
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.debug(f"Erro ao fechar contexto do navegador {slot.indice}: {e}")
+            self._livres.put_nowait(slot)
+
+    async def close(self):
+        """Fecha todos os navegadores e o Playwright"""
+        if not self._iniciado:
+            return
+        self._encerrando = True
+        for slot in self._slots:
+            await self._fechar_browser(slot)
+        try:
+            await self._playwright.stop()
+        except Exception as e:
+            logger.debug(f"Erro ao encerrar Playwright: {e}")
+        self._playwright = None
+        self._iniciado = False
+        logger.info("🌐 Pool de navegadores encerrado")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        livres = self._livres.qsize() if self._livres is not None else 0
+        stats['tamanho'] = self.tamanho
+        stats['navegadores_ativos'] = sum(1 for slot in self._slots if slot.saudavel())
+        stats['livres'] = livres
+        stats['em_uso'] = len(self._slots) - livres if self._iniciado else 0
+        stats['aguardando'] = self._aguardando
+        stats['paginas_por_browser'] = self.paginas_por_browser
+        stats['espera_media_s'] = (
+            stats['espera_total_s'] / stats['leases'] if stats['leases'] else 0.0
+        )
+        return stats
+
+
+browser_pool = BrowserPool(
+    tamanho=int(os.getenv('BROWSER_POOL_SIZE', '2')),
+    paginas_por_browser=int(os.getenv('BROWSER_POOL_MAX_PAGES', '50')),
+    timeout_lease=float(os.getenv('BROWSER_POOL_LEASE_TIMEOUT', '30')),
+    headless=os.getenv('BROWSER_POOL_HEADLESS', 'true').lower() == 'true',
+    intervalo_reparo=float(os.getenv('BROWSER_POOL_REPAIR_INTERVAL', '10')),
+)
@@ -10,7 +10,7 @@ import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 import requests
-from database import db, get_plataformas_ativas
+from database import db, refdata, aplanejar_ciclo
 import json
 
 # Configurar logging
@@ -32,26 +32,8 @@ class BuscaUnicaImoveis:
         self.running = True
         self.ciclo_numero = 0
         self.tipos_operacao = ["venda", "aluguel"]
+        self.max_buscas_por_ciclo = 40  # Limite para teste (20 cidades × 2 tipos)
         
-    def get_cidades_ativas(self) -> List[Dict]:
-        """Busca cidades ativas do banco MariaDB"""
-        try:
-            query = """
-                SELECT m.id, m.nome, m.estado_id, 
-                       e.nome as estado_nome, e.sigla as estado_sigla
-                FROM municipios m
-                JOIN estados e ON m.estado_id = e.id
-                WHERE m.ativo = 1 AND e.ativo = 1
-                ORDER BY e.sigla, m.nome
-                LIMIT 20  # Limitar para teste
-            """
-            cidades = db.execute_query(query)
-            logger.info(f"✅ Encontradas {len(cidades)} cidades ativas no banco")
-            return cidades
-        except Exception as e:
-            logger.error(f"❌ Erro ao buscar cidades ativas: {e}")
-            return []
-    
     def verificar_api_status(self) -> bool:
         """Verifica se a API está funcionando"""
         try:
@@ -110,92 +92,41 @@ class BuscaUnicaImoveis:
             logger.error(f"❌ Erro na busca de {cidade}/{estado}: {e}")
             return None
     
-    def verificar_link_existente(self, cidade: str, estado: str, tipo_operacao: str) -> bool:
-        """Verifica se já existe um link para esta cidade/tipo no banco"""
+    async def planejar_buscas(self) -> List[Dict]:
+        """Lista as combinações cidade/tipo do VivaReal sem link recente (uma única query)"""
         try:
-            # Busca cidade e estado no banco
-            cidade_result = db.execute_query(
-                "SELECT m.id as municipio_id, e.id as estado_id FROM municipios m JOIN estados e ON m.estado_id = e.id WHERE m.nome = %s AND e.sigla = %s",
-                (cidade, estado)
-            )
-            
-            if not cidade_result:
-                return False
-            
-            municipio_id = cidade_result[0]['municipio_id']
-            estado_id = cidade_result[0]['estado_id']
-            
-            # Busca plataforma VivaReal
-            plataforma_result = db.execute_query(
-                "SELECT id FROM plataformas WHERE nome = 'VivaReal' AND ativo = 1"
-            )
+            ref = await refdata.aget()
+            plataforma_id = ref.plataforma_id('VivaReal')
+            tipo_ids = [ref.tipo_busca_id(tipo) for tipo in self.tipos_operacao]
+            if not plataforma_id or not all(tipo_ids):
+                logger.error("❌ Plataforma VivaReal ou tipos de operação não encontrados no banco")
+                return []
             
-            if not plataforma_result:
-                return False
-            
-            plataforma_id = plataforma_result[0]['id']
-            
-            # Busca tipo de busca
-            tipo_result = db.execute_query(
-                "SELECT id FROM tipos_busca WHERE nome = %s",
-                (tipo_operacao.upper(),)
+            plano = await aplanejar_ciclo(
+                max_idade_horas=24,
+                plataforma_ids=[plataforma_id],
+                tipo_busca_ids=tipo_ids,
+                limite=self.max_buscas_por_ciclo
             )
-            
-            if not tipo_result:
-                return False
-            
-            tipo_busca_id = tipo_result[0]['id']
-            
-            # Verifica se já existe link
-            link_existente = db.execute_query(
-                "SELECT id, url, updated_at FROM links_duckduckgo WHERE plataforma_id = %s AND tipo_busca_id = %s AND estado_id = %s AND municipio_id = %s",
-                (plataforma_id, tipo_busca_id, estado_id, municipio_id)
-            )
-            
-            if link_existente:
-                link = link_existente[0]
-                ultima_atualizacao = link.get('updated_at') or link.get('created_at')
-                
-                # Se foi atualizado nas últimas 24h, não precisa buscar novamente
-                if ultima_atualizacao:
-                    if isinstance(ultima_atualizacao, str):
-                        ultima_atualizacao = datetime.fromisoformat(ultima_atualizacao.replace('Z', '+00:00'))
-                    
-                    if datetime.now() - ultima_atualizacao < timedelta(hours=24):
-                        logger.info(f"⏭️ Link já existe e foi atualizado recentemente para {cidade}/{estado}")
-                        return True
-                    else:
-                        logger.info(f"🔄 Link existe mas é antigo para {cidade}/{estado}, será atualizado")
-                        return False
-                
-                return True
-            
-            return False
-            
+            pulados = plano['total_combinacoes'] - len(plano['pendentes'])
+            logger.info(f"✅ {len(plano['pendentes'])} buscas pendentes, {pulados} links recentes pulados")
+            return plano['pendentes']
         except Exception as e:
-            logger.error(f"❌ Erro ao verificar link existente para {cidade}/{estado}: {e}")
-            return False
+            logger.error(f"❌ Erro ao planejar buscas: {e}")
+            return []
     
-    async def processar_cidade(self, cidade: Dict, tipo_operacao: str):
+    async def processar_cidade(self, cidade: str, estado: str, tipo_operacao: str):
         """Processa uma cidade específica para um tipo de operação"""
-        nome_cidade = cidade['nome']
-        sigla_estado = cidade['estado_sigla']
-        
-        logger.info(f"🏙️ Processando: {nome_cidade}/{sigla_estado} - {tipo_operacao}")
-        
-        # Verifica se já existe link recente
-        if self.verificar_link_existente(nome_cidade, sigla_estado, tipo_operacao):
-            logger.info(f"✅ Link já existe para {nome_cidade}/{sigla_estado} - {tipo_operacao}")
-            return True
+        logger.info(f"🏙️ Processando: {cidade}/{estado} - {tipo_operacao}")
         
         # Busca o link único
-        resultado = await self.buscar_link_unico(nome_cidade, sigla_estado, tipo_operacao)
+        resultado = await self.buscar_link_unico(cidade, estado, tipo_operacao)
         
         if resultado:
-            logger.info(f"✅ Link único processado com sucesso para {nome_cidade}/{sigla_estado}")
+            logger.info(f"✅ Link único processado com sucesso para {cidade}/{estado}")
             return True
         else:
-            logger.warning(f"⚠️ Falha ao processar {nome_cidade}/{sigla_estado} - {tipo_operacao}")
+            logger.warning(f"⚠️ Falha ao processar {cidade}/{estado} - {tipo_operacao}")
             return False
     
     async def executar_ciclo_busca(self):
@@ -210,37 +141,38 @@ class BuscaUnicaImoveis:
             logger.error("❌ API não está funcionando. Pulando ciclo.")
             return False
         
-        # Buscar cidades ativas
-        cidades = self.get_cidades_ativas()
-        if not cidades:
-            logger.warning("⚠️ Nenhuma cidade ativa encontrada")
-            return False
+        # Combinações cidade/tipo sem link recente
+        pendentes = await self.planejar_buscas()
+        if not pendentes:
+            logger.info("✅ Nenhuma busca pendente neste ciclo")
+            return True
         
-        logger.info(f"📋 Processando {len(cidades)} cidades para {len(self.tipos_operacao)} tipos de operação")
+        logger.info(f"📋 Processando {len(pendentes)} buscas pendentes")
         
         total_processados = 0
         total_sucessos = 0
         
-        # Processar cada cidade para cada tipo de operação
-        for i, cidade in enumerate(cidades, 1):
-            logger.info(f"\n[{i}/{len(cidades)}] Cidade: {cidade['nome']}/{cidade['estado_sigla']}")
+        for i, item in enumerate(pendentes, 1):
+            logger.info(f"\n[{i}/{len(pendentes)}] Cidade: {item['cidade']}/{item['estado_sigla']} - Tipo: {item['tipo_busca'].lower()}")
             
-            for j, tipo_operacao in enumerate(self.tipos_operacao, 1):
-                logger.info(f"   [{j}/{len(self.tipos_operacao)}] Tipo: {tipo_operacao}")
-                
-                sucesso = await self.processar_cidade(cidade, tipo_operacao)
-                total_processados += 1
-                
-                if sucesso:
-                    total_sucessos += 1
-                
-                # Aguardar entre buscas para não sobrecarregar
-                await asyncio.sleep(10)
+            sucesso = await self.processar_cidade(
+                item['cidade'], item['estado_sigla'], item['tipo_busca'].lower()
+            )
+            total_processados += 1
+            
+            if sucesso:
+                total_sucessos += 1
+            
+            if i == len(pendentes):
+                break
             
-            # Aguardar entre cidades
-            if i < len(cidades):
+            # Aguardar entre buscas (mais tempo ao trocar de cidade) para não sobrecarregar
+            proximo = pendentes[i]
+            if proximo['municipio_id'] != item['municipio_id']:
                 logger.info(f"   ⏳ Aguardando 30 segundos antes da próxima cidade...")
                 await asyncio.sleep(30)
+            else:
+                await asyncio.sleep(10)
         
         # Resumo do ciclo
         logger.info(f"\n{'='*70}")
@@ -355,7 +287,10 @@ async def main():
     print("="*70 + "\n")
     
     sistema = BuscaUnicaImoveis()
-    await sistema.executar_loop_principal()
+    try:
+        await sistema.executar_loop_principal()
+    finally:
+        await db.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
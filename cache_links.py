@@ -0,0 +1,97 @@
+"""
+Cache LRU em memória dos resultados de /buscar-link-unico
+
+Cada entrada guarda o resultado e a data da última atualização do link.
+Entradas mais velhas que ``max_idade`` segundos são tratadas como ausentes;
+no miss de memória, o carregador consulta o link salvo no banco e só
+resultados frescos voltam ao cache.
+"""
+
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LinkCache:
+    """
+    LRU de ``max_entradas`` resultados por combinação, com frescor medido
+    pelo ``atualizado_em`` do link (não pelo momento em que entrou no cache).
+    """
+
+    def __init__(self, max_entradas: int = 1000, max_idade: float = 86400):
+        self.max_entradas = max_entradas
+        self.max_idade = max_idade
+        self._entradas: 'OrderedDict[Hashable, Tuple[Any, datetime]]' = OrderedDict()
+        self._stats = {
+            'hits_memoria': 0,
+            'hits_banco': 0,
+            'misses': 0,
+            'expiradas': 0,
+            'evictions': 0,
+        }
+
+    def idade(self, atualizado_em: datetime) -> float:
+        return (datetime.now() - atualizado_em).total_seconds()
+
+    def fresco(self, atualizado_em: Optional[datetime]) -> bool:
+        return atualizado_em is not None and self.idade(atualizado_em) < self.max_idade
+
+    def get(self, chave: Hashable) -> Optional[Tuple[Any, datetime]]:
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return None
+        if not self.fresco(entrada[1]):
+            del self._entradas[chave]
+            self._stats['expiradas'] += 1
+            return None
+        self._entradas.move_to_end(chave)
+        return entrada
+
+    def put(self, chave: Hashable, valor: Any, atualizado_em: datetime):
+        self._entradas[chave] = (valor, atualizado_em)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def invalidate(self, chave: Optional[Hashable] = None):
+        """Remove uma chave ou, sem argumento, esvazia o cache"""
+        if chave is None:
+            self._entradas.clear()
+        else:
+            self._entradas.pop(chave, None)
+
+    async def aget(self, chave: Hashable,
+                   carregar: Callable[[], Awaitable[Optional[Tuple[Any, datetime]]]]
+                   ) -> Optional[Tuple[Any, datetime, str]]:
+        """
+        Retorna (valor, atualizado_em, origem) se houver resultado fresco na
+        memória ('memoria') ou via ``carregar()`` ('banco'); senão None
+        """
+        entrada = self.get(chave)
+        if entrada is not None:
+            self._stats['hits_memoria'] += 1
+            return entrada[0], entrada[1], 'memoria'
+
+        carregado = await carregar()
+        if carregado is not None and self.fresco(carregado[1]):
+            self.put(chave, carregado[0], carregado[1])
+            self._stats['hits_banco'] += 1
+            return carregado[0], carregado[1], 'banco'
+
+        self._stats['misses'] += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['entradas'] = len(self._entradas)
+        stats['max_entradas'] = self.max_entradas
+        stats['max_idade_s'] = self.max_idade
+        return stats
+
+
+cache_links = LinkCache(
+    max_entradas=int(os.getenv('LINK_CACHE_MAX_ENTRIES', '1000')),
+    max_idade=float(os.getenv('LINK_CACHE_MAX_AGE', '86400')),
+)
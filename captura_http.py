@@ -0,0 +1,227 @@
+"""
+Captura via HTTP (tier 1) e estatísticas dos tiers de captura
+
+Páginas de cidade do VivaReal costumam trazer título e total de imóveis no
+HTML renderizado no servidor. Um cliente httpx com keep-alive busca o HTML
+e o parser da stdlib extrai título, og:title, h1 e o total; só quando isso
+falha (ou a página depende de JavaScript) a captura sobe para o navegador
+(tier 2) e depois para o Agent (tier 3).
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from metricas import carregamento_pagina
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('http', 'browser', 'agent')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Mesmo critério do script de extração no navegador (extracao.py)
+# Grupo 1: "2,5 mil" / "1.200 mil" (vírgula ou ponto seguido de menos de 3 dígitos é decimal);
+# grupo 2: "2.500" / "2500"
+_RE_TOTAL = re.compile(
+    r'(?:(\d{1,3}(?:[.\s]\d{3})+|\d+(?:[.,]\d+)?)\s*mil\s+|(\d{1,3}(?:[.,\s]\d{3})+|\d+)\s*)'
+    r'(im[óo]ve|resultado|an[úu]ncio)',
+    re.IGNORECASE
+)
+_RE_MILHAR = re.compile(r'\d{1,3}(?:[.\s]\d{3})+')
+# Total no estado serializado da página (Next/Nuxt)
+_RE_TOTAL_JSON = re.compile(r'"(?:totalCount|total_count|listingsCount)"\s*:\s*(\d+)')
+# Mínimo de texto visível para considerar que a página não é só um shell JS
+MIN_TEXTO_VISIVEL = 200
+
+
+def parse_total(texto: str) -> Optional[int]:
+    m = _RE_TOTAL.search(texto or '')
+    if not m:
+        return None
+    if m.group(2):
+        return int(re.sub(r'[.,\s]', '', m.group(2)))
+    mil = m.group(1)
+    if _RE_MILHAR.fullmatch(mil):
+        return int(re.sub(r'[.\s]', '', mil)) * 1000
+    return round(float(mil.replace(',', '.')) * 1000)
+
+
+class _ExtratorHTML(HTMLParser):
+    """Coleta título, og:title, primeiro h1, textos visíveis e o conteúdo dos scripts"""
+
+    IGNORAR = {'script', 'style', 'noscript', 'template'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.titulo: List[str] = []
+        self.og_titulo: Optional[str] = None
+        self.h1: List[str] = []
+        self.textos: List[str] = []
+        self.scripts: List[str] = []
+        self.noscript: List[str] = []
+        self._pilha: List[str] = []
+        self._h1_fechado = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'meta':
+            attrs = dict(attrs)
+            if attrs.get('property') == 'og:title' and self.og_titulo is None:
+                self.og_titulo = attrs.get('content')
+            return
+        if tag in ('br', 'img', 'input', 'link', 'hr', 'source', 'wbr'):
+            return
+        self._pilha.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._pilha:
+            while self._pilha and self._pilha.pop() != tag:
+                pass
+            if tag == 'h1' and self.h1:
+                self._h1_fechado = True
+
+    def handle_data(self, data):
+        if not self._pilha:
+            self.textos.append(data)
+            return
+        atual = self._pilha[-1]
+        if atual == 'script':
+            self.scripts.append(data)
+        elif atual == 'noscript':
+            self.noscript.append(data)
+        elif atual == 'title':
+            self.titulo.append(data)
+        elif not self.IGNORAR.intersection(self._pilha):
+            if 'h1' in self._pilha and not self._h1_fechado:
+                self.h1.append(data)
+            self.textos.append(data)
+
+
+def extrair_html(html: str) -> Dict[str, Any]:
+    """Título, og:title, h1, total (int) e se a página parece depender de JavaScript"""
+    parser = _ExtratorHTML()
+    parser.feed(html)
+    parser.close()
+
+    textos = [t.strip() for t in parser.textos if t.strip()]
+    total = None
+    total_texto = None
+    for texto in textos:
+        if len(texto) <= 300:
+            total = parse_total(texto)
+            if total is not None:
+                total_texto = texto
+                break
+    if total is None:
+        m = _RE_TOTAL_JSON.search(''.join(parser.scripts))
+        if m:
+            total = int(m.group(1))
+            total_texto = m.group(0)
+
+    visivel = sum(len(t) for t in textos)
+    aviso_js = 'javascript' in ' '.join(parser.noscript).lower()
+    return {
+        'titulo': ' '.join(''.join(parser.titulo).split()) or None,
+        'og_titulo': parser.og_titulo,
+        'h1': ' '.join(''.join(parser.h1).split()) or None,
+        'total': total,
+        'total_texto': total_texto,
+        'somente_js': visivel < MIN_TEXTO_VISIVEL or (aviso_js and visivel < MIN_TEXTO_VISIVEL * 5),
+    }
+
+
+class CapturaHTTP:
+    """
+    Cliente httpx compartilhado (keep-alive, até ``max_conexoes``) para o
+    tier 1. ``capturar()`` retorna None quando o HTML não basta e a captura
+    deve subir para o navegador.
+    """
+
+    def __init__(self, timeout: float = 10, max_conexoes: int = 20, keepalive: float = 60):
+        self.timeout = timeout
+        self.max_conexoes = max_conexoes
+        self.keepalive = keepalive
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers={
+                    'User-Agent': USER_AGENT,
+                    'Accept': 'text/html,application/xhtml+xml',
+                    'Accept-Language': 'pt-BR,pt;q=0.9',
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_conexoes,
+                    max_keepalive_connections=self.max_conexoes,
+                    keepalive_expiry=self.keepalive,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    async def capturar(self, url: str) -> Optional[Dict[str, Any]]:
+        inicio = time.perf_counter()
+        try:
+            response = await self._get_client().get(url)
+        except httpx.HTTPError as e:
+            logger.info(f"🌐 HTTP: falha ao buscar {url}: {e}")
+            return None
+        finally:
+            carregamento_pagina.observar(time.perf_counter() - inicio, rotulo='captura_http')
+        if response.status_code != 200 or 'html' not in response.headers.get('content-type', ''):
+            # 403/429 costumam ser proteção anti-bot: o navegador resolve
+            logger.info(f"🌐 HTTP: {url} respondeu {response.status_code}, subindo para o navegador")
+            return None
+
+        dados = extrair_html(response.text)
+        if dados['somente_js']:
+            logger.info(f"🌐 HTTP: {url} depende de JavaScript, subindo para o navegador")
+            return None
+        if dados['total'] is None:
+            logger.info(f"🌐 HTTP: total não encontrado no HTML de {url}")
+            return None
+
+        dados['url_final'] = str(response.url)
+        return dados
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class EstatisticasTiers:
+    """Tentativas e sucessos por tier de captura"""
+
+    def __init__(self):
+        self._stats = {tier: {'tentativas': 0, 'sucessos': 0} for tier in TIERS}
+
+    def registrar(self, tier: str, sucesso: bool):
+        stats = self._stats.setdefault(tier, {'tentativas': 0, 'sucessos': 0})
+        stats['tentativas'] += 1
+        if sucesso:
+            stats['sucessos'] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            tier: dict(stats, taxa_sucesso=stats['sucessos'] / stats['tentativas'] if stats['tentativas'] else None)
+            for tier, stats in self._stats.items()
+        }
+
+
+captura_http = CapturaHTTP(
+    timeout=float(os.getenv('CAPTURA_HTTP_TIMEOUT', '10')),
+    max_conexoes=int(os.getenv('CAPTURA_HTTP_MAX_CONEXOES', '20')),
+)
+estatisticas_tiers = EstatisticasTiers()
@@ -1,15 +1,390 @@
 import pymysql
 from pymysql.cursors import DictCursor
+import aiomysql
+import asyncio
+import atexit
 import logging
-from contextlib import contextmanager
-from typing import Optional, List, Dict, Any
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, Tuple
 import json
+import unicodedata
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: um único processo por arquivo de spill
+    fcntl = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class PoolExhaustedError(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite de checkout"""
+
+
+class ConnectionPool:
+    """
+    Pool limitado de conexões pymysql, seguro para uso entre threads.
+
+    Conexões ociosas são reutilizadas (LIFO), validadas com ping quando ficam
+    paradas mais que ``ping_interval`` segundos e descartadas ao ultrapassar
+    ``max_lifetime``. Quando todas as ``max_size`` conexões estão em uso, o
+    checkout espera até ``checkout_timeout`` segundos e então levanta
+    ``PoolExhaustedError``.
+    """
+
+    def __init__(self, config: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 1800, checkout_timeout: float = 10,
+                 ping_interval: float = 30, idle_timeout: float = 300):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Tamanhos de pool inválidos: min={min_size}, max={max_size}")
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conexão, criada_em, último_uso)
+        self._criadas_em: Dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'conexoes_criadas': 0,
+            'conexoes_descartadas': 0,
+            'falhas_health_check': 0,
+            'esgotamentos': 0,
+            'timeouts_checkout': 0,
+            'espera_total_s': 0.0,
+            'espera_max_s': 0.0,
+        }
+
+    def _connect(self):
+        connection = pymysql.connect(**self.config)
+        with self._cond:
+            self._criadas_em[id(connection)] = time.monotonic()
+            self._stats['conexoes_criadas'] += 1
+        return connection
+
+    def _discard(self, connection):
+        """Fecha a conexão e libera sua vaga no pool"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._criadas_em.pop(id(connection), None)
+            self._size -= 1
+            self._stats['conexoes_descartadas'] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, connection, criada_em: float, ultimo_uso: float) -> bool:
+        agora = time.monotonic()
+        if self.max_lifetime and agora - criada_em > self.max_lifetime:
+            return False
+        if agora - ultimo_uso > self.ping_interval:
+            try:
+                connection.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"Conexão do pool falhou no health check: {e}")
+                with self._cond:
+                    self._stats['falhas_health_check'] += 1
+                return False
+        return True
+
+    def acquire(self):
+        """Retira uma conexão saudável do pool, criando uma nova se houver vaga"""
+        inicio = time.monotonic()
+        deadline = inicio + self.checkout_timeout
+        esgotou = False
+
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolExhaustedError("Pool de conexões fechado")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    if not esgotou:
+                        esgotou = True
+                        self._stats['esgotamentos'] += 1
+                    restante = deadline - time.monotonic()
+                    if restante <= 0:
+                        self._stats['timeouts_checkout'] += 1
+                        raise PoolExhaustedError(
+                            f"Nenhuma conexão livre após {self.checkout_timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(restante)
+
+            if entry is None:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                connection, criada_em, ultimo_uso = entry
+                if not self._is_healthy(connection, criada_em, ultimo_uso):
+                    self._discard(connection)
+                    continue
+
+            espera = time.monotonic() - inicio
+            with self._cond:
+                self._stats['checkouts'] += 1
+                self._stats['espera_total_s'] += espera
+                self._stats['espera_max_s'] = max(self._stats['espera_max_s'], espera)
+            return connection
+
+    def release(self, connection, discard: bool = False):
+        """Devolve a conexão ao pool (ou a descarta se estiver comprometida)"""
+        if discard or self._closed or not connection.open:
+            self._discard(connection)
+            return
+
+        agora = time.monotonic()
+        expiradas = []
+        with self._cond:
+            criada_em = self._criadas_em.get(id(connection), agora)
+            self._idle.append((connection, criada_em, agora))
+            # Fecha ociosas antigas, preservando o mínimo configurado
+            while (self._idle and self._size - len(expiradas) > self.min_size
+                   and agora - self._idle[0][2] > self.idle_timeout):
+                expiradas.append(self._idle.popleft()[0])
+            self._cond.notify()
+
+        for conn in expiradas:
+            self._discard(conn)
+
+    def warmup(self):
+        """Abre conexões até atingir ``min_size``"""
+        with self._cond:
+            faltando = max(self.min_size - self._size, 0)
+            self._size += faltando
+        for _ in range(faltando):
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self.release(connection)
+
+    def close(self):
+        """Fecha todas as conexões ociosas e impede novos checkouts"""
+        with self._cond:
+            self._closed = True
+            ociosas = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in ociosas:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna um snapshot dos contadores do pool"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'tamanho': self._size,
+                'ociosas': len(self._idle),
+                'em_uso': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        checkouts = stats['checkouts']
+        stats['espera_media_s'] = stats['espera_total_s'] / checkouts if checkouts else 0.0
+        return stats
+
+
+_RE_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_RE_TUPLAS = re.compile(r"(\([^()]*(?:\(\)[^()]*)*\))(?:\s*,\s*\1)+")
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint_sql(query: str) -> str:
+    """
+    Normaliza um SQL para agrupar execuções da mesma forma de query:
+    literais e placeholders viram ``?``, listas ``IN (...)`` e tuplas de
+    ``VALUES`` multi-linha são colapsadas e espaços são normalizados.
+    """
+    sql = _RE_STRING.sub('?', query)
+    sql = sql.replace('%s', '?')
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_LISTA.sub('(?+)', sql)
+    sql = _RE_TUPLAS.sub(r'\1, ...', sql)
+    return _RE_ESPACOS.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """
+    Estatísticas de latência por fingerprint de SQL: contagem, tempo total,
+    p50/p95/máximo (sobre as últimas ``amostras`` execuções), linhas e tempo
+    de espera por conexão. Opcional: só coleta com ``enabled = True``.
+    """
+
+    def __init__(self, enabled: bool = False, amostras: int = 1024, log_interval: float = 300):
+        self.enabled = enabled
+        self.amostras = amostras
+        self.log_interval = log_interval
+        self._lock = threading.Lock()
+        self._dados: Dict[str, Dict[str, Any]] = {}
+        self._ultimo_log = time.monotonic()
+
+    def registrar(self, query: str, duracao: float, linhas: int, espera_conexao: float = 0.0):
+        if not self.enabled:
+            return
+        chave = fingerprint_sql(query)
+        with self._lock:
+            dados = self._dados.get(chave)
+            if dados is None:
+                dados = self._dados[chave] = {
+                    'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'linhas': 0,
+                    'espera_conexao_s': 0.0, 'latencias': deque(maxlen=self.amostras)
+                }
+            dados['count'] += 1
+            dados['total_s'] += duracao
+            dados['max_s'] = max(dados['max_s'], duracao)
+            dados['linhas'] += linhas
+            dados['espera_conexao_s'] += espera_conexao
+            dados['latencias'].append(duracao)
+
+            agora = time.monotonic()
+            logar = self.log_interval and agora - self._ultimo_log >= self.log_interval
+            if logar:
+                self._ultimo_log = agora
+        if logar:
+            self.log_resumo()
+
+    @staticmethod
+    def _percentil(ordenadas: List[float], p: float) -> float:
+        if not ordenadas:
+            return 0.0
+        return ordenadas[min(int(p * len(ordenadas)), len(ordenadas) - 1)]
+
+    def snapshot(self, top: Optional[int] = None, ordenar_por: str = 'total_s') -> List[Dict[str, Any]]:
+        """Lista de estatísticas por fingerprint, da mais cara para a mais barata"""
+        with self._lock:
+            itens = [(chave, dict(dados), sorted(dados['latencias'])) for chave, dados in self._dados.items()]
+        resultado = []
+        for chave, dados, ordenadas in itens:
+            dados.pop('latencias')
+            dados.update({
+                'query': chave,
+                'media_s': dados['total_s'] / dados['count'],
+                'p50_s': self._percentil(ordenadas, 0.50),
+                'p95_s': self._percentil(ordenadas, 0.95),
+            })
+            resultado.append(dados)
+        resultado.sort(key=lambda d: d[ordenar_por], reverse=True)
+        return resultado[:top] if top else resultado
+
+    def log_resumo(self, top: int = 10):
+        """Escreve no log as queries que mais consumiram tempo"""
+        snapshot = self.snapshot(top=top)
+        if not snapshot:
+            return
+        logger.info(f"📊 Top {len(snapshot)} queries por tempo total:")
+        for d in snapshot:
+            logger.info(
+                f"   {d['total_s']:.3f}s total | {d['count']}x | p50={d['p50_s'] * 1000:.1f}ms "
+                f"p95={d['p95_s'] * 1000:.1f}ms max={d['max_s'] * 1000:.1f}ms | "
+                f"linhas={d['linhas']} | espera conexão={d['espera_conexao_s']:.3f}s | {d['query'][:160]}"
+            )
+
+    def reset(self):
+        with self._lock:
+            self._dados.clear()
+
+
+class _CursorMedido:
+    """
+    Cursor pymysql que registra cada ``execute``/``executemany`` no
+    QueryStats; o resto é repassado ao cursor original
+    """
+
+    def __init__(self, cursor, stats: QueryStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, query: str, params=None):
+        inicio = time.perf_counter()
+        resultado = self._cursor.execute(query, params)
+        self._stats.registrar(query, time.perf_counter() - inicio, max(self._cursor.rowcount, 0))
+        return resultado
+
+    def executemany(self, query: str, params_list):
+        inicio = time.perf_counter()
+        resultado = self._cursor.executemany(query, params_list)
+        self._stats.registrar(query, time.perf_counter() - inicio, max(self._cursor.rowcount, 0))
+        return resultado
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+
+class _ACursorMedido(_CursorMedido):
+    """Versão aiomysql de _CursorMedido"""
+
+    async def execute(self, query: str, params=None):
+        inicio = time.perf_counter()
+        resultado = await self._cursor.execute(query, params)
+        self._stats.registrar(query, time.perf_counter() - inicio, max(self._cursor.rowcount, 0))
+        return resultado
+
+    async def executemany(self, query: str, params_list):
+        inicio = time.perf_counter()
+        resultado = await self._cursor.executemany(query, params_list)
+        self._stats.registrar(query, time.perf_counter() - inicio, max(self._cursor.rowcount, 0))
+        return resultado
+
+
+# Acumulador do tempo com conexão do banco na requisição atual (metricas.py)
+_tempo_db: ContextVar[Optional[List[float]]] = ContextVar('tempo_db', default=None)
+
+
+@contextmanager
+def medir_tempo_db():
+    """
+    Soma em ``acumulador[0]`` o tempo em que o código dentro do bloco (e as
+    tasks criadas nele) ficou com uma conexão do banco emprestada
+    """
+    acumulador = [0.0]
+    token = _tempo_db.set(acumulador)
+    try:
+        yield acumulador
+    finally:
+        _tempo_db.reset(token)
+
+
+def _somar_tempo_db(inicio: float):
+    acumulador = _tempo_db.get()
+    if acumulador is not None:
+        acumulador[0] += time.perf_counter() - inicio
+
+
 class DatabaseConnection:
     """Gerencia conexões com o banco de dados MariaDB"""
 
@@ -23,44 +398,246 @@ class DatabaseConnection:
             'charset': 'utf8mb4',
             'cursorclass': DictCursor
         }
+        self.pool = ConnectionPool(
+            self.config,
+            min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+            max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+            checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+            ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', '30')),
+            idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+        )
+        # Instrumentação opcional de latência por query (DB_QUERY_STATS=true)
+        self.query_stats = QueryStats(
+            enabled=os.getenv('DB_QUERY_STATS', 'false').lower() in ('true', '1', 'yes', 'sim'),
+            log_interval=float(os.getenv('DB_QUERY_STATS_LOG_INTERVAL', '300')),
+        )
+        # Pool aiomysql para código assíncrono, criado sob demanda por event loop
+        self._async_pool = None
+        self._async_pool_loop = None
 
     @contextmanager
     def get_connection(self):
-        """Context manager para conexão com o banco"""
+        """Context manager para conexão com o banco (emprestada do pool)"""
         connection = None
+        descartar = False
+        inicio = time.perf_counter()
         try:
-            connection = pymysql.connect(**self.config)
+            connection = self.pool.acquire()
             yield connection
             connection.commit()
         except Exception as e:
             if connection:
-                connection.rollback()
+                try:
+                    connection.rollback()
+                except Exception:
+                    descartar = True
+                if isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError)):
+                    descartar = True
             logger.error(f"Erro na conexão com o banco: {e}")
             raise
         finally:
             if connection:
-                connection.close()
+                self.pool.release(connection, discard=descartar)
+            _somar_tempo_db(inicio)
+
+    @contextmanager
+    def cursor(self, connection, *args):
+        """Cursor de ``connection`` com cada query registrada no QueryStats"""
+        with connection.cursor(*args) as cursor:
+            yield _CursorMedido(cursor, self.query_stats)
+
+    @asynccontextmanager
+    async def acursor(self, connection, *args):
+        """Versão assíncrona de cursor(), para conexões de atransaction()"""
+        async with connection.cursor(*args) as cursor:
+            yield _ACursorMedido(cursor, self.query_stats)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Contadores do pool de conexões (checkouts, espera, esgotamentos)"""
+        return self.pool.stats()
+
+    def apool_stats(self) -> Dict[str, Any]:
+        """Tamanho e conexões livres do pool aiomysql (zeros se ainda não criado)"""
+        pool = self._async_pool
+        if pool is None:
+            return {'tamanho': 0, 'livres': 0, 'em_uso': 0, 'max_size': self.pool.max_size}
+        return {
+            'tamanho': pool.size,
+            'livres': pool.freesize,
+            'em_uso': pool.size - pool.freesize,
+            'max_size': pool.maxsize,
+        }
+
+    async def _get_async_pool(self):
+        """Retorna o pool aiomysql do event loop atual, criando-o se necessário"""
+        loop = asyncio.get_running_loop()
+        if self._async_pool is not None and self._async_pool_loop is loop:
+            return self._async_pool
+        if self._async_pool is not None:
+            self._descartar_pool_antigo()
+
+        pool = await aiomysql.create_pool(
+            host=self.config['host'],
+            port=self.config['port'],
+            user=self.config['user'],
+            password=self.config['password'],
+            db=self.config['database'],
+            charset=self.config['charset'],
+            cursorclass=aiomysql.DictCursor,
+            autocommit=False,
+            minsize=self.pool.min_size,
+            maxsize=self.pool.max_size,
+            pool_recycle=int(self.pool.max_lifetime),
+        )
+        if self._async_pool is not None and self._async_pool_loop is loop:
+            # Outra corrotina criou o pool enquanto aguardávamos
+            pool.close()
+            await pool.wait_closed()
+            return self._async_pool
+
+        self._async_pool = pool
+        self._async_pool_loop = loop
+        return pool
+
+    def _descartar_pool_antigo(self):
+        """
+        Fecha o pool aiomysql de um event loop anterior (ex.: asyncio.run
+        repetido), só pela API pública do aiomysql. Se aquele loop ainda roda
+        em outra thread, o pool é fechado nele; se já foi encerrado, o pool é
+        terminado sem aguardar, e as conexões livres ficam para o coletor de
+        lixo. O fechamento limpo é db.aclose() antes de o loop acabar.
+        """
+        pool, loop = self._async_pool, self._async_pool_loop
+        self._async_pool = None
+        self._async_pool_loop = None
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._fechar_pool(pool), loop)
+            return
+        logger.warning("Pool aiomysql de um event loop encerrado descartado; chame db.aclose() antes de sair do loop")
+        try:
+            pool.terminate()
+        except RuntimeError:
+            # Transports de um loop fechado não conseguem agendar o próprio fechamento
+            pass
+
+    @staticmethod
+    async def _fechar_pool(pool):
+        pool.close()
+        await pool.wait_closed()
+
+    @asynccontextmanager
+    async def atransaction(self):
+        """Context manager assíncrono: uma conexão do pool e uma transação"""
+        inicio = time.perf_counter()
+        pool = await self._get_async_pool()
+        try:
+            async with pool.acquire() as connection:
+                try:
+                    yield connection
+                    await connection.commit()
+                except Exception as e:
+                    await connection.rollback()
+                    logger.error(f"Erro na conexão assíncrona com o banco: {e}")
+                    raise
+        finally:
+            _somar_tempo_db(inicio)
+
+    async def afetch(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """Versão assíncrona de execute_query"""
+        inicio = time.perf_counter()
+        async with self.atransaction() as conn:
+            obtida = time.perf_counter()
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params)
+                resultado = list(await cursor.fetchall())
+        self.query_stats.registrar(query, time.perf_counter() - obtida, len(resultado), obtida - inicio)
+        return resultado
+
+    async def astream(self, query: str, params: Optional[tuple] = None, tamanho_lote: int = 500):
+        """
+        Gerador assíncrono de linhas com cursor no servidor (SSDictCursor):
+        as linhas são lidas em lotes de ``tamanho_lote`` conforme consumidas,
+        sem materializar o resultado inteiro em memória. A conexão fica presa
+        até o gerador terminar ou ser fechado.
+        """
+        inicio = time.perf_counter()
+        linhas = 0
+        async with self.atransaction() as conn:
+            obtida = time.perf_counter()
+            async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+                await cursor.execute(query, params)
+                while True:
+                    lote = await cursor.fetchmany(tamanho_lote)
+                    if not lote:
+                        break
+                    linhas += len(lote)
+                    for linha in lote:
+                        yield linha
+        self.query_stats.registrar(query, time.perf_counter() - obtida, linhas, obtida - inicio)
+
+    async def aexecute(self, query: str, params: Optional[tuple] = None) -> int:
+        """Versão assíncrona de execute_update"""
+        inicio = time.perf_counter()
+        async with self.atransaction() as conn:
+            obtida = time.perf_counter()
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params)
+                linhas = cursor.rowcount
+        self.query_stats.registrar(query, time.perf_counter() - obtida, linhas, obtida - inicio)
+        return linhas
+
+    async def aexecute_many(self, query: str, params_list: List[tuple]) -> int:
+        """Versão assíncrona de execute_many"""
+        inicio = time.perf_counter()
+        async with self.atransaction() as conn:
+            obtida = time.perf_counter()
+            async with conn.cursor() as cursor:
+                await cursor.executemany(query, params_list)
+                linhas = cursor.rowcount
+        self.query_stats.registrar(query, time.perf_counter() - obtida, linhas, obtida - inicio)
+        return linhas
+
+    async def aclose(self):
+        """Fecha o pool assíncrono (chamar no shutdown da aplicação)"""
+        if self._async_pool is not None:
+            self._async_pool.close()
+            await self._async_pool.wait_closed()
+            self._async_pool = None
+            self._async_pool_loop = None
 
     def execute_query(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
         """Executa uma query SELECT e retorna os resultados"""
+        inicio = time.perf_counter()
         with self.get_connection() as conn:
+            obtida = time.perf_counter()
             with conn.cursor() as cursor:
                 cursor.execute(query, params)
-                return cursor.fetchall()
+                resultado = cursor.fetchall()
+        self.query_stats.registrar(query, time.perf_counter() - obtida, len(resultado), obtida - inicio)
+        return resultado
 
     def execute_update(self, query: str, params: Optional[tuple] = None) -> int:
         """Executa uma query INSERT/UPDATE/DELETE e retorna o número de linhas afetadas"""
+        inicio = time.perf_counter()
         with self.get_connection() as conn:
+            obtida = time.perf_counter()
             with conn.cursor() as cursor:
                 cursor.execute(query, params)
-                return cursor.rowcount
+                linhas = cursor.rowcount
+        self.query_stats.registrar(query, time.perf_counter() - obtida, linhas, obtida - inicio)
+        return linhas
 
     def execute_many(self, query: str, params_list: List[tuple]) -> int:
         """Executa múltiplas operações em batch"""
+        inicio = time.perf_counter()
         with self.get_connection() as conn:
+            obtida = time.perf_counter()
             with conn.cursor() as cursor:
                 cursor.executemany(query, params_list)
-                return cursor.rowcount
+                linhas = cursor.rowcount
+        self.query_stats.registrar(query, time.perf_counter() - obtida, linhas, obtida - inicio)
+        return linhas
 
 
 # Instância global do banco de dados
@@ -86,6 +663,303 @@ class ConfigCache:
 _config_cache = ConfigCache()
 
 
+def _sem_acento(texto: str) -> str:
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', texto or '')
+        if unicodedata.category(c) != 'Mn'
+    )
+
+
+def _chave_plataforma(nome: str) -> str:
+    """Normaliza nome de plataforma: 'VivaReal', 'VIVA-REAL' e 'viva real' viram 'vivareal'"""
+    return ''.join(c for c in _sem_acento(nome).casefold() if c.isalnum())
+
+
+def normalizar_nome_municipio(nome: str) -> str:
+    """Chave de busca de município: 'São Paulo', 'SAO PAULO' e 'sao-paulo' viram 'sao paulo'"""
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', _sem_acento(nome).casefold().replace("'", ' ')).split())
+
+
+def _slug_hifen(nome: str, sigla_estado: str) -> str:
+    return normalizar_nome_municipio(nome).replace(' ', '-')
+
+
+def _slug_hifen_uf(nome: str, sigla_estado: str) -> str:
+    return f"{_slug_hifen(nome, sigla_estado)}-{(sigla_estado or '').lower()}"
+
+
+# Formato do slug de cidade na URL de cada plataforma (chave de _chave_plataforma)
+FORMATOS_SLUG = {
+    'vivareal': _slug_hifen,
+    'zapimoveis': _slug_hifen,
+    'imovelweb': _slug_hifen_uf,
+}
+
+
+def slug_municipio(nome: str, plataforma: str = 'VivaReal', sigla_estado: str = '') -> str:
+    """Slug do município na URL da plataforma (sem consultar o banco)"""
+    formato = FORMATOS_SLUG.get(_chave_plataforma(plataforma), _slug_hifen)
+    return formato(nome, sigla_estado)
+
+
+# Nomes antigos ou grafias alternativas -> nome oficial em municipios, por UF
+ALIASES_MUNICIPIOS = {
+    ('Embu', 'SP'): 'Embu das Artes',
+    ('Moji Mirim', 'SP'): 'Mogi Mirim',
+    ('Moji-Guaçu', 'SP'): 'Mogi Guaçu',
+    ('Moji das Cruzes', 'SP'): 'Mogi das Cruzes',
+    ('Parati', 'RJ'): 'Paraty',
+    ('Itapagé', 'CE'): 'Itapajé',
+    ('Augusto Severo', 'RN'): 'Campo Grande',
+    ('Seridó', 'PB'): 'São Vicente do Seridó',
+    ('Santarém', 'PB'): 'Joca Claudino',
+    ('Campo de Santana', 'PB'): 'Tacima',
+    ('Presidente Castelo Branco', 'SC'): 'Presidente Castello Branco',
+    ('Bsb', 'DF'): 'Brasília',
+}
+
+# 'Cidade/UF', 'Cidade - UF' ou 'Cidade, UF'
+_RE_CIDADE_UF = re.compile(r'^(.+?)\s*[/,\-]\s*([A-Za-z]{2})\s*$')
+
+
+class ReferenceData:
+    """
+    Snapshot imutável das tabelas de dimensão (plataformas, tipos_busca,
+    estados e municipios) com índices em memória para lookup O(1).
+    """
+
+    def __init__(self, plataformas: List[Dict[str, Any]], tipos_busca: List[Dict[str, Any]],
+                 estados: List[Dict[str, Any]], municipios: List[Dict[str, Any]]):
+        self.plataformas = plataformas
+        self.tipos_busca = tipos_busca
+        self.estados = estados
+        self.municipios = municipios
+
+        self.plataformas_por_id = {p['id']: p for p in plataformas}
+        self.plataformas_por_nome = {p['nome']: p for p in plataformas}
+        self.plataformas_por_alias = {}
+        for p in plataformas:
+            # Em caso de colisão de alias, a plataforma ativa tem prioridade
+            chave = _chave_plataforma(p['nome'])
+            atual = self.plataformas_por_alias.get(chave)
+            if atual is None or (not atual.get('ativo') and p.get('ativo')):
+                self.plataformas_por_alias[chave] = p
+
+        self.tipos_busca_por_id = {t['id']: t for t in tipos_busca}
+        self.tipos_busca_por_nome = {t['nome'].upper(): t for t in tipos_busca}
+
+        self.estados_por_id = {e['id']: e for e in estados}
+        self.estados_por_sigla = {e['sigla'].upper(): e for e in estados}
+
+        # Índice de resolução: nome normalizado (sem acento/caixa/hífen) e aliases
+        # por UF, nomes únicos no país e o slug de cada plataforma, tudo pré-calculado
+        self.municipios_por_id = {m['id']: m for m in municipios}
+        self._cidades_ativas: Optional[List[Dict[str, Any]]] = None
+        self.municipios_por_nome = {}
+        por_nome_nacional: Dict[str, List[Dict[str, Any]]] = {}
+        for m in municipios:
+            estado = self.estados_por_id.get(m['estado_id'])
+            if estado:
+                chave = normalizar_nome_municipio(m['nome'])
+                self.municipios_por_nome[(chave, estado['sigla'].upper())] = m
+                por_nome_nacional.setdefault(chave, []).append(m)
+        for (alias, sigla), oficial in ALIASES_MUNICIPIOS.items():
+            m = self.municipios_por_nome.get((normalizar_nome_municipio(oficial), sigla))
+            if m is not None:
+                self.municipios_por_nome.setdefault((normalizar_nome_municipio(alias), sigla), m)
+                por_nome_nacional.setdefault(normalizar_nome_municipio(alias), []).append(m)
+        self.municipios_unicos = {
+            chave: lista[0] for chave, lista in por_nome_nacional.items() if len(lista) == 1
+        }
+
+        self.slugs: Dict[str, Dict[int, str]] = {}
+        for p in plataformas:
+            chave_plat = _chave_plataforma(p['nome'])
+            if chave_plat in self.slugs:
+                continue
+            formato = FORMATOS_SLUG.get(chave_plat, _slug_hifen)
+            self.slugs[chave_plat] = {
+                m['id']: formato(m['nome'], self.estados_por_id[m['estado_id']]['sigla'])
+                for m in municipios if m['estado_id'] in self.estados_por_id
+            }
+
+    def plataforma(self, nome: str, somente_ativas: bool = True) -> Optional[Dict[str, Any]]:
+        """Busca plataforma por nome exato, alias normalizado ou, por último, substring"""
+        plataforma = self.plataformas_por_nome.get(nome)
+        if plataforma is None:
+            chave = _chave_plataforma(nome)
+            plataforma = self.plataformas_por_alias.get(chave)
+            if plataforma is None and chave:
+                # Equivalente ao antigo fallback LIKE '%nome%' (poucas linhas)
+                for alias, candidata in self.plataformas_por_alias.items():
+                    if chave in alias and (candidata.get('ativo') or not somente_ativas):
+                        plataforma = candidata
+                        break
+        if plataforma is None or (somente_ativas and not plataforma.get('ativo')):
+            return None
+        return plataforma
+
+    def plataforma_id(self, nome: str, somente_ativas: bool = True) -> Optional[int]:
+        plataforma = self.plataforma(nome, somente_ativas)
+        return plataforma['id'] if plataforma else None
+
+    def tipo_busca_id(self, nome: str) -> Optional[int]:
+        tipo = self.tipos_busca_por_nome.get((nome or '').upper())
+        return tipo['id'] if tipo else None
+
+    def estado(self, sigla: str) -> Optional[Dict[str, Any]]:
+        return self.estados_por_sigla.get((sigla or '').upper())
+
+    def cidades_ativas(self) -> List[Dict[str, Any]]:
+        """Municípios ativos de estados ativos, por sigla e nome (calculado uma vez por carga)"""
+        if self._cidades_ativas is None:
+            cidades = []
+            for m in self.municipios:
+                estado = self.estados_por_id.get(m['estado_id'])
+                if estado and m.get('ativo') and estado.get('ativo'):
+                    cidades.append({
+                        'id': m['id'],
+                        'nome': m['nome'],
+                        'estado_id': m['estado_id'],
+                        'estado_nome': estado['nome'],
+                        'estado_sigla': estado['sigla'],
+                    })
+            cidades.sort(key=lambda c: (c['estado_sigla'], _sem_acento(c['nome']).casefold()))
+            self._cidades_ativas = cidades
+        return self._cidades_ativas
+
+    def municipio(self, nome: str, sigla_estado: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca município por nome livre, sem diferenciar acentos, maiúsculas ou
+        hífens, aceitando aliases. Sem ``sigla_estado``, aceita 'Cidade/UF' (ou
+        'Cidade - UF', 'Cidade, UF') ou um nome que só existe numa UF.
+        """
+        sigla = (sigla_estado or '').strip().upper()
+        if not sigla:
+            m = _RE_CIDADE_UF.match(nome or '')
+            if m and m.group(2).upper() in self.estados_por_sigla:
+                nome, sigla = m.group(1), m.group(2).upper()
+        chave = normalizar_nome_municipio(nome)
+        if sigla:
+            return self.municipios_por_nome.get((chave, sigla))
+        return self.municipios_unicos.get(chave)
+
+    def slug(self, municipio_id: int, plataforma: str = 'VivaReal') -> Optional[str]:
+        """Slug pré-calculado do município na URL da plataforma"""
+        chave_plat = _chave_plataforma(plataforma)
+        slugs = self.slugs.get(chave_plat)
+        if slugs is not None:
+            return slugs.get(municipio_id)
+        m = self.municipios_por_id.get(municipio_id)
+        estado = self.estados_por_id.get(m['estado_id']) if m else None
+        return slug_municipio(m['nome'], plataforma, estado['sigla']) if estado else None
+
+    def resolver_municipio(self, nome: str, sigla_estado: Optional[str] = None,
+                           plataforma: str = 'VivaReal') -> Optional[Dict[str, Any]]:
+        """Texto livre -> {'municipio_id', 'estado_id', 'sigla', 'nome', 'slug'}"""
+        m = self.municipio(nome, sigla_estado)
+        if m is None:
+            return None
+        return {
+            'municipio_id': m['id'],
+            'estado_id': m['estado_id'],
+            'sigla': self.estados_por_id[m['estado_id']]['sigla'],
+            'nome': m['nome'],
+            'slug': self.slug(m['id'], plataforma),
+        }
+
+
+class ReferenceDataCache:
+    """
+    Cache de processo para ReferenceData. As quatro tabelas são carregadas
+    juntas, numa única conexão, e recarregadas após ``ttl`` segundos ou
+    depois de ``invalidate()``. Se a recarga falhar, o snapshot anterior
+    continua sendo servido.
+    """
+
+    QUERIES = {
+        'plataformas': "SELECT id, nome, url_base, ativo FROM plataformas ORDER BY nome",
+        'tipos_busca': "SELECT id, nome FROM tipos_busca ORDER BY nome",
+        'estados': "SELECT id, nome, sigla, ativo FROM estados ORDER BY sigla",
+        'municipios': "SELECT id, nome, estado_id, ativo FROM municipios",
+    }
+
+    def __init__(self, database: DatabaseConnection, ttl: float = 300):
+        self.database = database
+        self.ttl = ttl
+        self._snapshot: Optional[ReferenceData] = None
+        self._expira_em = 0.0
+        self._lock = threading.Lock()
+        self._alock: Optional[asyncio.Lock] = None
+        self._alock_loop = None
+
+    def _stale(self) -> bool:
+        return self._snapshot is None or time.monotonic() >= self._expira_em
+
+    def _publicar(self, tabelas: Dict[str, List[Dict[str, Any]]]) -> ReferenceData:
+        self._snapshot = ReferenceData(**tabelas)
+        self._expira_em = time.monotonic() + self.ttl
+        logger.info(f"Dados de referência carregados: {len(tabelas['municipios'])} municípios")
+        return self._snapshot
+
+    def _usar_ou_falhar(self, erro: Exception) -> ReferenceData:
+        if self._snapshot is None:
+            raise erro
+        logger.warning(f"Falha ao recarregar dados de referência, usando snapshot anterior: {erro}")
+        # Adia nova tentativa por um TTL para não martelar um banco indisponível
+        self._expira_em = time.monotonic() + self.ttl
+        return self._snapshot
+
+    def get(self) -> ReferenceData:
+        """Retorna o snapshot atual, recarregando de forma síncrona se expirado"""
+        if not self._stale():
+            return self._snapshot
+        with self._lock:
+            if not self._stale():
+                return self._snapshot
+            try:
+                tabelas = {}
+                with self.database.get_connection() as conn:
+                    with self.database.cursor(conn) as cursor:
+                        for nome, query in self.QUERIES.items():
+                            cursor.execute(query)
+                            tabelas[nome] = list(cursor.fetchall())
+                return self._publicar(tabelas)
+            except Exception as e:
+                return self._usar_ou_falhar(e)
+
+    async def aget(self) -> ReferenceData:
+        """Versão assíncrona de get(), usando o pool aiomysql"""
+        if not self._stale():
+            return self._snapshot
+        # Um lock por event loop, como o pool aiomysql
+        loop = asyncio.get_running_loop()
+        if self._alock is None or self._alock_loop is not loop:
+            self._alock = asyncio.Lock()
+            self._alock_loop = loop
+        async with self._alock:
+            # Corrotinas que esperaram o lock usam a carga de quem o segurava
+            if not self._stale():
+                return self._snapshot
+            try:
+                tabelas = {}
+                async with self.database.atransaction() as conn:
+                    async with self.database.acursor(conn) as cursor:
+                        for nome, query in self.QUERIES.items():
+                            await cursor.execute(query)
+                            tabelas[nome] = list(await cursor.fetchall())
+                return self._publicar(tabelas)
+            except Exception as e:
+                return self._usar_ou_falhar(e)
+
+    def invalidate(self):
+        """Força a recarga no próximo acesso"""
+        self._expira_em = 0.0
+
+
+refdata = ReferenceDataCache(db, ttl=float(os.getenv('REFDATA_TTL', '300')))
+
+
 def get_config(chave: str, default: Any = None) -> Any:
     """Obtém uma configuração do banco de dados"""
     cached = _config_cache.get(chave)
@@ -168,44 +1042,550 @@ def get_plataformas_ativas() -> List[Dict[str, Any]]:
         return []
 
 
-def salvar_links_duckduckgo_batch(links_com_dados: List[Dict[str, Any]]) -> int:
-    """Salva múltiplos links do DuckDuckGo em batch"""
+async def aget_plataformas_ativas() -> List[Dict[str, Any]]:
+    """Versão assíncrona de get_plataformas_ativas"""
     try:
-        if not links_com_dados:
-            return 0
-
         query = """
-            INSERT IGNORE INTO links_duckduckgo 
-            (url, plataforma_id, tipo_busca_id, estado_id, municipio_id, 
-             distrito_id, termo_busca, posicao_busca)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        SELECT id, nome, url_base 
+        FROM plataformas 
+        WHERE ativo = 1
+        ORDER BY nome
         """
+        return await db.afetch(query)
+    except Exception as e:
+        logger.error(f"Erro ao buscar plataformas ativas: {e}")
+        return []
+
+
+_INSERT_LINKS = """
+    INSERT IGNORE INTO links_duckduckgo 
+    (url, plataforma_id, tipo_busca_id, estado_id, municipio_id, 
+     distrito_id, termo_busca, posicao_busca, processado, created_at)
+    VALUES {valores}
+"""
+_VALORES_LINK = "(%s, %s, %s, %s, %s, %s, %s, %s, 0, NOW())"
+
+
+def _preparar_lote_links(links: List[Dict[str, Any]],
+                         ref: Optional[ReferenceData]) -> List[tuple]:
+    """Converte dicts de links em tuplas de INSERT, descartando os sem url/plataforma"""
+    linhas = []
+    for dados in links:
+        plataforma_id = dados.get('plataforma_id')
+        if not plataforma_id and dados.get('plataforma') and ref:
+            plataforma_id = ref.plataforma_id(dados['plataforma'], somente_ativas=False)
+        tipo_busca_id = dados.get('tipo_busca_id')
+        if not tipo_busca_id and dados.get('tipo_busca') and ref:
+            tipo_busca_id = ref.tipo_busca_id(dados['tipo_busca'])
 
-        params_list = []
-        for dados in links_com_dados:
-            plataforma_data = db.execute_query(
-                "SELECT id FROM plataformas WHERE nome = %s",
-                (dados['plataforma'],)
+        if not dados.get('url') or not plataforma_id:
+            continue
+
+        linhas.append((
+            dados['url'],
+            plataforma_id,
+            tipo_busca_id,
+            dados.get('estado_id'),
+            dados.get('municipio_id'),
+            dados.get('distrito_id'),
+            dados.get('termo_busca'),
+            dados.get('posicao_busca', 0)
+        ))
+    return linhas
+
+
+def _precisa_refdata(links: List[Dict[str, Any]]) -> bool:
+    return any(
+        (not d.get('plataforma_id') and d.get('plataforma'))
+        or (not d.get('tipo_busca_id') and d.get('tipo_busca'))
+        for d in links
+    )
+
+
+def _chunks(linhas: List[tuple], tamanho: int):
+    for inicio in range(0, len(linhas), tamanho):
+        yield linhas[inicio:inicio + tamanho]
+
+
+def _sql_chunk(chunk: List[tuple]) -> Tuple[str, tuple]:
+    query = _INSERT_LINKS.format(valores=", ".join([_VALORES_LINK] * len(chunk)))
+    params = tuple(valor for linha in chunk for valor in linha)
+    return query, params
+
+
+def ingerir_links(links: List[Dict[str, Any]], chunk_size: int = 500) -> Dict[str, int]:
+    """
+    Insere links em links_duckduckgo em lote.
+
+    Cada item traz ``url`` e ``plataforma_id`` (ou ``plataforma`` pelo nome),
+    além dos opcionais ``tipo_busca_id``/``tipo_busca``, ``estado_id``,
+    ``municipio_id``, ``distrito_id``, ``termo_busca`` e ``posicao_busca``.
+    Os IDs de dimensão são resolvidos uma única vez pelo cache de referência
+    e cada chunk vira um único ``INSERT IGNORE`` multi-linha, todos na mesma
+    transação. URLs já existentes (chave única) contam como ignoradas.
+    """
+    if not links:
+        return {'inseridos': 0, 'ignorados': 0}
+
+    ref = refdata.get() if _precisa_refdata(links) else None
+    linhas = _preparar_lote_links(links, ref)
+
+    inseridos = 0
+    if linhas:
+        with db.get_connection() as conn:
+            with db.cursor(conn) as cursor:
+                for chunk in _chunks(linhas, chunk_size):
+                    cursor.execute(*_sql_chunk(chunk))
+                    inseridos += cursor.rowcount
+
+    return {'inseridos': inseridos, 'ignorados': len(links) - inseridos}
+
+
+async def aingerir_links(links: List[Dict[str, Any]], chunk_size: int = 500) -> Dict[str, int]:
+    """Versão assíncrona de ingerir_links"""
+    if not links:
+        return {'inseridos': 0, 'ignorados': 0}
+
+    ref = await refdata.aget() if _precisa_refdata(links) else None
+    linhas = _preparar_lote_links(links, ref)
+
+    inseridos = 0
+    if linhas:
+        async with db.atransaction() as conn:
+            async with db.acursor(conn) as cursor:
+                for chunk in _chunks(linhas, chunk_size):
+                    await cursor.execute(*_sql_chunk(chunk))
+                    inseridos += cursor.rowcount
+
+    return {'inseridos': inseridos, 'ignorados': len(links) - inseridos}
+
+
+# Quem ainda é o link único das combinações do chunk, mas com outra URL, volta a
+# ser um link comum (link_unico NULL) antes do upsert
+_REBAIXAR_LINKS_UNICOS = """
+    UPDATE links_duckduckgo SET link_unico = NULL
+    WHERE link_unico = 1
+    AND (plataforma_id, tipo_busca_id, estado_id, municipio_id) IN ({combinacoes})
+    AND (plataforma_id, tipo_busca_id, estado_id, municipio_id, url) NOT IN ({links})
+"""
+# A URL pode já existir como link de SERP (uk_url): a linha é promovida a link
+# único da combinação em vez de ganhar uma duplicata
+_UPSERT_LINK_UNICO = """
+    INSERT INTO links_duckduckgo 
+    (url, plataforma_id, tipo_busca_id, estado_id, municipio_id, 
+     distrito_id, termo_busca, posicao_busca, processado, link_unico, created_at)
+    VALUES {valores}
+    ON DUPLICATE KEY UPDATE
+        plataforma_id = VALUES(plataforma_id), tipo_busca_id = VALUES(tipo_busca_id),
+        estado_id = VALUES(estado_id), municipio_id = VALUES(municipio_id),
+        termo_busca = VALUES(termo_busca), posicao_busca = 1, link_unico = 1, updated_at = NOW()
+"""
+_VALORES_LINK_UNICO = "(%s, %s, %s, %s, %s, NULL, %s, 1, 0, 1, NOW())"
+
+_INSERT_LOG_BUSCA = """
+    INSERT INTO logs_busca 
+    (motor_busca, query, plataforma_id, municipio_id, 
+     links_encontrados, links_salvos, data_execucao, observacao)
+    VALUES {valores}
+"""
+_VALORES_LOG_BUSCA = "(%s, %s, %s, %s, %s, %s, NOW(), %s)"
+
+
+def _sql_upsert_links_unicos(itens: List[Dict[str, Any]]) -> List[Tuple[str, tuple]]:
+    """
+    Monta o rebaixamento dos links únicos substituídos, o upsert multi-linha
+    dos links e o INSERT dos logs correspondentes
+    """
+    # Uma linha por combinação e por URL (a última vence), para que o upsert
+    # não esbarre em uk_link_unico ou uk_url dentro do próprio chunk
+    por_combinacao = {}
+    for item in itens:
+        por_combinacao[(item['plataforma_id'], item['tipo_busca_id'],
+                        item['estado_id'], item['municipio_id'])] = item
+    links = list({item['url']: item for item in por_combinacao.values()}.values())
+
+    combinacoes = [tuple(item[c] for c in ('plataforma_id', 'tipo_busca_id', 'estado_id', 'municipio_id'))
+                   for item in links]
+    comandos = [
+        (
+            _REBAIXAR_LINKS_UNICOS.format(
+                combinacoes=", ".join(["(%s, %s, %s, %s)"] * len(links)),
+                links=", ".join(["(%s, %s, %s, %s, %s)"] * len(links))
+            ),
+            tuple(v for combinacao in combinacoes for v in combinacao)
+            + tuple(v for combinacao, item in zip(combinacoes, links) for v in combinacao + (item['url'],))
+        ),
+        (
+            _UPSERT_LINK_UNICO.format(valores=", ".join([_VALORES_LINK_UNICO] * len(links))),
+            tuple(
+                valor for item in links for valor in (
+                    item['url'], item['plataforma_id'], item['tipo_busca_id'],
+                    item['estado_id'], item['municipio_id'], item.get('termo_busca')
+                )
             )
-            if plataforma_data:
-                params_list.append((
-                    dados['url'],
-                    plataforma_data[0]['id'],
-                    dados.get('tipo_busca_id'),
-                    dados.get('estado_id'),
-                    dados.get('municipio_id'),
-                    dados.get('distrito_id'),
-                    dados.get('termo_busca'),
-                    dados.get('posicao_busca', 0)
-                ))
-
-        if params_list:
-            rows = db.execute_many(query, params_list)
-            logger.info(f"Salvos {rows} links do DuckDuckGo")
-            return rows
+        ),
+    ]
+
+    # Só registra log para itens que informam o motor de busca
+    logs = [item for item in itens if item.get('motor_busca')]
+    if logs:
+        comandos.append((
+            _INSERT_LOG_BUSCA.format(valores=", ".join([_VALORES_LOG_BUSCA] * len(logs))),
+            tuple(
+                valor for item in logs for valor in (
+                    item['motor_busca'], item.get('termo_busca'), item['plataforma_id'],
+                    item['municipio_id'], 1, 1, item.get('observacao')
+                )
+            )
+        ))
+    return comandos
+
+
+def upsert_links_unicos(itens: List[Dict[str, Any]], chunk_size: int = 500) -> int:
+    """
+    Grava o link único de cada combinação (plataforma, tipo_busca, estado,
+    municipio) com ``INSERT ... ON DUPLICATE KEY UPDATE``. O link único
+    anterior da combinação, se tiver outra URL, vira um link comum; uma URL
+    que já existia como link de SERP é promovida a link único.
+
+    Cada item traz ``url``, ``plataforma_id``, ``tipo_busca_id``,
+    ``estado_id``, ``municipio_id`` e, opcionalmente, ``termo_busca``. Itens
+    com ``motor_busca`` (e ``observacao``) também geram a linha de
+    logs_busca. Links e logs de todo o lote são gravados numa única
+    transação. Retorna o número de itens gravados.
+    """
+    if not itens:
         return 0
-    except Exception as e:
-        logger.error(f"Erro ao salvar links do DuckDuckGo em batch: {e}")
+    with db.get_connection() as conn:
+        with db.cursor(conn) as cursor:
+            for inicio in range(0, len(itens), chunk_size):
+                for query, params in _sql_upsert_links_unicos(itens[inicio:inicio + chunk_size]):
+                    cursor.execute(query, params)
+    return len(itens)
+
+
+async def aupsert_links_unicos(itens: List[Dict[str, Any]], chunk_size: int = 500) -> int:
+    """Versão assíncrona de upsert_links_unicos"""
+    if not itens:
         return 0
+    async with db.atransaction() as conn:
+        async with db.acursor(conn) as cursor:
+            for inicio in range(0, len(itens), chunk_size):
+                for query, params in _sql_upsert_links_unicos(itens[inicio:inicio + chunk_size]):
+                    await cursor.execute(query, params)
+    return len(itens)
+
+
+async def abuscar_link_unico(plataforma_id: int, tipo_busca_id: int, estado_id: int,
+                             municipio_id: int) -> Optional[Dict[str, Any]]:
+    """Link único salvo para a combinação (via uk_link_unico), com a data da última atualização"""
+    rows = await db.afetch(
+        """SELECT id, url, termo_busca,
+                  GREATEST(COALESCE(updated_at, created_at),
+                           COALESCE(created_at, updated_at)) AS atualizado_em
+           FROM links_duckduckgo
+           WHERE plataforma_id = %s AND tipo_busca_id = %s
+           AND estado_id = %s AND municipio_id = %s AND link_unico = 1""",
+        (plataforma_id, tipo_busca_id, estado_id, municipio_id)
+    )
+    return rows[0] if rows else None
+
+
+_PLANO_CICLO = """
+    SELECT m.id AS municipio_id, m.nome AS cidade,
+           e.id AS estado_id, e.nome AS estado_nome, e.sigla AS estado_sigla,
+           p.id AS plataforma_id, p.nome AS plataforma_nome, p.url_base AS plataforma_url,
+           t.id AS tipo_busca_id, t.nome AS tipo_busca,
+           u.ultima_atualizacao
+    FROM municipios m
+    JOIN estados e ON m.estado_id = e.id
+    CROSS JOIN plataformas p
+    CROSS JOIN tipos_busca t
+    LEFT JOIN (
+        SELECT plataforma_id, tipo_busca_id, estado_id, municipio_id,
+               MAX(GREATEST(COALESCE(updated_at, created_at),
+                            COALESCE(created_at, updated_at))) AS ultima_atualizacao
+        FROM links_duckduckgo
+        GROUP BY plataforma_id, tipo_busca_id, estado_id, municipio_id
+    ) u ON u.plataforma_id = p.id AND u.tipo_busca_id = t.id
+       AND u.estado_id = e.id AND u.municipio_id = m.id
+    WHERE m.ativo = 1 AND e.ativo = 1 AND p.ativo = 1
+      AND (u.ultima_atualizacao IS NULL
+           OR u.ultima_atualizacao <= NOW() - INTERVAL %s HOUR)
+      {filtros}
+    ORDER BY u.ultima_atualizacao IS NOT NULL, u.ultima_atualizacao,
+             e.sigla, m.nome, p.nome, t.nome
+    {limite}
+"""
+
+
+def _sql_plano_ciclo(max_idade_horas: int, plataforma_ids: Optional[List[int]],
+                     tipo_busca_ids: Optional[List[int]], limite: Optional[int]) -> Tuple[str, tuple]:
+    filtros = []
+    params: List[Any] = [max_idade_horas]
+    if plataforma_ids:
+        filtros.append(f"AND p.id IN ({', '.join(['%s'] * len(plataforma_ids))})")
+        params.extend(plataforma_ids)
+    if tipo_busca_ids:
+        filtros.append(f"AND t.id IN ({', '.join(['%s'] * len(tipo_busca_ids))})")
+        params.extend(tipo_busca_ids)
+    sql_limite = ""
+    if limite:
+        sql_limite = "LIMIT %s"
+        params.append(limite)
+    query = _PLANO_CICLO.format(filtros="\n      ".join(filtros), limite=sql_limite)
+    return query, tuple(params)
+
+
+def _total_combinacoes(ref: ReferenceData, plataforma_ids: Optional[List[int]],
+                       tipo_busca_ids: Optional[List[int]]) -> int:
+    estados_ativos = {e['id'] for e in ref.estados if e.get('ativo')}
+    cidades = sum(1 for m in ref.municipios if m.get('ativo') and m['estado_id'] in estados_ativos)
+    plataformas = sum(
+        1 for p in ref.plataformas
+        if p.get('ativo') and (not plataforma_ids or p['id'] in plataforma_ids)
+    )
+    tipos = sum(1 for t in ref.tipos_busca if not tipo_busca_ids or t['id'] in tipo_busca_ids)
+    return cidades * plataformas * tipos
+
+
+def planejar_ciclo(max_idade_horas: int = 24, plataforma_ids: Optional[List[int]] = None,
+                   tipo_busca_ids: Optional[List[int]] = None,
+                   limite: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Calcula, numa única query, quais combinações (cidade × plataforma ×
+    tipo_busca) ativas estão sem link ou com link mais antigo que
+    ``max_idade_horas``.
+
+    Retorna ``{'pendentes': [...], 'total_combinacoes': int}``. Os pendentes
+    vêm ordenados: nunca capturados primeiro, depois do mais antigo para o
+    mais recente.
+    """
+    query, params = _sql_plano_ciclo(max_idade_horas, plataforma_ids, tipo_busca_ids, limite)
+    pendentes = db.execute_query(query, params)
+    return {
+        'pendentes': pendentes,
+        'total_combinacoes': _total_combinacoes(refdata.get(), plataforma_ids, tipo_busca_ids)
+    }
+
+
+async def aplanejar_ciclo(max_idade_horas: int = 24, plataforma_ids: Optional[List[int]] = None,
+                          tipo_busca_ids: Optional[List[int]] = None,
+                          limite: Optional[int] = None) -> Dict[str, Any]:
+    """Versão assíncrona de planejar_ciclo"""
+    query, params = _sql_plano_ciclo(max_idade_horas, plataforma_ids, tipo_busca_ids, limite)
+    pendentes = await db.afetch(query, params)
+    return {
+        'pendentes': pendentes,
+        'total_combinacoes': _total_combinacoes(await refdata.aget(), plataforma_ids, tipo_busca_ids)
+    }
+
+
+@contextmanager
+def _travar_arquivo(caminho: str, bloquear: bool = True):
+    """
+    Trava exclusiva entre processos (flock em ``caminho``). Retorna False se
+    ``bloquear`` for False e outro processo já tiver a trava.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(caminho, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if bloquear else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LogBuscaBuffer:
+    """
+    Sink write-behind para logs_busca.
+
+    ``registrar()`` só enfileira o registro em memória; uma thread em segundo
+    plano grava lotes multi-linha quando a fila atinge ``batch_size`` ou a
+    cada ``flush_interval`` segundos. Se o banco estiver inacessível, os
+    registros vão para ``spill_path`` (JSON lines) e são reenviados no
+    próximo flush bem-sucedido.
+
+    O spill pode ser compartilhado pelos workers (API_WORKERS > 1): a escrita
+    e a troca do arquivo usam ``spill_path.lock`` e só um processo por vez
+    reenvia (``spill_path.replay.lock``), então nenhum registro é gravado
+    duas vezes.
+    """
+
+    COLUNAS = ('motor_busca', 'query', 'plataforma_id', 'municipio_id',
+               'links_encontrados', 'links_salvos', 'data_execucao', 'observacao')
+
+    def __init__(self, database: DatabaseConnection, batch_size: int = 100,
+                 flush_interval: float = 5.0, max_pendentes: int = 10000,
+                 spill_path: str = 'logs_busca_pendentes.jsonl'):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pendentes = max_pendentes
+        self.spill_path = spill_path
 
+        self._fila = deque()
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._encerrando = False
+        self.stats = {'registrados': 0, 'gravados': 0, 'em_disco': 0, 'reenviados': 0, 'falhas_flush': 0}
 
+    def registrar(self, motor_busca: str, query: str, plataforma_id: Optional[int],
+                  municipio_id: Optional[int], links_encontrados: int = 0,
+                  links_salvos: int = 0, observacao: Optional[str] = None):
+        """Enfileira um registro de logs_busca sem tocar no banco"""
+        registro = {
+            'motor_busca': motor_busca,
+            'query': query,
+            'plataforma_id': plataforma_id,
+            'municipio_id': municipio_id,
+            'links_encontrados': links_encontrados,
+            'links_salvos': links_salvos,
+            'data_execucao': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'observacao': observacao,
+        }
+        transbordo = None
+        with self._lock:
+            self.stats['registrados'] += 1
+            self._fila.append(registro)
+            if len(self._fila) > self.max_pendentes:
+                # Memória limitada: o excedente vai direto para o disco
+                transbordo = [self._fila.popleft() for _ in range(len(self._fila) - self.max_pendentes)]
+            cheia = len(self._fila) >= self.batch_size
+        if transbordo:
+            self._spill(transbordo)
+        self._iniciar()
+        if cheia:
+            self._acordar.set()
+
+    def _iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name='logs-busca-writer', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._encerrando:
+            self._acordar.wait(self.flush_interval)
+            self._acordar.clear()
+            self.flush()
+
+    def _inserir(self, registros: List[Dict[str, Any]]):
+        valores = "(" + ", ".join(["%s"] * len(self.COLUNAS)) + ")"
+        with self.database.get_connection() as conn:
+            with self.database.cursor(conn) as cursor:
+                for inicio in range(0, len(registros), self.batch_size):
+                    lote = registros[inicio:inicio + self.batch_size]
+                    cursor.execute(
+                        f"INSERT INTO logs_busca ({', '.join(self.COLUNAS)}) "
+                        f"VALUES {', '.join([valores] * len(lote))}",
+                        tuple(r.get(c) for r in lote for c in self.COLUNAS)
+                    )
+
+    def _spill(self, registros: List[Dict[str, Any]]):
+        try:
+            with self._io_lock, _travar_arquivo(self.spill_path + '.lock'), \
+                    open(self.spill_path, 'a', encoding='utf-8') as f:
+                for registro in registros:
+                    f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            with self._lock:
+                self.stats['em_disco'] += len(registros)
+        except Exception as e:
+            logger.error(f"Erro ao gravar logs_busca pendentes em {self.spill_path}: {e}")
+
+    def _ler_spill(self) -> List[Dict[str, Any]]:
+        """Move o arquivo de spill para o lado e retorna seus registros"""
+        replay_path = self.spill_path + '.replay'
+        with self._io_lock, _travar_arquivo(self.spill_path + '.lock'):
+            if os.path.exists(self.spill_path) and not os.path.exists(replay_path):
+                os.replace(self.spill_path, replay_path)
+            if not os.path.exists(replay_path):
+                return []
+            with open(replay_path, encoding='utf-8') as f:
+                return [json.loads(linha) for linha in f if linha.strip()]
+
+    def _tem_spill(self) -> bool:
+        return os.path.exists(self.spill_path) or os.path.exists(self.spill_path + '.replay')
+
+    def _descartar_replay(self):
+        with self._io_lock:
+            try:
+                os.remove(self.spill_path + '.replay')
+            except FileNotFoundError:
+                pass
+
+    def flush(self):
+        """Grava tudo o que está na fila (e no spill, se houver)"""
+        with self._lock:
+            registros = list(self._fila)
+            self._fila.clear()
+        if not registros and not self._tem_spill():
+            return
+
+        try:
+            if registros:
+                self._inserir(registros)
+                with self._lock:
+                    self.stats['gravados'] += len(registros)
+        except Exception as e:
+            with self._lock:
+                self.stats['falhas_flush'] += 1
+            if registros:
+                logger.warning(f"Banco indisponível para logs_busca, {len(registros)} registros salvos em disco: {e}")
+                self._spill(registros)
+            return
+
+        try:
+            with _travar_arquivo(self.spill_path + '.replay.lock', bloquear=False) as minha_vez:
+                # Outro worker já está reenviando o mesmo arquivo
+                if not minha_vez:
+                    return
+                pendentes = self._ler_spill()
+                if pendentes:
+                    self._inserir(pendentes)
+                    self._descartar_replay()
+                    with self._lock:
+                        self.stats['reenviados'] += len(pendentes)
+                    logger.info(f"Reenviados {len(pendentes)} registros pendentes de logs_busca")
+        except Exception as e:
+            logger.warning(f"Falha ao reenviar logs_busca pendentes: {e}")
+
+    def close(self):
+        """Para a thread e faz o flush final"""
+        self._encerrando = True
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+
+log_busca = LogBuscaBuffer(
+    db,
+    batch_size=int(os.getenv('LOG_BUFFER_BATCH_SIZE', '100')),
+    flush_interval=float(os.getenv('LOG_BUFFER_FLUSH_INTERVAL', '5')),
+    spill_path=os.getenv('LOG_BUFFER_SPILL_PATH', 'logs_busca_pendentes.jsonl'),
+)
+atexit.register(log_busca.close)
+
+
+def salvar_links_duckduckgo_batch(links_com_dados: List[Dict[str, Any]]) -> int:
+    """Salva múltiplos links do DuckDuckGo em batch"""
+    try:
+        resultado = ingerir_links(links_com_dados)
+        if resultado['inseridos']:
+            logger.info(f"Salvos {resultado['inseridos']} links do DuckDuckGo")
+        return resultado['inseridos']
+    except Exception as e:
+        logger.error(f"Erro ao salvar links do DuckDuckGo em batch: {e}")
+        return 0
@@ -0,0 +1,215 @@
+"""
+Estado compartilhado entre os workers do uvicorn (modo multi-processo)
+
+Com API_WORKERS > 1 cada processo tem seu próprio event loop, pool de
+navegadores e caches; o que precisa ser visto por todos (voos do
+single-flight, ritmo por domínio, jobs em execução e workers vivos) fica
+num SQLite local em modo WAL. As chamadas ao SQLite rodam em threads
+(asyncio.to_thread), cada thread com a sua conexão.
+
+Os horários gravados são time.time(), comparáveis entre processos.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS voos (
+    chave TEXT PRIMARY KEY,
+    dono TEXT NOT NULL,
+    expira_em REAL NOT NULL,
+    resultado TEXT,
+    concluido_em REAL
+);
+CREATE TABLE IF NOT EXISTS ritmo (
+    dominio TEXT PRIMARY KEY,
+    proximo REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs_executando (
+    job_id TEXT PRIMARY KEY,
+    worker TEXT NOT NULL
+);
+"""
+
+
+class EstadoCompartilhado:
+    """
+    Acesso ao SQLite compartilhado. ``worker_id`` identifica este processo
+    (host:pid:sufixo aleatório, para não confundir um pid reaproveitado).
+    Resultados de voos concluídos ficam ``retencao`` segundos na tabela.
+    """
+
+    def __init__(self, caminho: str, retencao: float = 60):
+        self.caminho = caminho
+        self.retencao = retencao
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: transações explícitas com BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _transacao(self, funcao, *args):
+        """Roda ``funcao(conn, *args)`` numa transação com lock de escrita"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            resultado = funcao(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return resultado
+
+    async def _rodar(self, funcao, *args):
+        return await asyncio.to_thread(self._transacao, funcao, *args)
+
+    # Single-flight entre workers
+
+    def _reservar_voo(self, conn, chave: str, ttl: float, desde: float) -> Tuple[bool, Optional[str]]:
+        agora = time.time()
+        conn.execute("DELETE FROM voos WHERE concluido_em IS NOT NULL AND expira_em < ?", (agora,))
+        linha = conn.execute(
+            "SELECT dono, expira_em, resultado, concluido_em FROM voos WHERE chave = ?", (chave,)
+        ).fetchone()
+        if linha is not None:
+            if linha['concluido_em'] is not None and linha['concluido_em'] >= desde:
+                # Concluído depois que o chamador chegou: serve o resultado
+                return False, linha['resultado']
+            if linha['concluido_em'] is None and linha['expira_em'] > agora:
+                # Em andamento em algum worker vivo
+                return False, None
+        conn.execute(
+            "INSERT OR REPLACE INTO voos (chave, dono, expira_em, resultado, concluido_em) "
+            "VALUES (?, ?, ?, NULL, NULL)",
+            (chave, self.worker_id, agora + ttl)
+        )
+        return True, None
+
+    async def areservar_voo(self, chave: str, ttl: float, desde: float) -> Tuple[bool, Optional[str]]:
+        """
+        (True, None) se este worker assumiu o voo; (False, resultado) se um voo
+        concluído depois de ``desde`` já tem resultado; (False, None) se outro
+        worker está executando.
+        """
+        return await self._rodar(self._reservar_voo, chave, ttl, desde)
+
+    async def arenovar_voo(self, chave: str, ttl: float):
+        await self._rodar(lambda conn: conn.execute(
+            "UPDATE voos SET expira_em = ? WHERE chave = ? AND dono = ? AND concluido_em IS NULL",
+            (time.time() + ttl, chave, self.worker_id)
+        ))
+
+    async def aconcluir_voo(self, chave: str, resultado: str):
+        agora = time.time()
+        await self._rodar(lambda conn: conn.execute(
+            "UPDATE voos SET resultado = ?, concluido_em = ?, expira_em = ? WHERE chave = ? AND dono = ?",
+            (resultado, agora, agora + self.retencao, chave, self.worker_id)
+        ))
+
+    async def aabandonar_voo(self, chave: str):
+        """Libera a chave após falha ou cancelamento; quem espera assume"""
+        await self._rodar(lambda conn: conn.execute(
+            "DELETE FROM voos WHERE chave = ? AND dono = ? AND concluido_em IS NULL",
+            (chave, self.worker_id)
+        ))
+
+    # Ritmo por domínio
+
+    def _reservar_ritmo(self, conn, dominio: str, intervalo: float) -> float:
+        agora = time.time()
+        linha = conn.execute("SELECT proximo FROM ritmo WHERE dominio = ?", (dominio,)).fetchone()
+        inicio = max(agora, linha['proximo'] if linha else 0.0)
+        conn.execute(
+            "INSERT OR REPLACE INTO ritmo (dominio, proximo) VALUES (?, ?)", (dominio, inicio + intervalo)
+        )
+        return inicio - agora
+
+    async def areservar_ritmo(self, dominio: str, intervalo: float) -> float:
+        """Reserva o próximo horário livre do domínio; retorna quantos segundos esperar"""
+        return await self._rodar(self._reservar_ritmo, dominio, intervalo)
+
+    # Workers e jobs
+
+    async def aheartbeat(self):
+        await self._rodar(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO workers (id, pid, heartbeat) VALUES (?, ?, ?)",
+            (self.worker_id, os.getpid(), time.time())
+        ))
+
+    def _marcar_job(self, conn, job_id: str, max_idade: float) -> bool:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jobs_executando (job_id, worker) VALUES (?, ?)", (job_id, self.worker_id)
+        )
+        if cursor.rowcount:
+            return True
+        linha = conn.execute(
+            "SELECT j.worker, w.heartbeat FROM jobs_executando j LEFT JOIN workers w ON w.id = j.worker "
+            "WHERE j.job_id = ?", (job_id,)
+        ).fetchone()
+        if linha['worker'] == self.worker_id or (
+                linha['heartbeat'] is not None and linha['heartbeat'] >= time.time() - max_idade):
+            # Outra task deste processo ou um worker vivo já executa o job
+            return False
+        # Marca de um worker morto: assume
+        conn.execute("UPDATE jobs_executando SET worker = ? WHERE job_id = ?", (self.worker_id, job_id))
+        return True
+
+    async def amarcar_job(self, job_id: str, max_idade: float) -> bool:
+        """
+        Marca o job como executado por este worker. False se a marca já é de
+        um worker com heartbeat nos últimos ``max_idade`` s (a marca não é tocada).
+        """
+        return await self._rodar(self._marcar_job, job_id, max_idade)
+
+    async def adesmarcar_job(self, job_id: str):
+        await self._rodar(lambda conn: conn.execute(
+            "DELETE FROM jobs_executando WHERE job_id = ? AND worker = ?", (job_id, self.worker_id)
+        ))
+
+    def _jobs_vivos(self, conn, max_idade: float) -> Set[str]:
+        limite = time.time() - max_idade
+        conn.execute("DELETE FROM workers WHERE heartbeat < ?", (limite,))
+        conn.execute("DELETE FROM jobs_executando WHERE worker NOT IN (SELECT id FROM workers)")
+        return {linha['job_id'] for linha in conn.execute("SELECT job_id FROM jobs_executando")}
+
+    async def ajobs_em_workers_vivos(self, max_idade: float) -> Set[str]:
+        """Jobs marcados por workers com heartbeat nos últimos ``max_idade`` s (limpa os mortos)"""
+        return await self._rodar(self._jobs_vivos, max_idade)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'caminho': self.caminho, 'worker_id': self.worker_id}
+
+
+def _criar_estado() -> Optional[EstadoCompartilhado]:
+    caminho = os.getenv('ESTADO_COMPARTILHADO_PATH', '')
+    if not caminho:
+        return None
+    logger.info(f"🗂️ Estado compartilhado entre workers em {caminho}")
+    return EstadoCompartilhado(caminho, retencao=float(os.getenv('ESTADO_COMPARTILHADO_RETENCAO', '60')))
+
+
+# None em modo de um processo: cada módulo mantém o estado só em memória
+estado_compartilhado = _criar_estado()
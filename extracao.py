@@ -0,0 +1,96 @@
+"""
+Extração em uma única ida ao navegador: título, og:title, h1 e total de imóveis
+
+Um script roda uma vez na página e devolve tudo de uma vez, em vez de um
+query_selector/text_content por elemento. O seletor que encontrou o total
+fica memorizado por plataforma e é tentado primeiro na próxima página.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_JS_EXTRACAO = r"""
+(seletores) => {
+    // m[1]: "2,5 mil" / "1.200 mil"; m[2]: "2.500" / "2500" (mesmo critério de captura_http.parse_total)
+    const padrao = /(?:(\d{1,3}(?:[.\s]\d{3})+|\d+(?:[.,]\d+)?)\s*mil\s+|(\d{1,3}(?:[.,\s]\d{3})+|\d+)\s*)(im[óo]ve|resultado|an[úu]ncio)/i;
+    const milhar = /^\d{1,3}(?:[.\s]\d{3})+$/;
+    const palavra = /im[óo]ve|resultado|an[úu]ncio/i;
+
+    const candidato = (texto, seletor) => {
+        if (!texto || texto.length > 300) return null;
+        const m = texto.match(padrao);
+        if (!m) return null;
+        let total;
+        if (m[2]) total = parseInt(m[2].replace(/[.,\s]/g, ''), 10);
+        else if (milhar.test(m[1])) total = parseInt(m[1].replace(/[.\s]/g, ''), 10) * 1000;
+        else total = Math.round(parseFloat(m[1].replace(',', '.')) * 1000);
+        return {seletor: seletor, texto: texto.trim(), total: total};
+    };
+
+    let melhor = null;
+    for (const seletor of seletores) {
+        let elementos = [];
+        try { elementos = document.querySelectorAll(seletor); } catch (e) { continue; }
+        for (const el of elementos) {
+            melhor = candidato(el.textContent, seletor);
+            if (melhor) break;
+        }
+        if (melhor) break;
+    }
+
+    // Fallback linear: percorre só os nós de texto e testa o texto do elemento pai
+    if (!melhor && document.body) {
+        const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+        const vistos = new Set();
+        let no;
+        while (!melhor && (no = walker.nextNode())) {
+            const pai = no.parentElement;
+            if (!pai || vistos.has(pai) || !palavra.test(no.nodeValue)) continue;
+            vistos.add(pai);
+            if (pai.closest('script, style, noscript')) continue;
+            melhor = candidato(pai.textContent, null);
+        }
+    }
+
+    const og = document.querySelector('meta[property="og:title"]');
+    const h1 = document.querySelector('h1');
+    return {
+        titulo: document.title || null,
+        og_titulo: og ? og.getAttribute('content') : null,
+        h1: h1 ? h1.textContent.trim() : null,
+        total: melhor ? melhor.total : null,
+        total_texto: melhor ? melhor.texto : null,
+        seletor: melhor ? melhor.seletor : null
+    };
+}
+"""
+
+# plataforma -> seletor que encontrou o total da última vez
+_seletor_vencedor: Dict[str, str] = {}
+
+
+def ordenar_seletores(plataforma: str, seletores: Sequence[str]) -> List[str]:
+    """Coloca o último seletor vencedor da plataforma na frente"""
+    vencedor = _seletor_vencedor.get(plataforma)
+    if vencedor in seletores:
+        return [vencedor] + [s for s in seletores if s != vencedor]
+    return list(seletores)
+
+
+async def extrair_dados_pagina(page, plataforma: str, seletores: Sequence[str]) -> Dict[str, Any]:
+    """
+    Roda o script de extração uma vez e retorna {'titulo', 'og_titulo', 'h1',
+    'total', 'total_texto', 'seletor'}; ``total`` já vem como int (ou None)
+    """
+    dados = await page.evaluate(_JS_EXTRACAO, ordenar_seletores(plataforma, seletores))
+    if dados.get('seletor'):
+        if _seletor_vencedor.get(plataforma) != dados['seletor']:
+            logger.info(f"🎯 {plataforma}: seletor do total agora é {dados['seletor']}")
+        _seletor_vencedor[plataforma] = dados['seletor']
+    return dados
+
+
+def seletores_vencedores() -> Dict[str, Optional[str]]:
+    return dict(_seletor_vencedor)
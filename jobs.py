@@ -0,0 +1,316 @@
+"""
+Jobs assíncronos persistidos em jobs_busca / jobs_busca_eventos
+
+O cliente cria o job e recebe o id na hora; um pool de workers do
+próprio processo executa os jobs com concorrência limitada e grava cada
+passo como evento. Como estado e eventos ficam no banco, jobs pendentes
+ou interrompidos por um restart voltam para a fila no próximo start().
+
+Com vários workers do uvicorn (``estado`` compartilhado), cada processo
+marca os jobs que executa e manda heartbeats; só jobs de workers mortos são
+recuperados, e pendentes de qualquer processo entram na fila de quem estiver
+livre (o claim atômico no banco garante uma execução por job).
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+STATUS_FINAIS = ('concluido', 'erro')
+
+Emissor = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class JobQueueFullError(Exception):
+    """A fila de jobs pendentes atingiu ``max_pendentes``"""
+
+
+class JobManager:
+    """
+    Fila durável de jobs de um ``tipo``, executados por ``workers`` tasks.
+
+    ``executor(parametros, emitir)`` roda o job e retorna o resultado (dict);
+    ``emitir(tipo, dados)`` grava um evento de progresso. Um job que estava
+    executando quando o processo caiu volta a pendente, até ``max_tentativas``.
+    Com ``estado``, a cada ``intervalo_heartbeat`` s o processo renova seu
+    heartbeat e recoloca na fila jobs pendentes ou órfãos de outros workers.
+    """
+
+    def __init__(self, database, tipo: str,
+                 executor: Callable[[Dict[str, Any], Emissor], Awaitable[Dict[str, Any]]],
+                 workers: int = 2, max_pendentes: int = 100, max_tentativas: int = 3,
+                 keepalive: float = 15, estado=None, intervalo_heartbeat: float = 10):
+        self.db = database
+        self.tipo = tipo
+        self.executor = executor
+        self.workers = workers
+        self.max_pendentes = max_pendentes
+        self.max_tentativas = max_tentativas
+        self.keepalive = keepalive
+        self.estado = estado
+        self.intervalo_heartbeat = intervalo_heartbeat
+        # Eventos gravados por outro processo não acordam este: consulta a cada 1 s
+        self.intervalo_eventos = 1.0 if estado is not None else keepalive
+
+        self._fila: Optional[asyncio.Queue] = None
+        self._na_fila: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._tarefa_heartbeat: Optional[asyncio.Task] = None
+        self._avisos: Dict[str, asyncio.Event] = {}
+        self._em_execucao = 0
+        self._stats = {
+            'criados': 0,
+            'concluidos': 0,
+            'erros': 0,
+            'recuperados': 0,
+        }
+
+    async def start(self):
+        """Recupera jobs interrompidos, enfileira os pendentes e sobe os workers"""
+        self._fila = asyncio.Queue()
+        self._na_fila = set()
+        if self.estado is not None:
+            await self.estado.aheartbeat()
+        recuperados = await self._recuperar()
+        if recuperados:
+            logger.info(f"♻️ {recuperados} jobs '{self.tipo}' pendentes recolocados na fila")
+
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        if self.estado is not None:
+            self._tarefa_heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info(f"👷 {self.workers} workers de jobs '{self.tipo}' iniciados")
+
+    async def _recuperar(self) -> int:
+        """Volta a pendente os jobs interrompidos e enfileira os pendentes que não estão na fila"""
+        onde = "status = 'executando' AND tipo = %s"
+        params: tuple = (self.tipo,)
+        if self.estado is not None:
+            # Lê os 'executando' antes das marcas: um job reivindicado depois
+            # desta leitura não entra na lista, e um anterior já está marcado
+            executando = await self.db.afetch(
+                "SELECT id FROM jobs_busca WHERE status = 'executando' AND tipo = %s", (self.tipo,)
+            )
+            vivos = await self.estado.ajobs_em_workers_vivos(self.intervalo_heartbeat * 3)
+            orfaos = [job['id'] for job in executando if job['id'] not in vivos]
+            if orfaos:
+                onde += f" AND id IN ({', '.join(['%s'] * len(orfaos))})"
+                params += tuple(orfaos)
+        if self.estado is None or orfaos:
+            await self.db.aexecute(
+                f"""UPDATE jobs_busca
+                    SET erro = IF(tentativas >= %s, 'Interrompido: limite de tentativas atingido', erro),
+                        status = IF(tentativas >= %s, 'erro', 'pendente')
+                    WHERE {onde}""",
+                (self.max_tentativas, self.max_tentativas) + params
+            )
+        pendentes = await self.db.afetch(
+            "SELECT id FROM jobs_busca WHERE status = 'pendente' AND tipo = %s ORDER BY criado_em",
+            (self.tipo,)
+        )
+        novos = [job['id'] for job in pendentes if job['id'] not in self._na_fila]
+        for job_id in novos:
+            self._enfileirar(job_id)
+        self._stats['recuperados'] += len(novos)
+        return len(novos)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.intervalo_heartbeat)
+            try:
+                await self.estado.aheartbeat()
+                await self._recuperar()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat de jobs '{self.tipo}' falhou: {e}")
+
+    def _enfileirar(self, job_id: str):
+        self._na_fila.add(job_id)
+        self._fila.put_nowait(job_id)
+
+    async def close(self):
+        """Para os workers; jobs em execução continuam 'executando' e são recuperados no próximo start"""
+        tasks = self._tasks + ([self._tarefa_heartbeat] if self._tarefa_heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._tarefa_heartbeat = None
+
+    async def criar(self, parametros: Dict[str, Any]) -> Dict[str, Any]:
+        if self._fila is None:
+            raise RuntimeError("JobManager não iniciado")
+        if self._fila.qsize() >= self.max_pendentes:
+            raise JobQueueFullError(f"Fila de jobs cheia ({self.max_pendentes} pendentes)")
+
+        job_id = uuid.uuid4().hex
+        async with self.db.atransaction() as conn:
+            async with self.db.acursor(conn) as cursor:
+                await cursor.execute(
+                    "INSERT INTO jobs_busca (id, tipo, parametros, status) VALUES (%s, %s, %s, 'pendente')",
+                    (job_id, self.tipo, json.dumps(parametros, ensure_ascii=False))
+                )
+                await cursor.execute(
+                    "INSERT INTO jobs_busca_eventos (job_id, tipo, dados) VALUES (%s, 'status', %s)",
+                    (job_id, json.dumps({'status': 'pendente'}))
+                )
+        self._enfileirar(job_id)
+        self._stats['criados'] += 1
+        return await self.obter(job_id)
+
+    async def obter(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self.db.afetch(
+            """SELECT id, tipo, parametros, status, resultado, erro, tentativas,
+                      criado_em, iniciado_em, concluido_em
+               FROM jobs_busca WHERE id = %s""",
+            (job_id,)
+        )
+        if not rows:
+            return None
+        job = rows[0]
+        job['parametros'] = json.loads(job['parametros']) if job['parametros'] else {}
+        job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+        return job
+
+    async def eventos(self, job_id: str, depois_de: int = 0):
+        """
+        Gera os eventos do job com id > ``depois_de`` e acompanha os novos até o
+        job terminar. Gera None a cada ``keepalive`` segundos sem novidades.
+        """
+        ultimo = depois_de
+        ultimo_envio = time.monotonic()
+        while True:
+            # Pega o aviso antes de consultar, para não perder um evento no meio
+            aviso = self._avisos.setdefault(job_id, asyncio.Event())
+            novos = await self.db.afetch(
+                """SELECT id, tipo, dados, criado_em FROM jobs_busca_eventos
+                   WHERE job_id = %s AND id > %s ORDER BY id""",
+                (job_id, ultimo)
+            )
+            for evento in novos:
+                ultimo = evento['id']
+                evento['dados'] = json.loads(evento['dados']) if evento['dados'] else {}
+                yield evento
+            if novos:
+                ultimo_envio = time.monotonic()
+                continue
+
+            job = await self.obter(job_id)
+            if job is None or job['status'] in STATUS_FINAIS:
+                self._avisos.pop(job_id, None)
+                return
+            try:
+                await asyncio.wait_for(aviso.wait(), timeout=self.intervalo_eventos)
+            except asyncio.TimeoutError:
+                if time.monotonic() - ultimo_envio >= self.keepalive:
+                    ultimo_envio = time.monotonic()
+                    yield None
+
+    def _avisar(self, job_id: str):
+        aviso = self._avisos.pop(job_id, None)
+        if aviso is not None:
+            aviso.set()
+
+    async def _emitir(self, job_id: str, tipo: str, dados: Dict[str, Any]):
+        try:
+            await self.db.aexecute(
+                "INSERT INTO jobs_busca_eventos (job_id, tipo, dados) VALUES (%s, %s, %s)",
+                (job_id, tipo, json.dumps(dados, ensure_ascii=False, default=str))
+            )
+        except Exception as e:
+            # Progresso é informativo: não derruba o job
+            logger.warning(f"⚠️ Não foi possível gravar evento do job {job_id}: {e}")
+            return
+        self._avisar(job_id)
+
+    async def _finalizar(self, job_id: str, status: str, resultado: Optional[Dict[str, Any]],
+                         erro: Optional[str]):
+        """Status final e evento final na mesma transação"""
+        dados = {'status': status, 'resultado': resultado, 'erro': erro}
+        async with self.db.atransaction() as conn:
+            async with self.db.acursor(conn) as cursor:
+                await cursor.execute(
+                    """UPDATE jobs_busca SET status = %s, resultado = %s, erro = %s, concluido_em = NOW()
+                       WHERE id = %s""",
+                    (status,
+                     json.dumps(resultado, ensure_ascii=False, default=str) if resultado is not None else None,
+                     erro, job_id)
+                )
+                await cursor.execute(
+                    "INSERT INTO jobs_busca_eventos (job_id, tipo, dados) VALUES (%s, 'status', %s)",
+                    (job_id, json.dumps(dados, ensure_ascii=False, default=str))
+                )
+        self._avisar(job_id)
+
+    async def _executar(self, job_id: str):
+        if self.estado is not None:
+            # Marca antes do claim, para a recuperação de outro processo nunca ver
+            # este job 'executando' sem dono vivo. Cópias antigas da fila de um
+            # job que outro worker já executa são descartadas sem tocar na marca
+            if not await self.estado.amarcar_job(job_id, self.intervalo_heartbeat * 3):
+                logger.info(f"⏭️ Job {job_id} ({self.tipo}) já está com outro worker")
+                return
+        try:
+            await self._executar_marcado(job_id)
+        finally:
+            if self.estado is not None:
+                await self.estado.adesmarcar_job(job_id)
+
+    async def _executar_marcado(self, job_id: str):
+        # Só um worker consegue passar o job de pendente para executando
+        linhas = await self.db.aexecute(
+            """UPDATE jobs_busca SET status = 'executando', iniciado_em = NOW(), tentativas = tentativas + 1
+               WHERE id = %s AND status = 'pendente'""",
+            (job_id,)
+        )
+        if not linhas:
+            return
+        job = await self.obter(job_id)
+        await self._emitir(job_id, 'status', {'status': 'executando', 'tentativa': job['tentativas']})
+        logger.info(f"▶️ Job {job_id} ({self.tipo}) iniciado")
+
+        async def emitir(tipo: str, dados: Dict[str, Any]):
+            await self._emitir(job_id, tipo, dados)
+
+        self._em_execucao += 1
+        try:
+            resultado = await self.executor(job['parametros'], emitir)
+        except asyncio.CancelledError:
+            # Encerramento do processo: fica 'executando' e é recuperado no próximo start
+            raise
+        except Exception as e:
+            erro = str(getattr(e, 'detail', None) or e) or e.__class__.__name__
+            logger.error(f"❌ Job {job_id} falhou: {erro}")
+            await self._finalizar(job_id, 'erro', None, erro[:2000])
+            self._stats['erros'] += 1
+        else:
+            await self._finalizar(job_id, 'concluido', resultado, None)
+            self._stats['concluidos'] += 1
+            logger.info(f"✅ Job {job_id} concluído")
+        finally:
+            self._em_execucao -= 1
+
+    async def _worker(self, numero: int):
+        while True:
+            job_id = await self._fila.get()
+            self._na_fila.discard(job_id)
+            try:
+                await self._executar(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no worker {numero} de jobs '{self.tipo}' ({job_id}): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['workers_ativos'] = sum(1 for task in self._tasks if not task.done())
+        stats['pendentes'] = self._fila.qsize() if self._fila is not None else 0
+        stats['em_execucao'] = self._em_execucao
+        stats['max_pendentes'] = self.max_pendentes
+        return stats
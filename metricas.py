@@ -0,0 +1,222 @@
+"""
+Métricas no formato texto do Prometheus para as APIs de imóveis
+
+Contadores e histogramas simples, atualizados no event loop da API, e
+coletores que leem na hora do scrape os stats que os módulos já mantêm
+(pool de navegadores, single-flight, jobs...). Gerar /metrics não faz I/O:
+é só formatar números que já estão em memória.
+"""
+
+import logging
+import math
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+from database import db, medir_tempo_db
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BUCKETS_NAVEGADOR = (0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+
+# (rótulos, valor) de uma série; rótulos como dict
+Amostra = Tuple[Dict[str, Any], float]
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _formatar_rotulos(rotulos: Dict[str, Any]) -> str:
+    if not rotulos:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in rotulos.items()) + '}'
+
+
+def _formatar_valor(valor: float) -> str:
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class Contador:
+    """Contador monotônico com rótulos"""
+
+    tipo = 'counter'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = tuple(rotulos.get(r, '') for r in self.rotulos)
+        self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def linhas(self) -> Iterable[str]:
+        for chave, valor in list(self._valores.items()):
+            yield f'{self.nome}{_formatar_rotulos(dict(zip(self.rotulos, chave)))} {_formatar_valor(valor)}'
+
+
+class Histograma:
+    """Histograma cumulativo com ``buckets`` fixos (limites superiores, em segundos)"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_HTTP):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # chave -> [contagens por bucket (+Inf no fim), soma, total]
+        self._series: Dict[Tuple, List[Any]] = {}
+
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(rotulos.get(r, '') for r in self.rotulos)
+        serie = self._series.get(chave)
+        if serie is None:
+            serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def linhas(self) -> Iterable[str]:
+        for chave, (contagens, soma, total) in list(self._series.items()):
+            rotulos = dict(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (math.inf,), contagens):
+                acumulado += contagem
+                le = dict(rotulos, le=_formatar_valor(limite))
+                yield f'{self.nome}_bucket{_formatar_rotulos(le)} {acumulado}'
+            yield f'{self.nome}_sum{_formatar_rotulos(rotulos)} {_formatar_valor(soma)}'
+            yield f'{self.nome}_count{_formatar_rotulos(rotulos)} {total}'
+
+
+class RegistroMetricas:
+    """
+    Métricas registradas e coletores. Um coletor é uma função sem argumentos
+    que retorna [(nome, tipo, ajuda, [(rótulos, valor), ...]), ...] e roda a
+    cada scrape; exceções num coletor não derrubam os demais.
+    """
+
+    def __init__(self):
+        self._metricas: Dict[str, Any] = {}
+        self._coletores: List[Callable[[], Iterable[Tuple[str, str, str, List[Amostra]]]]] = []
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self._metricas.setdefault(nome, Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                   buckets: Sequence[float] = BUCKETS_HTTP) -> Histograma:
+        return self._metricas.setdefault(nome, Histograma(nome, ajuda, rotulos, buckets))
+
+    def coletor(self, funcao: Callable[[], Iterable[Tuple[str, str, str, List[Amostra]]]]):
+        """Registra um coletor (pode ser usado como decorator)"""
+        self._coletores.append(funcao)
+        return funcao
+
+    def render(self) -> str:
+        linhas: List[str] = []
+        for metrica in list(self._metricas.values()):
+            linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            linhas.extend(metrica.linhas())
+        for coletor in self._coletores:
+            try:
+                familias = list(coletor())
+            except Exception as e:
+                logger.warning(f"⚠️ Coletor de métricas {getattr(coletor, '__name__', coletor)} falhou: {e}")
+                continue
+            for nome, tipo, ajuda, amostras in familias:
+                linhas.append(f'# HELP {nome} {ajuda}')
+                linhas.append(f'# TYPE {nome} {tipo}')
+                for rotulos, valor in amostras:
+                    if valor is None:
+                        continue
+                    linhas.append(f'{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = RegistroMetricas()
+
+# Métricas compartilhadas, observadas pelos módulos que fazem o trabalho
+requisicoes_total = metricas.contador(
+    'imoveis_http_requests_total', 'Requisições HTTP atendidas', ('rota', 'metodo', 'status'))
+latencia_requisicoes = metricas.histograma(
+    'imoveis_http_request_duration_seconds', 'Latência das requisições HTTP por rota', ('rota', 'metodo'))
+tempo_db_requisicao = metricas.histograma(
+    'imoveis_http_request_db_seconds', 'Tempo com conexão do banco por requisição', ('rota',))
+lancamento_navegador = metricas.histograma(
+    'imoveis_browser_launch_seconds', 'Duração do lançamento de um Chromium do pool',
+    buckets=BUCKETS_NAVEGADOR)
+carregamento_pagina = metricas.histograma(
+    'imoveis_page_load_seconds', 'Duração do goto + espera de prontidão por tipo de página', ('rotulo',),
+    buckets=BUCKETS_NAVEGADOR)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI: latência (até o último byte do corpo, inclusive em
+    respostas em streaming), status e tempo de banco por rota. A rota é o
+    template (``/jobs/{job_id}``), para não criar uma série por URL.
+    """
+
+    def __init__(self, app, ignorar: Sequence[str] = ('/metrics',)):
+        self.app = app
+        self.ignorar = set(ignorar)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.ignorar:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        status = [500]
+
+        async def enviar(mensagem):
+            if mensagem['type'] == 'http.response.start':
+                status[0] = mensagem['status']
+            await send(mensagem)
+
+        with medir_tempo_db() as tempo_db:
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                rota = getattr(scope.get('route'), 'path', None) or 'nao_encontrada'
+                metodo = scope['method']
+                latencia_requisicoes.observar(time.perf_counter() - inicio, rota=rota, metodo=metodo)
+                requisicoes_total.inc(rota=rota, metodo=metodo, status=status[0])
+                tempo_db_requisicao.observar(tempo_db[0], rota=rota)
+
+
+@metricas.coletor
+def _coletar_pool_banco():
+    stats = db.pool_stats()
+    apool = db.apool_stats()
+    return [
+        ('imoveis_db_pool_connections', 'gauge', 'Conexões do pool síncrono do banco',
+         [({'estado': 'em_uso'}, stats.get('em_uso')), ({'estado': 'ociosas'}, stats.get('ociosas'))]),
+        ('imoveis_db_pool_checkout_wait_seconds_total', 'counter', 'Tempo total esperando conexão do pool',
+         [({}, stats.get('espera_total_s'))]),
+        ('imoveis_db_async_pool_connections', 'gauge', 'Conexões do pool aiomysql',
+         [({'estado': 'em_uso'}, apool['em_uso']), ({'estado': 'livres'}, apool['livres'])]),
+    ]
+
+
+def instalar_metricas(app: FastAPI, caminho: str = '/metrics'):
+    """Adiciona o middleware de métricas e o endpoint ``caminho`` ao app"""
+    app.add_middleware(MiddlewareMetricas, ignorar=(caminho,))
+
+    @app.get(caminho, include_in_schema=False)
+    async def endpoint_metricas():
+        return Response(content=metricas.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Migrações versionadas do schema de links_duckduckgo, logs_busca e jobs_busca
+
+Cada migração roda uma única vez e fica registrada em schema_migracoes.
+Na inicialização, verificar_schema() aplica as pendentes, confere se os
+índices esperados existem e roda EXPLAIN nas queries quentes para
+apontar full scans.
+"""
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Tuple
+
+from database import db, _sql_plano_ciclo
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Índices esperados: (tabela, nome, colunas, único)
+INDICES = [
+    ('links_duckduckgo', 'uk_url', '(url)', True),
+    ('links_duckduckgo', 'uk_link_unico',
+     '(plataforma_id, tipo_busca_id, estado_id, municipio_id, link_unico)', True),
+    # Freshness por combinação (planejador de ciclo e verificações de link recente)
+    ('links_duckduckgo', 'idx_combinacao_atualizacao',
+     '(plataforma_id, tipo_busca_id, estado_id, municipio_id, updated_at, created_at)', False),
+    # /links-salvos: ORDER BY created_at DESC, id DESC
+    ('links_duckduckgo', 'idx_created_id', '(created_at, id)', False),
+    ('logs_busca', 'idx_data', '(data_execucao)', False),
+    ('logs_busca', 'idx_motor_data', '(motor_busca, data_execucao)', False),
+]
+
+# Filtros de /links-salvos mantendo a ordem (created_at, id) do keyset
+INDICES_LINKS_SALVOS = [
+    ('links_duckduckgo', 'idx_estado_created_id', '(estado_id, created_at, id)', False),
+    ('links_duckduckgo', 'idx_plataforma_created_id', '(plataforma_id, created_at, id)', False),
+    ('links_duckduckgo', 'idx_tipo_created_id', '(tipo_busca_id, created_at, id)', False),
+]
+
+# Queries quentes verificadas com EXPLAIN: nome -> (sql, params)
+QUERIES_QUENTES = {
+    'planejador_ciclo': _sql_plano_ciclo(24, None, None, None),
+    'link_recente_combinacao': (
+        """SELECT id, url, updated_at FROM links_duckduckgo
+           WHERE plataforma_id = %s AND tipo_busca_id = %s
+           AND estado_id = %s AND municipio_id = %s""",
+        (1, 1, 1, 1)
+    ),
+    'links_salvos': (
+        """SELECT l.url, l.created_at FROM links_duckduckgo l
+           ORDER BY l.created_at DESC, l.id DESC LIMIT 100""",
+        None
+    ),
+    'links_salvos_estado': (
+        """SELECT l.url, l.created_at FROM links_duckduckgo l
+           WHERE l.estado_id = %s
+           ORDER BY l.created_at DESC, l.id DESC LIMIT 100""",
+        (1,)
+    ),
+}
+
+
+def _existe_coluna(tabela: str, coluna: str) -> bool:
+    result = db.execute_query(
+        """SELECT COUNT(*) AS total FROM information_schema.columns
+           WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""",
+        (tabela, coluna)
+    )
+    return result[0]['total'] > 0
+
+
+def _existe_indice(tabela: str, indice: str) -> bool:
+    result = db.execute_query(
+        """SELECT COUNT(*) AS total FROM information_schema.statistics
+           WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s""",
+        (tabela, indice)
+    )
+    return result[0]['total'] > 0
+
+
+def _criar_indice(tabela: str, indice: str, colunas: str, unico: bool = False):
+    if _existe_indice(tabela, indice):
+        return
+    logger.info(f"🔧 Criando índice {indice} em {tabela}")
+    tipo = "UNIQUE KEY" if unico else "INDEX"
+    db.execute_update(f"ALTER TABLE {tabela} ADD {tipo} {indice} {colunas}")
+
+
+def _m001_tabelas_base():
+    db.execute_update("""
+        CREATE TABLE IF NOT EXISTS links_duckduckgo (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            url VARCHAR(500) NOT NULL,
+            plataforma_id INT,
+            tipo_busca_id INT,
+            estado_id INT,
+            municipio_id INT,
+            distrito_id INT,
+            termo_busca VARCHAR(255),
+            posicao_busca INT DEFAULT 0,
+            processado TINYINT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NULL ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_plataforma (plataforma_id),
+            INDEX idx_tipo_busca (tipo_busca_id),
+            INDEX idx_local (estado_id, municipio_id),
+            UNIQUE KEY uk_url (url)
+        )
+    """)
+    db.execute_update("""
+        CREATE TABLE IF NOT EXISTS logs_busca (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            motor_busca VARCHAR(50),
+            query TEXT,
+            plataforma_id INT,
+            municipio_id INT,
+            links_encontrados INT,
+            links_salvos INT,
+            data_execucao DATETIME,
+            observacao TEXT,
+            INDEX idx_data (data_execucao)
+        )
+    """)
+
+
+def _m002_logs_busca_observacao():
+    # Tabelas antigas foram criadas sem a coluna observacao
+    if not _existe_coluna('logs_busca', 'observacao'):
+        db.execute_update("ALTER TABLE logs_busca ADD COLUMN observacao TEXT")
+    _criar_indice('logs_busca', 'idx_data', '(data_execucao)')
+
+
+def _m003_chave_link_unico():
+    # links_duckduckgo também guarda vários links de SERP por combinação, por
+    # isso a chave inclui link_unico: 1 para o link único, NULL para os demais
+    if not _existe_coluna('links_duckduckgo', 'link_unico'):
+        db.execute_update("ALTER TABLE links_duckduckgo ADD COLUMN link_unico TINYINT NULL DEFAULT NULL")
+        # Marca o link mais recente de posição 1 de cada combinação como o link único
+        db.execute_update(
+            """UPDATE links_duckduckgo l
+               JOIN (SELECT MAX(id) AS id FROM links_duckduckgo WHERE posicao_busca = 1
+                     GROUP BY plataforma_id, tipo_busca_id, estado_id, municipio_id) u
+                 ON l.id = u.id
+               SET l.link_unico = 1"""
+        )
+    _criar_indice('links_duckduckgo', 'uk_link_unico',
+                  '(plataforma_id, tipo_busca_id, estado_id, municipio_id, link_unico)', unico=True)
+
+
+def _m004_indices_queries_quentes():
+    for tabela, indice, colunas, unico in INDICES:
+        _criar_indice(tabela, indice, colunas, unico)
+
+
+def _m005_indices_links_salvos():
+    for tabela, indice, colunas, unico in INDICES_LINKS_SALVOS:
+        _criar_indice(tabela, indice, colunas, unico)
+
+
+def _m006_jobs():
+    db.execute_update("""
+        CREATE TABLE IF NOT EXISTS jobs_busca (
+            id CHAR(32) PRIMARY KEY,
+            tipo VARCHAR(50) NOT NULL,
+            parametros TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+            resultado TEXT NULL,
+            erro TEXT NULL,
+            tentativas INT NOT NULL DEFAULT 0,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            iniciado_em DATETIME NULL,
+            concluido_em DATETIME NULL,
+            INDEX idx_tipo_status_criado (tipo, status, criado_em)
+        )
+    """)
+    db.execute_update("""
+        CREATE TABLE IF NOT EXISTS jobs_busca_eventos (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            job_id CHAR(32) NOT NULL,
+            tipo VARCHAR(30) NOT NULL,
+            dados TEXT NULL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_job_evento (job_id, id)
+        )
+    """)
+
+
+MIGRACOES: List[Tuple[int, str, Callable[[], None]]] = [
+    (1, 'Tabelas links_duckduckgo e logs_busca', _m001_tabelas_base),
+    (2, 'Coluna logs_busca.observacao', _m002_logs_busca_observacao),
+    (3, 'Chave única do link por combinação', _m003_chave_link_unico),
+    (4, 'Índices compostos das queries quentes', _m004_indices_queries_quentes),
+    (5, 'Índices dos filtros de /links-salvos', _m005_indices_links_salvos),
+    (6, 'Tabelas de jobs assíncronos', _m006_jobs),
+]
+
+
+# Segundos que um processo espera outro terminar as migrações (workers sobem juntos)
+ESPERA_LOCK_MIGRACOES = int(os.getenv('MIGRACOES_ESPERA_LOCK', '120'))
+
+
+def aplicar_migracoes() -> List[int]:
+    """
+    Aplica, em ordem, as migrações ainda não registradas. Retorna as versões aplicadas.
+
+    Roda sob o lock nomeado 'schema_migracoes' (GET_LOCK), preso à conexão
+    que o obteve: com vários processos subindo ao mesmo tempo, só um migra e
+    os outros, ao obter o lock, releem as versões já aplicadas.
+    """
+    with db.get_connection() as conn:
+        with db.cursor(conn) as cursor:
+            cursor.execute("SELECT GET_LOCK('schema_migracoes', %s) AS obtido", (ESPERA_LOCK_MIGRACOES,))
+            obtido = cursor.fetchone()['obtido']
+        if obtido != 1:
+            raise RuntimeError(
+                f"Lock de migrações não obtido em {ESPERA_LOCK_MIGRACOES}s (outro processo migrando?)"
+            )
+        try:
+            return _aplicar_migracoes_pendentes()
+        finally:
+            with db.cursor(conn) as cursor:
+                cursor.execute("SELECT RELEASE_LOCK('schema_migracoes')")
+
+
+def _aplicar_migracoes_pendentes() -> List[int]:
+    db.execute_update("""
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao INT PRIMARY KEY,
+            descricao VARCHAR(255),
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Lido depois do lock: inclui o que outro processo acabou de aplicar
+    aplicadas = {r['versao'] for r in db.execute_query("SELECT versao FROM schema_migracoes")}
+
+    novas = []
+    for versao, descricao, migracao in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        logger.info(f"🔧 Aplicando migração {versao}: {descricao}")
+        migracao()
+        db.execute_update(
+            "INSERT INTO schema_migracoes (versao, descricao) VALUES (%s, %s)",
+            (versao, descricao)
+        )
+        novas.append(versao)
+    return novas
+
+
+def verificar_indices() -> List[str]:
+    """Retorna os índices esperados que não existem no banco"""
+    existentes = {
+        (r['table_name'], r['index_name'])
+        for r in db.execute_query(
+            """SELECT DISTINCT table_name AS table_name, index_name AS index_name
+               FROM information_schema.statistics
+               WHERE table_schema = DATABASE()
+               AND table_name IN ('links_duckduckgo', 'logs_busca')"""
+        )
+    }
+    return [
+        f"{tabela}.{indice}" for tabela, indice, _, _ in INDICES + INDICES_LINKS_SALVOS
+        if (tabela, indice) not in existentes
+    ]
+
+
+def explicar_queries_quentes() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Roda EXPLAIN nas queries quentes e retorna, por query, as linhas do plano
+    que fazem full scan (type=ALL ou sem índice) em links_duckduckgo/logs_busca.
+    """
+    problemas = {}
+    for nome, (query, params) in QUERIES_QUENTES.items():
+        try:
+            plano = db.execute_query(f"EXPLAIN {query}", params)
+        except Exception as e:
+            logger.warning(f"Não foi possível rodar EXPLAIN em {nome}: {e}")
+            continue
+        scans = [
+            linha for linha in plano
+            if linha.get('table') in ('l', 'links_duckduckgo', 'logs_busca')
+            and (linha.get('type') == 'ALL' or not linha.get('key'))
+        ]
+        if scans:
+            problemas[nome] = scans
+    return problemas
+
+
+def verificar_schema() -> Dict[str, Any]:
+    """Aplica migrações pendentes e reporta índices ausentes e full scans (rodar na inicialização)"""
+    aplicadas = aplicar_migracoes()
+    if aplicadas:
+        logger.info(f"✅ Migrações aplicadas: {aplicadas}")
+
+    faltando = verificar_indices()
+    for indice in faltando:
+        logger.warning(f"⚠️ Índice ausente: {indice}")
+
+    scans = explicar_queries_quentes()
+    for nome, linhas in scans.items():
+        for linha in linhas:
+            logger.warning(
+                f"⚠️ EXPLAIN {nome}: tabela={linha.get('table')} type={linha.get('type')} "
+                f"key={linha.get('key')} rows={linha.get('rows')}"
+            )
+
+    return {'migracoes_aplicadas': aplicadas, 'indices_ausentes': faltando, 'full_scans': scans}
+
+
+if __name__ == "__main__":
+    relatorio = verificar_schema()
+    logger.info("="*70)
+    logger.info(f"Migrações aplicadas agora: {relatorio['migracoes_aplicadas'] or 'nenhuma'}")
+    logger.info(f"Índices ausentes: {relatorio['indices_ausentes'] or 'nenhum'}")
+    logger.info(f"Queries com full scan: {list(relatorio['full_scans']) or 'nenhuma'}")
+    logger.info("="*70)
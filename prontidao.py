@@ -0,0 +1,132 @@
+"""
+Espera adaptativa de carregamento de página para Playwright
+
+Em vez de sleeps fixos, aguardar_pagina_pronta() corre três sinais e
+retorna no primeiro que acontecer: um dos seletores-alvo apareceu, a rede
+ficou ociosa ou o DOM parou de mudar. Tudo sob um prazo total; o tempo
+real de cada espera fica registrado por rótulo.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SINAIS_PADRAO = ('seletor', 'rede', 'dom')
+
+# Resolve quando o DOM passa ``quieto`` ms sem mutações
+_JS_DOM_ESTAVEL = """
+(quieto) => new Promise(resolve => {
+    const alvo = document.documentElement || document;
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(fim, quieto);
+    });
+    function fim() {
+        observer.disconnect();
+        resolve(true);
+    }
+    observer.observe(alvo, {childList: true, subtree: true, attributes: true, characterData: true});
+    timer = setTimeout(fim, quieto);
+})
+"""
+
+
+class EstatisticasProntidao:
+    """Tempo real das esperas por rótulo e qual sinal liberou cada uma"""
+
+    def __init__(self):
+        self._por_rotulo: Dict[str, Dict[str, Any]] = {}
+
+    def registrar(self, rotulo: str, sinal: str, espera: float):
+        stats = self._por_rotulo.setdefault(rotulo, {
+            'chamadas': 0,
+            'total_s': 0.0,
+            'max_s': 0.0,
+            'por_sinal': {},
+        })
+        stats['chamadas'] += 1
+        stats['total_s'] += espera
+        stats['max_s'] = max(stats['max_s'], espera)
+        stats['por_sinal'][sinal] = stats['por_sinal'].get(sinal, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        resultado = {}
+        for rotulo, stats in self._por_rotulo.items():
+            item = dict(stats, por_sinal=dict(stats['por_sinal']))
+            item['media_s'] = stats['total_s'] / stats['chamadas'] if stats['chamadas'] else 0.0
+            resultado[rotulo] = item
+        return resultado
+
+
+estatisticas_prontidao = EstatisticasProntidao()
+
+
+async def _esperar_seletor(page, seletor: str, estado: str, prazo_ms: float) -> str:
+    await page.wait_for_selector(seletor, state=estado, timeout=prazo_ms)
+    return f'seletor:{seletor}'
+
+
+async def _esperar_rede(page, prazo_ms: float) -> str:
+    await page.wait_for_load_state('networkidle', timeout=prazo_ms)
+    return 'rede'
+
+
+async def _esperar_dom(page, quieto_ms: int) -> str:
+    await page.evaluate(_JS_DOM_ESTAVEL, quieto_ms)
+    return 'dom'
+
+
+async def aguardar_pagina_pronta(page, seletores: Optional[Sequence[str]] = None, prazo: float = 10.0,
+                                 quieto_ms: int = 500, sinais: Iterable[str] = SINAIS_PADRAO,
+                                 estado_seletor: str = 'attached', rotulo: str = 'pagina') -> Dict[str, Any]:
+    """
+    Aguarda a página ficar pronta e retorna {'sinal', 'espera_s'}.
+
+    ``sinal`` é 'seletor:<css>', 'rede' (networkidle), 'dom' (``quieto_ms``
+    sem mutações) ou 'prazo' se nada aconteceu em ``prazo`` segundos.
+    Sinais que falham (ex.: seletor com timeout, navegação no meio da
+    espera) são ignorados enquanto os outros ainda podem acontecer.
+    """
+    inicio = time.perf_counter()
+    prazo_ms = prazo * 1000
+    sinais = set(sinais)
+
+    tarefas = []
+    if 'seletor' in sinais:
+        tarefas += [
+            asyncio.create_task(_esperar_seletor(page, seletor, estado_seletor, prazo_ms))
+            for seletor in seletores or []
+        ]
+    if 'rede' in sinais:
+        tarefas.append(asyncio.create_task(_esperar_rede(page, prazo_ms)))
+    if 'dom' in sinais:
+        tarefas.append(asyncio.create_task(_esperar_dom(page, quieto_ms)))
+
+    sinal = 'prazo'
+    pendentes = set(tarefas)
+    try:
+        while pendentes:
+            restante = prazo - (time.perf_counter() - inicio)
+            if restante <= 0:
+                break
+            concluidas, pendentes = await asyncio.wait(
+                pendentes, timeout=restante, return_when=asyncio.FIRST_COMPLETED
+            )
+            vencedora = next((t for t in concluidas if not t.cancelled() and t.exception() is None), None)
+            if vencedora is not None:
+                sinal = vencedora.result()
+                break
+    finally:
+        for tarefa in pendentes:
+            tarefa.cancel()
+        # Consome exceções das tarefas canceladas/falhas para não poluir o log do asyncio
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    espera = time.perf_counter() - inicio
+    estatisticas_prontidao.registrar(rotulo, sinal.split(':', 1)[0], espera)
+    logger.debug(f"⏱️ {rotulo}: pronta por {sinal} em {espera:.2f}s")
+    return {'sinal': sinal, 'espera_s': espera}
@@ -0,0 +1,117 @@
+"""
+Respostas JSON compactas e comprimidas para as listagens grandes
+
+orjson serializa direto para bytes (datetime já sai em ISO 8601) e o corpo
+é comprimido com br ou gzip conforme o Accept-Encoding do cliente. br só é
+oferecido se o pacote ``brotli`` estiver instalado. Corpos que não mudam
+entre requisições (lista de cidades) ficam num CorpoPreparado, que guarda
+cada codificação depois da primeira compressão.
+"""
+
+import gzip
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Abaixo disso a compressão custa mais do que economiza
+TAMANHO_MINIMO_COMPRESSAO = 1024
+NIVEL_GZIP = 6
+QUALIDADE_BR = 5
+
+
+def _json_padrao(valor):
+    return str(valor)
+
+
+def serializar(dados: Any) -> bytes:
+    """JSON compacto em bytes; tipos que o orjson não conhece (Decimal...) viram str"""
+    return orjson.dumps(dados, default=_json_padrao, option=orjson.OPT_NON_STR_KEYS)
+
+
+def ler_campos(fields: Optional[str], permitidos: Sequence[str]) -> Optional[List[str]]:
+    """'id,url' -> ['id', 'url'] na ordem pedida; 400 para campo desconhecido"""
+    if not fields:
+        return None
+    campos = list(dict.fromkeys(c.strip() for c in fields.split(',') if c.strip()))
+    invalidos = [c for c in campos if c not in permitidos]
+    if invalidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos desconhecidos em fields: {', '.join(invalidos)} (permitidos: {', '.join(permitidos)})"
+        )
+    return campos or None
+
+
+def projetar(linhas: Iterable[Dict[str, Any]], campos: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if not campos:
+        return list(linhas)
+    return [{c: linha.get(c) for c in campos} for linha in linhas]
+
+
+def negociar_codificacao(accept_encoding: Optional[str]) -> Optional[str]:
+    """'br', 'gzip' ou None, respeitando q=0"""
+    aceitas = {}
+    for parte in (accept_encoding or '').split(','):
+        nome, _, parametros = parte.strip().partition(';')
+        q = 1.0
+        if parametros.strip().startswith('q='):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nome:
+            aceitas[nome.strip().lower()] = q
+    if brotli is not None and aceitas.get('br', 0) > 0:
+        return 'br'
+    if aceitas.get('gzip', aceitas.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+def comprimir(corpo: bytes, codificacao: Optional[str]) -> bytes:
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=QUALIDADE_BR)
+    if codificacao == 'gzip':
+        return gzip.compress(corpo, compresslevel=NIVEL_GZIP)
+    return corpo
+
+
+class CorpoPreparado:
+    """Corpo JSON serializado uma vez, com as versões comprimidas guardadas sob demanda"""
+
+    def __init__(self, corpo: bytes):
+        self.corpo = corpo
+        self._codificados: Dict[Optional[str], bytes] = {None: corpo}
+
+    def codificado(self, codificacao: Optional[str]) -> bytes:
+        if codificacao not in self._codificados:
+            self._codificados[codificacao] = comprimir(self.corpo, codificacao)
+        return self._codificados[codificacao]
+
+
+def resposta_json(corpo: Any, accept_encoding: Optional[str], status_code: int = 200) -> Response:
+    """
+    Response com ``corpo`` (dados, bytes já serializados ou CorpoPreparado),
+    comprimido quando o cliente aceita e o corpo passa do tamanho mínimo
+    """
+    if not isinstance(corpo, CorpoPreparado):
+        corpo = CorpoPreparado(corpo if isinstance(corpo, bytes) else serializar(corpo))
+    codificacao = negociar_codificacao(accept_encoding)
+    if len(corpo.corpo) < TAMANHO_MINIMO_COMPRESSAO:
+        codificacao = None
+
+    headers = {'Vary': 'Accept-Encoding'}
+    if codificacao:
+        headers['Content-Encoding'] = codificacao
+    return Response(content=corpo.codificado(codificacao), status_code=status_code,
+                    media_type='application/json', headers=headers)
@@ -0,0 +1,145 @@
+"""
+Probes de saúde das APIs e snapshot periódico das contagens de tabelas
+
+/healthz não toca em nada externo. /readyz roda verificações registradas
+(ping no pool do banco, pool de navegadores, chave do LLM) e guarda o
+resultado por ``ttl`` segundos, para que probes frequentes não virem carga.
+Contagens de tabelas ficam num snapshot atualizado em background e nunca
+rodam no caminho de um probe.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+Verificacao = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class VerificadorProntidao:
+    """
+    Roda as verificações registradas em paralelo, cada uma com ``timeout``
+    segundos, e reaproveita o resultado por ``ttl`` segundos. Uma verificação
+    retorna um dict com ``ok`` (bool) e detalhes livres; exceção ou timeout
+    contam como ``ok=False``.
+    """
+
+    def __init__(self, ttl: float = 5, timeout: float = 2):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._verificacoes: Dict[str, Verificacao] = {}
+        self._resultado: Optional[Dict[str, Any]] = None
+        self._expira_em = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def verificacao(self, nome: str):
+        """Decorator que registra uma verificação assíncrona"""
+        def registrar(funcao: Verificacao) -> Verificacao:
+            self._verificacoes[nome] = funcao
+            return funcao
+        return registrar
+
+    async def _rodar(self, nome: str, funcao: Verificacao) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        try:
+            resultado = await asyncio.wait_for(funcao(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            resultado = {'ok': False, 'erro': f'timeout de {self.timeout}s'}
+        except Exception as e:
+            resultado = {'ok': False, 'erro': str(e)[:200]}
+        resultado['duracao_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+        return resultado
+
+    async def verificar(self) -> Dict[str, Any]:
+        """{'pronto', 'verificacoes', 'verificado_em'}, do cache se ainda fresco"""
+        if self._resultado is not None and time.monotonic() < self._expira_em:
+            return self._resultado
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Probes simultâneos esperam a mesma rodada
+            if self._resultado is not None and time.monotonic() < self._expira_em:
+                return self._resultado
+            nomes = list(self._verificacoes)
+            resultados = await asyncio.gather(*(self._rodar(n, self._verificacoes[n]) for n in nomes))
+            verificacoes = dict(zip(nomes, resultados))
+            self._resultado = {
+                'pronto': all(r['ok'] for r in resultados),
+                'verificacoes': verificacoes,
+                'verificado_em': datetime.now().isoformat(),
+            }
+            self._expira_em = time.monotonic() + self.ttl
+            if not self._resultado['pronto']:
+                falhas = [n for n, r in verificacoes.items() if not r['ok']]
+                logger.warning(f"🩺 Não pronto: {', '.join(falhas)}")
+            return self._resultado
+
+
+async def verificar_banco(database) -> Dict[str, Any]:
+    """Ping com uma conexão do pool assíncrono"""
+    await database.afetch("SELECT 1")
+    return {'ok': True}
+
+
+async def verificar_llm() -> Dict[str, Any]:
+    """Só confere se a chave está configurada (sem chamar o provedor)"""
+    return {'ok': bool(os.getenv('OPENAI_API_KEY'))}
+
+
+class SnapshotTabelas:
+    """
+    Contagens de tabelas recalculadas a cada ``intervalo`` segundos por uma
+    task em background. ``snapshot()`` só lê o último resultado.
+    """
+
+    QUERY = """
+        SELECT
+            (SELECT COUNT(*) FROM municipios m JOIN estados e ON m.estado_id = e.id
+              WHERE m.ativo = 1 AND e.ativo = 1) AS cidades_ativas,
+            (SELECT COUNT(*) FROM plataformas WHERE ativo = 1) AS plataformas_ativas,
+            (SELECT COUNT(*) FROM links_duckduckgo) AS links
+    """
+
+    def __init__(self, database, intervalo: float = 60):
+        self.db = database
+        self.intervalo = intervalo
+        self._contagens: Dict[str, Any] = {}
+        self._atualizado_em: Optional[datetime] = None
+        self._erro: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def atualizar(self):
+        try:
+            linhas = await self.db.afetch(self.QUERY)
+            self._contagens = {k: int(v) for k, v in linhas[0].items()}
+            self._atualizado_em = datetime.now()
+            self._erro = None
+        except Exception as e:
+            self._erro = str(e)[:200]
+            logger.warning(f"⚠️ Não foi possível atualizar as contagens das tabelas: {e}")
+
+    async def _loop(self):
+        while True:
+            await self.atualizar()
+            await asyncio.sleep(self.intervalo)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self._contagens,
+            'atualizado_em': self._atualizado_em.isoformat() if self._atualizado_em else None,
+            'erro': self._erro,
+        }
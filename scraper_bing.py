@@ -4,7 +4,10 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Any
 import time
 from scraper_melhorado import ScraperAntiDetection
-from database import db, get_plataformas_ativas
+from database import db, refdata, log_busca, aget_plataformas_ativas, aingerir_links
+from migracoes import verificar_schema
+from src.utils.asset_cache import asset_cache
+from prontidao import aguardar_pagina_pronta
 from database_queries import get_estados, get_municipios_por_estado
 from playwright.async_api import Page
 
@@ -62,6 +65,8 @@ class BingScraper(ScraperAntiDetection):
                     
                     # Cria navegador em modo headless
                     playwright, browser, context, page = await self.create_stealth_browser(headless=True)
+                    # JS/CSS/fontes do Bing vêm do cache em disco (se ASSET_CACHE_DIR estiver definido)
+                    await asset_cache.install(context)
                     
                     # Rate limiting mais suave para Bing
                     await self.rate_limit('bing.com', min_delay=2.0, max_delay=4.0)
@@ -69,9 +74,6 @@ class BingScraper(ScraperAntiDetection):
                     # Navega para o Bing
                     await page.goto('https://www.bing.com', wait_until='domcontentloaded', timeout=30000)
                     
-                    # Aguarda um pouco para página carregar completamente
-                    await asyncio.sleep(3)
-                    
                     # Busca campo de pesquisa do Bing com mais seletores
                     search_selectors = [
                         'input[name="q"]',
@@ -82,6 +84,12 @@ class BingScraper(ScraperAntiDetection):
                         '#sb_form input[type="text"]'
                     ]
                     
+                    # Aguarda o campo de busca aparecer (em vez de um sleep fixo)
+                    await aguardar_pagina_pronta(
+                        page, search_selectors, prazo=5, sinais=('seletor',),
+                        estado_seletor='visible', rotulo='bing_home'
+                    )
+                    
                     search_field = None
                     for selector in search_selectors:
                         try:
@@ -114,8 +122,10 @@ class BingScraper(ScraperAntiDetection):
                         logger.warning("Timeout esperando resultados, capturando screenshot e tentando extrair...")
                         await page.screenshot(path=f'bing_debug_results_{attempt}.png')
                     
-                    # Aguarda mais tempo para garantir que todos resultados carreguem
-                    await asyncio.sleep(5)
+                    # Aguarda os resultados estabilizarem (rede ociosa ou DOM sem mutações)
+                    await aguardar_pagina_pronta(
+                        page, prazo=5, quieto_ms=700, sinais=('rede', 'dom'), rotulo='bing_resultados'
+                    )
                     
                     # Log do HTML para debug
                     page_content = await page.content()
@@ -339,13 +349,7 @@ class ScraperBingMariaDB:
     def get_tipos_busca_do_banco(self):
         """Busca tipos de busca ativos do banco"""
         try:
-            result = db.execute_query("""
-                SELECT id, nome FROM tipos_busca 
-                ORDER BY nome
-            """)
-            tipos = {}
-            for r in result:
-                tipos[r['nome']] = r['id']
+            tipos = {t['nome']: t['id'] for t in refdata.get().tipos_busca}
             logger.info(f"Tipos de busca encontrados: {list(tipos.keys())}")
             return tipos
         except:
@@ -353,13 +357,13 @@ class ScraperBingMariaDB:
             logger.warning("Usando tipos de busca padrão")
             return {'ALUGUEL': 1, 'VENDA': 2}
     
-    def get_configuracoes_ativas(self) -> List[Dict]:
+    async def get_configuracoes_ativas(self) -> List[Dict]:
         """Busca configurações ativas do banco MariaDB"""
         configuracoes = []
         
         try:
             # Busca plataformas ativas
-            plataformas = get_plataformas_ativas()
+            plataformas = await aget_plataformas_ativas()
             logger.info(f"Encontradas {len(plataformas)} plataformas ativas")
             
             # Busca municípios ativos
@@ -372,7 +376,7 @@ class ScraperBingMariaDB:
                 ORDER BY e.sigla, m.nome
                 LIMIT 10
             """
-            municipios_ativos = db.execute_query(query_municipios)
+            municipios_ativos = await db.afetch(query_municipios)
             logger.info(f"Encontrados {len(municipios_ativos)} municípios ativos")
             
             # Gera configurações
@@ -434,7 +438,7 @@ class ScraperBingMariaDB:
         
         return query
     
-    def salvar_resultado(self, config: Dict, query: str, links: List[str]):
+    async def salvar_resultado(self, config: Dict, query: str, links: List[str]):
         """Salva resultado na tabela links_duckduckgo"""
         try:
             if not links:
@@ -446,104 +450,36 @@ class ScraperBingMariaDB:
             if not tipo_busca_id:
                 # Se não tiver, tenta buscar pelo nome
                 try:
-                    result = db.execute_query(
-                        "SELECT id FROM tipos_busca WHERE nome = %s",
-                        (config['tipo_busca'],)
-                    )
-                    if result:
-                        tipo_busca_id = result[0]['id']
+                    tipo_busca_id = (await refdata.aget()).tipo_busca_id(config['tipo_busca'])
                 except:
                     pass
             
-            # Prepara dados para salvar
-            saved_count = 0
-            for posicao, link in enumerate(links, 1):
-                try:
-                    # Verifica se o link já existe
-                    existe = db.execute_query(
-                        "SELECT id FROM links_duckduckgo WHERE url = %s",
-                        (link,)
-                    )
-                    
-                    if not existe:
-                        # Insere o link
-                        insert_query = """
-                            INSERT INTO links_duckduckgo 
-                            (url, plataforma_id, tipo_busca_id, estado_id, municipio_id, 
-                             distrito_id, termo_busca, posicao_busca, processado, created_at)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                        """
-                        
-                        db.execute_update(insert_query, (
-                            link,
-                            config['plataforma_id'],
-                            tipo_busca_id,
-                            config['estado_id'],
-                            config['municipio_id'],
-                            None,  # distrito_id
-                            query,  # termo_busca completo
-                            posicao,  # posição nos resultados
-                            0  # processado = false
-                        ))
-                        saved_count += 1
-                        
-                except Exception as e:
-                    logger.error(f"Erro ao salvar link {link}: {e}")
-                    continue
+            # Prepara dados para salvar (um INSERT IGNORE multi-linha; URLs repetidas são ignoradas)
+            resultado = await aingerir_links([
+                {
+                    'url': link,
+                    'plataforma_id': config['plataforma_id'],
+                    'tipo_busca_id': tipo_busca_id,
+                    'estado_id': config['estado_id'],
+                    'municipio_id': config['municipio_id'],
+                    'termo_busca': query,  # termo_busca completo
+                    'posicao_busca': posicao  # posição nos resultados
+                }
+                for posicao, link in enumerate(links, 1)
+            ])
+            saved_count = resultado['inseridos']
             
             logger.info(f"✅ Salvos {saved_count}/{len(links)} links em links_duckduckgo")
             
-            # Registra busca no log
-            try:
-                log_query = """
-                    INSERT INTO logs_busca 
-                    (motor_busca, query, plataforma_id, municipio_id, 
-                     links_encontrados, links_salvos, data_execucao)
-                    VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                """
-                db.execute_update(log_query, (
-                    'bing',
-                    query,
-                    config['plataforma_id'],
-                    config['municipio_id'],
-                    len(links),
-                    saved_count
-                ))
-            except:
-                # Se a tabela não existe, cria
-                try:
-                    create_log = """
-                        CREATE TABLE IF NOT EXISTS logs_busca (
-                            id INT AUTO_INCREMENT PRIMARY KEY,
-                            motor_busca VARCHAR(50),
-                            query TEXT,
-                            plataforma_id INT,
-                            municipio_id INT,
-                            links_encontrados INT,
-                            links_salvos INT,
-                            data_execucao DATETIME,
-                            observacao TEXT,
-                            INDEX idx_data (data_execucao)
-                        )
-                    """
-                    db.execute_update(create_log)
-                    
-                    # Tenta adicionar a coluna observacao se não existir
-                    try:
-                        db.execute_update("ALTER TABLE logs_busca ADD COLUMN observacao TEXT")
-                    except:
-                        pass  # Coluna já existe
-                    
-                    db.execute_update(log_query, (
-                        'bing',
-                        query,
-                        config['plataforma_id'],
-                        config['municipio_id'],
-                        len(links),
-                        saved_count
-                    ))
-                except Exception as e:
-                    logger.debug(f"Erro ao criar/atualizar tabela logs_busca: {e}")
+            # Registra busca no log (write-behind, sem latência na busca)
+            log_busca.registrar(
+                'bing',
+                query,
+                config['plataforma_id'],
+                config['municipio_id'],
+                len(links),
+                saved_count
+            )
             
         except Exception as e:
             logger.error(f"Erro ao salvar resultado: {e}")
@@ -573,30 +509,21 @@ class ScraperBingMariaDB:
             
             # Salva resultado se encontrou links
             if links:
-                self.salvar_resultado(config, query, links)
+                await self.salvar_resultado(config, query, links)
                 logger.info(f"✅ Total de {len(links)} links processados")
             else:
                 logger.warning(f"⚠️ Nenhum link encontrado para {nome}")
                 
                 # Registra no log mesmo sem resultados
-                try:
-                    log_query = """
-                        INSERT INTO logs_busca 
-                        (motor_busca, query, plataforma_id, municipio_id, 
-                         links_encontrados, links_salvos, data_execucao, observacao)
-                        VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s)
-                    """
-                    db.execute_update(log_query, (
-                        'bing',
-                        query,
-                        config['plataforma_id'],
-                        config['municipio_id'],
-                        0,
-                        0,
-                        'Nenhum resultado encontrado'
-                    ))
-                except:
-                    pass
+                log_busca.registrar(
+                    'bing',
+                    query,
+                    config['plataforma_id'],
+                    config['municipio_id'],
+                    0,
+                    0,
+                    'Nenhum resultado encontrado'
+                )
             
             # Aguarda entre buscas (mais tempo se não encontrou nada)
             tempo_espera = 30 if not links else 20
@@ -614,7 +541,7 @@ class ScraperBingMariaDB:
         logger.info(f"🔍 CICLO BING #{self.ciclo_numero}")
         logger.info(f"{'='*60}\n")
         
-        configuracoes = self.get_configuracoes_ativas()
+        configuracoes = await self.get_configuracoes_ativas()
         
         if not configuracoes:
             logger.warning("Nenhuma configuração")
@@ -633,6 +560,11 @@ class ScraperBingMariaDB:
         logger.info("🔄 Iniciando Bing Scraper")
         logger.info("Ctrl+C para parar\n")
         
+        try:
+            await asyncio.to_thread(verificar_schema)
+        except Exception as e:
+            logger.error(f"❌ Não foi possível verificar o schema: {e}")
+        
         try:
             while self.running:
                 try:
@@ -0,0 +1,137 @@
+"""
+Coalescência de chamadas concorrentes (single-flight)
+
+Chamadas simultâneas com a mesma chave aguardam uma única execução em
+andamento e recebem o mesmo resultado (ou a mesma exceção).
+SingleFlightEntreWorkers estende a coalescência aos outros processos do
+uvicorn através do estado compartilhado (estado_compartilhado.py).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Voo:
+    """Execução em andamento de uma chave e quantas chamadas a aguardam"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.aguardando = 0
+
+
+class SingleFlight:
+    """
+    ``executar(chave, fabrica)`` roda ``fabrica()`` uma vez por chave em voo.
+
+    A execução roda numa task própria, protegida com ``asyncio.shield``:
+    se uma das chamadas for cancelada (cliente desconectou), as demais
+    continuam aguardando. Quando todas as chamadas de uma chave são
+    canceladas, a execução também é cancelada e a chave é liberada.
+    """
+
+    def __init__(self, nome: str = 'single_flight'):
+        self.nome = nome
+        self._voos: Dict[Hashable, _Voo] = {}
+        self._stats = {
+            'execucoes': 0,
+            'coalescidas': 0,
+            'abandonadas': 0,
+        }
+
+    async def executar(self, chave: Hashable, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        voo = self._voos.get(chave)
+        if voo is None:
+            voo = _Voo(asyncio.create_task(fabrica()))
+            self._voos[chave] = voo
+            voo.task.add_done_callback(lambda _task, c=chave, v=voo: self._liberar(c, v))
+            self._stats['execucoes'] += 1
+        else:
+            self._stats['coalescidas'] += 1
+            logger.info(f"🔗 {self.nome}: aguardando execução em andamento para {chave}")
+
+        voo.aguardando += 1
+        try:
+            return await asyncio.shield(voo.task)
+        finally:
+            voo.aguardando -= 1
+            if voo.aguardando == 0 and not voo.task.done():
+                # Ninguém mais espera por esta chave: cancela a execução órfã
+                logger.warning(f"⚠️ {self.nome}: todas as chamadas para {chave} foram canceladas")
+                self._stats['abandonadas'] += 1
+                voo.task.cancel()
+                self._liberar(chave, voo)
+
+    def _liberar(self, chave: Hashable, voo: _Voo):
+        if self._voos.get(chave) is voo:
+            del self._voos[chave]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['em_andamento'] = len(self._voos)
+        stats['aguardando'] = sum(voo.aguardando for voo in self._voos.values())
+        return stats
+
+
+class SingleFlightEntreWorkers(SingleFlight):
+    """
+    Coalescência em dois níveis: dentro do processo como no SingleFlight e,
+    entre processos, por um registro da chave no estado compartilhado.
+
+    O worker que reserva a chave executa, renova a reserva a cada ``ttl``/3 s
+    e grava o resultado com ``serializar``; os outros consultam a cada
+    ``intervalo`` s e devolvem ``desserializar(resultado)``. Se o dono falha
+    ou morre (reserva expirada), um dos que esperam assume a execução.
+    Exceções não atravessam processos.
+    """
+
+    def __init__(self, nome: str, estado, serializar: Callable[[Any], str],
+                 desserializar: Callable[[str], Any], ttl: float = 30, intervalo: float = 0.25):
+        super().__init__(nome)
+        self.estado = estado
+        self.serializar = serializar
+        self.desserializar = desserializar
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self._stats.update({'coalescidas_entre_workers': 0, 'assumidas': 0})
+
+    async def executar(self, chave: Hashable, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        return await super().executar(chave, lambda: self._entre_workers(chave, fabrica))
+
+    async def _renovar(self, chave: str):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self.estado.arenovar_voo(chave, self.ttl)
+
+    async def _entre_workers(self, chave: Hashable, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        chave_txt = f"{self.nome}:{json.dumps(chave, default=str, ensure_ascii=False)}"
+        chegada = time.time()
+        esperou = False
+        while True:
+            reservado, resultado = await self.estado.areservar_voo(chave_txt, self.ttl, chegada)
+            if reservado:
+                break
+            if resultado is not None:
+                self._stats['coalescidas_entre_workers'] += 1
+                return self.desserializar(resultado)
+            if not esperou:
+                logger.info(f"🔗 {self.nome}: {chave} em andamento em outro worker")
+                esperou = True
+            await asyncio.sleep(self.intervalo)
+
+        if esperou:
+            self._stats['assumidas'] += 1
+        renovacao = asyncio.create_task(self._renovar(chave_txt))
+        try:
+            resultado = await fabrica()
+        except BaseException:
+            renovacao.cancel()
+            await self.estado.aabandonar_voo(chave_txt)
+            raise
+        renovacao.cancel()
+        await self.estado.aconcluir_voo(chave_txt, self.serializar(resultado))
+        return resultado
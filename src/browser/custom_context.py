@@ -9,6 +9,8 @@ from playwright.async_api import BrowserContext as PlaywrightBrowserContext
 from typing import Optional
 from browser_use.browser.context import BrowserContextState
 
+from src.utils.asset_cache import asset_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,3 +22,9 @@ class CustomBrowserContext(BrowserContext):
             state: Optional[BrowserContextState] = None,
     ):
         super(CustomBrowserContext, self).__init__(browser=browser, config=config, state=state)
+
+    async def _create_context(self, browser: PlaywrightBrowser) -> PlaywrightBrowserContext:
+        context = await super()._create_context(browser)
+        # Static subresources are served from the shared on-disk cache when enabled
+        await asset_cache.install(context)
+        return context
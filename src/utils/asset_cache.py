@@ -0,0 +1,311 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one process per directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class AssetCache:
+    """
+    On-disk, content-addressed cache for static subresources (scripts,
+    stylesheets, fonts, images), shared by every Playwright context it is
+    installed on.
+
+    Bodies are stored once per sha256 under ``directory``; an LRU index maps
+    URLs to blobs and is bounded by ``max_bytes``. Only GET responses with
+    status 200 and an explicit (or Last-Modified heuristic) freshness lifetime
+    are stored; ``no-store``/``no-cache`` responses always go to the network.
+
+    The index lives in memory and is written back as a whole, so a directory
+    has a single writer: each process locks ``directory`` itself or, when it
+    is taken (API_WORKERS > 1), the first free ``directory/worker-N`` slot.
+    Slots are reused after restarts, so every worker keeps a warm cache.
+    """
+
+    RESOURCE_TYPES = frozenset({"script", "stylesheet", "font", "image"})
+    # The body handed to route.fulfill is already decoded
+    DROP_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"})
+    HEURISTIC_MAX_TTL = 86400
+    SAVE_EVERY = 20
+
+    def __init__(self, directory: Optional[str], max_bytes: int = 200 * 1024 * 1024,
+                 max_entry_bytes: Optional[int] = None):
+        self.enabled = bool(directory)
+        self._lock_file = None
+        self.directory = self._claim_directory(Path(directory)) if directory else None
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 10
+
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._refs: Dict[str, int] = {}
+        self._blob_sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._unsaved = 0
+        self._installed = weakref.WeakSet()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "bytes_hit": 0,
+            "bytes_miss": 0,
+            "stored": 0,
+            "expired": 0,
+            "evictions": 0,
+        }
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load_index()
+
+    def _claim_directory(self, base: Path) -> Path:
+        """First directory slot not locked by another process (the lock is held until exit)"""
+        if fcntl is None:
+            return base
+        slot = 0
+        while True:
+            directory = base if slot == 0 else base / f"worker-{slot}"
+            directory.mkdir(parents=True, exist_ok=True)
+            lock_file = open(directory / ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                slot += 1
+                continue
+            self._lock_file = lock_file
+            if slot:
+                logger.info(f"Asset cache directory in use, this process uses {directory}")
+            return directory
+
+    # --- Playwright integration ---
+
+    async def install(self, context) -> None:
+        """Routes the context's requests through the cache (no-op when disabled or already installed)"""
+        if not self.enabled or context in self._installed:
+            return
+        await context.route("**/*", self._handle_route)
+        self._installed.add(context)
+
+    async def _handle_route(self, route) -> None:
+        request = route.request
+        if request.method != "GET" or request.resource_type not in self.RESOURCE_TYPES:
+            await route.continue_()
+            return
+
+        entry = self._lookup(request.url)
+        if entry is not None:
+            body = await asyncio.to_thread(self._read_blob, entry["digest"])
+            if body is not None:
+                self._stats["hits"] += 1
+                self._stats["bytes_hit"] += len(body)
+                await route.fulfill(status=entry["status"], headers=entry["headers"], body=body)
+                return
+            # Blob missing on disk: drop the entry so the response is stored again
+            self._remove(request.url)
+
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception as e:
+            logger.debug(f"Asset cache fetch failed for {request.url}: {e}")
+            await route.continue_()
+            return
+
+        self._stats["misses"] += 1
+        self._stats["bytes_miss"] += len(body)
+        await route.fulfill(response=response, body=body)
+
+        headers = {k.lower(): v for k, v in response.headers.items()}
+        ttl = self.freshness_lifetime(response.status, headers)
+        if ttl and len(body) <= self.max_entry_bytes:
+            await self._store(request.url, response.status, headers, body, ttl)
+
+    # --- HTTP caching rules ---
+
+    @staticmethod
+    def _cache_control(headers: Dict[str, str]) -> Dict[str, Optional[str]]:
+        directives = {}
+        for part in headers.get("cache-control", "").split(","):
+            name, _, value = part.strip().partition("=")
+            if name:
+                directives[name.lower()] = value.strip('"') or None
+        return directives
+
+    def freshness_lifetime(self, status: int, headers: Dict[str, str]) -> Optional[float]:
+        """Seconds the response stays fresh, or None if it must not be cached"""
+        if status != 200:
+            return None
+        if headers.get("vary", "").strip().lower() not in ("", "accept-encoding"):
+            return None
+        cc = self._cache_control(headers)
+        if "no-store" in cc or "no-cache" in cc:
+            return None
+
+        try:
+            if "max-age" in cc:
+                ttl = float(cc["max-age"] or 0)
+            elif "expires" in headers:
+                base = parsedate_to_datetime(headers["date"]) if "date" in headers else None
+                expires = parsedate_to_datetime(headers["expires"])
+                ttl = expires.timestamp() - (base.timestamp() if base else time.time())
+            elif "last-modified" in headers:
+                base = parsedate_to_datetime(headers["date"]).timestamp() if "date" in headers else time.time()
+                modified = parsedate_to_datetime(headers["last-modified"]).timestamp()
+                ttl = min((base - modified) * 0.1, self.HEURISTIC_MAX_TTL)
+            else:
+                return None
+            ttl -= float(headers.get("age", 0) or 0)
+        except (TypeError, ValueError):
+            return None
+        return ttl if ttl > 0 else None
+
+    # --- Index and blobs ---
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        try:
+            return self._blob_path(digest).read_bytes()
+        except OSError:
+            return None
+
+    def _write_blob(self, digest: str, body: bytes) -> None:
+        path = self._blob_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name: concurrent stores of the same body must not share it
+        tmp = path.with_name(f"{digest}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+
+    def _lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self._index.get(url)
+        if entry is None:
+            return None
+        if entry["expires"] <= time.time():
+            self._stats["expired"] += 1
+            self._remove(url)
+            return None
+        self._index.move_to_end(url)
+        return entry
+
+    async def _store(self, url: str, status: int, headers: Dict[str, str], body: bytes, ttl: float) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        if digest not in self._refs:
+            # The blob is only counted once it is on disk, so a failed or
+            # concurrent write never leaves a reference to a missing file
+            try:
+                await asyncio.to_thread(self._write_blob, digest, body)
+            except OSError as e:
+                logger.warning(f"Asset cache could not write {url}: {e}")
+                return
+        if digest not in self._refs:
+            self._refs[digest] = 0
+            self._blob_sizes[digest] = len(body)
+            self._bytes += len(body)
+        # New reference before dropping the old entry: re-storing a URL with
+        # the same body must not take the blob's count to zero and unlink it
+        self._refs[digest] += 1
+        if url in self._index:
+            self._remove(url)
+        self._index[url] = {
+            "digest": digest,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k not in self.DROP_HEADERS},
+            "expires": time.time() + ttl,
+        }
+        self._stats["stored"] += 1
+
+        while self._bytes > self.max_bytes and self._index:
+            oldest = next(iter(self._index))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+        self._unsaved += 1
+        if self._unsaved >= self.SAVE_EVERY:
+            self._unsaved = 0
+            # Snapshot taken on the event loop; only the file write runs in a thread
+            await asyncio.to_thread(self._write_index, list(self._index.items()))
+
+    def _remove(self, url: str) -> None:
+        entry = self._index.pop(url, None)
+        if entry is None:
+            return
+        digest = entry["digest"]
+        refs = self._refs.get(digest, 0) - 1
+        if refs > 0:
+            self._refs[digest] = refs
+        else:
+            self._refs.pop(digest, None)
+            self._bytes -= self._blob_sizes.pop(digest, 0)
+            try:
+                self._blob_path(digest).unlink()
+            except OSError:
+                pass
+
+    def _load_index(self) -> None:
+        path = self.directory / "index.json"
+        if not path.exists():
+            return
+        try:
+            entries = json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Asset cache index unreadable, starting empty: {e}")
+            return
+        now = time.time()
+        for url, entry in entries:
+            blob = self._blob_path(entry["digest"])
+            if entry["expires"] <= now or not blob.exists():
+                continue
+            digest = entry["digest"]
+            if digest not in self._refs:
+                self._refs[digest] = 0
+                self._blob_sizes[digest] = blob.stat().st_size
+                self._bytes += self._blob_sizes[digest]
+            self._refs[digest] += 1
+            self._index[url] = entry
+
+    def _write_index(self, entries) -> None:
+        path = self.directory / "index.json"
+        tmp = path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(entries))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Asset cache could not save index: {e}")
+
+    def save_index(self) -> None:
+        """Writes the LRU index to disk (blobs are written as they are stored)"""
+        if not self.enabled:
+            return
+        self._write_index(list(self._index.items()))
+        self._unsaved = 0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["entries"] = len(self._index)
+        stats["blobs"] = len(self._refs)
+        stats["bytes_on_disk"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+asset_cache = AssetCache(
+    os.getenv("ASSET_CACHE_DIR") or None,
+    max_bytes=int(os.getenv("ASSET_CACHE_MAX_MB", "200")) * 1024 * 1024,
+)
+atexit.register(asset_cache.save_index)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Teste do controle de admissão (admissao.py) e do 429 da API
+
+Sem banco nem navegador. Verifica:
+- com as vagas ocupadas, quem espera além de espera_max é recusado com retry_after;
+- com a fila cheia, a recusa é imediata;
+- uma plataforma lotada não trava as outras;
+- a vaga liberada vai para o primeiro da fila, e quem desiste sai da fila;
+- POST /buscar-link-unico responde 429 com Retry-After quando a captura é recusada.
+"""
+
+import asyncio
+import time
+
+from admissao import ControleAdmissao, AdmissaoRecusadaError
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+async def ocupar(controle: ControleAdmissao, plataforma: str, liberar: asyncio.Event, **kwargs):
+    async with controle.admitir(plataforma, **kwargs):
+        await liberar.wait()
+
+
+async def teste_espera_max() -> bool:
+    print("1️⃣ Sem vaga dentro de espera_max: AdmissaoRecusadaError com retry_after")
+    controle = ControleAdmissao('teste', max_global=1, espera_max=0.2)
+    liberar = asyncio.Event()
+    ocupante = asyncio.create_task(ocupar(controle, 'vivareal', liberar))
+    await asyncio.sleep(0)
+    inicio = time.monotonic()
+    try:
+        async with controle.admitir('vivareal'):
+            pass
+        return verificar(False, "segunda captura deveria ser recusada")
+    except AdmissaoRecusadaError as e:
+        espera, retry_after = time.monotonic() - inicio, e.retry_after
+    finally:
+        liberar.set()
+        await ocupante
+    stats = controle.stats()
+    return (verificar(0.15 <= espera < 1, f"recusada depois de {espera:.2f}s")
+            and verificar(isinstance(retry_after, int) and retry_after >= 1, f"retry_after={retry_after}")
+            and verificar(stats['recusadas_espera'] == 1 and stats['fila'] == 0 and stats['em_uso'] == 0,
+                          "fila e vagas limpas depois da recusa"))
+
+
+async def teste_fila_cheia() -> bool:
+    print("2️⃣ Fila cheia: recusa imediata")
+    controle = ControleAdmissao('teste', max_global=1, max_fila=1, espera_max=5)
+    liberar = asyncio.Event()
+    tarefas = [asyncio.create_task(ocupar(controle, 'vivareal', liberar)) for _ in range(2)]
+    await asyncio.sleep(0)
+    inicio = time.monotonic()
+    try:
+        async with controle.admitir('vivareal'):
+            pass
+        ok = verificar(False, "terceira captura deveria ser recusada")
+    except AdmissaoRecusadaError:
+        ok = verificar(time.monotonic() - inicio < 0.1, "recusada sem esperar")
+    liberar.set()
+    await asyncio.gather(*tarefas)
+    return ok and verificar(controle.stats()['recusadas_fila_cheia'] == 1, "recusadas_fila_cheia contada")
+
+
+async def teste_plataformas() -> bool:
+    print("3️⃣ Plataforma lotada não trava as outras; vaga vai para o primeiro da fila")
+    controle = ControleAdmissao('teste', max_global=3, max_por_plataforma=1, espera_max=5)
+    liberar_primeiro, liberar_resto = asyncio.Event(), asyncio.Event()
+    primeiro = asyncio.create_task(ocupar(controle, 'vivareal', liberar_primeiro))
+    await asyncio.sleep(0)
+    desistente = asyncio.create_task(ocupar(controle, 'vivareal', liberar_resto))
+    segundo = asyncio.create_task(ocupar(controle, 'vivareal', liberar_resto))
+    await asyncio.sleep(0)
+    ok = verificar(controle.stats()['fila'] == 2, "duas capturas do VivaReal na fila")
+
+    async with controle.admitir('zapimoveis', espera=0.1):
+        ok = verificar(controle.stats()['por_plataforma'] == {'vivareal': 1, 'zapimoveis': 1},
+                       "ZAP admitido na hora") and ok
+
+    desistente.cancel()
+    await asyncio.gather(desistente, return_exceptions=True)
+    ok = verificar(controle.stats()['fila'] == 1, "cliente que desistiu saiu da fila") and ok
+    liberar_primeiro.set()
+    await primeiro
+    await asyncio.sleep(0)
+    stats = controle.stats()
+    ok = verificar(stats['fila'] == 0 and stats['por_plataforma'] == {'vivareal': 1},
+                   "vaga liberada entregue ao próximo da fila") and ok
+    liberar_resto.set()
+    await segundo
+    return verificar(controle.stats()['em_uso'] == 0, "todas as vagas devolvidas") and ok
+
+
+async def teste_endpoint_429() -> bool:
+    print("4️⃣ POST /buscar-link-unico responde 429 com Retry-After")
+    from fastapi.testclient import TestClient
+    import api_imoveis_mariadb as api
+
+    async def sem_cache(busca, chave):
+        return None
+
+    api.buscar_em_cache = sem_cache
+    # Nenhuma vaga e nenhuma fila: toda captura nova é recusada
+    api.admissao_capturas = ControleAdmissao('teste', max_global=0, max_fila=0)
+    cliente = TestClient(api.app)
+    resposta = cliente.post("/buscar-link-unico", json={"cidade": "Campinas", "estado": "SP"})
+    return (verificar(resposta.status_code == 429, f"status {resposta.status_code}")
+            and verificar(int(resposta.headers.get("Retry-After", 0)) >= 1,
+                          f"Retry-After: {resposta.headers.get('Retry-After')}"))
+
+
+async def teste():
+    resultados = [await teste_espera_max(), await teste_fila_cheia(),
+                  await teste_plataformas(), await teste_endpoint_429()]
+    ok = all(resultados)
+    print("\n✅ Controle de admissão OK" if ok else "\n❌ Controle de admissão com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
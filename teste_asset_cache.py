@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de subrecursos em disco (src/utils/asset_cache.py), sem navegador
+
+Verifica:
+- gravar de novo a mesma URL com o mesmo corpo (duas páginas pedindo o
+  mesmo bundle) mantém o blob no disco;
+- um blob compartilhado por duas URLs só é apagado quando a última sai;
+- trocar o corpo de uma URL apaga o blob antigo;
+- com o blob sumido do disco, a entrada é descartada e o recurso volta a
+  ser gravado na próxima resposta.
+"""
+
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+from src.utils.asset_cache import AssetCache
+
+HEADERS = {'cache-control': 'max-age=3600', 'content-type': 'application/javascript'}
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+class RotaFalsa:
+    """O que _handle_route usa de uma playwright Route"""
+
+    def __init__(self, url: str, corpo: bytes):
+        self.request = SimpleNamespace(method='GET', resource_type='script', url=url)
+        self.corpo = corpo
+        self.buscas = 0
+        self.entregue = None
+
+    async def fetch(self):
+        self.buscas += 1
+        return SimpleNamespace(status=200, headers=HEADERS, body=self._corpo)
+
+    async def _corpo(self):
+        return self.corpo
+
+    async def fulfill(self, response=None, body=None, **kwargs):
+        self.entregue = body
+
+    async def continue_(self):
+        pass
+
+
+async def teste():
+    cache = AssetCache(tempfile.mkdtemp())
+    ok = True
+
+    print("1️⃣ Mesma URL, mesmo corpo, gravada duas vezes (inclusive ao mesmo tempo)")
+    await asyncio.gather(cache._store('https://x/app.js', 200, HEADERS, b'app1', 60),
+                         cache._store('https://x/app.js', 200, HEADERS, b'app1', 60))
+    await cache._store('https://x/app.js', 200, HEADERS, b'app1', 60)
+    digest = cache._index['https://x/app.js']['digest']
+    ok = verificar(cache._read_blob(digest) == b'app1', "blob continua no disco") and ok
+    ok = verificar(cache._refs == {digest: 1} and cache.stats()['bytes_on_disk'] == 4,
+                   "uma referência, 4 bytes contados") and ok
+
+    print("2️⃣ Blob compartilhado por duas URLs")
+    await cache._store('https://y/app.js', 200, HEADERS, b'app1', 60)
+    cache._remove('https://x/app.js')
+    ok = verificar(cache._read_blob(digest) == b'app1', "blob mantido enquanto a outra URL o usa") and ok
+    cache._remove('https://y/app.js')
+    ok = verificar(cache._read_blob(digest) is None and cache.stats()['bytes_on_disk'] == 0,
+                   "apagado quando a última URL sai") and ok
+
+    print("3️⃣ Corpo novo para a mesma URL")
+    await cache._store('https://x/app.js', 200, HEADERS, b'v1', 60)
+    antigo = cache._index['https://x/app.js']['digest']
+    await cache._store('https://x/app.js', 200, HEADERS, b'v2!', 60)
+    ok = verificar(cache._read_blob(antigo) is None and cache.stats()['bytes_on_disk'] == 3,
+                   "blob antigo apagado, só o novo contado") and ok
+
+    print("4️⃣ Blob sumido do disco")
+    cache._blob_path(cache._index['https://x/app.js']['digest']).unlink()
+    rota = RotaFalsa('https://x/app.js', b'v2!')
+    await cache._handle_route(rota)
+    ok = verificar(rota.buscas == 1 and rota.entregue == b'v2!', "resposta veio da rede") and ok
+    entrada = cache._index.get('https://x/app.js')
+    ok = verificar(entrada is not None and cache._read_blob(entrada['digest']) == b'v2!',
+                   "entrada gravada de novo com o blob no disco") and ok
+    rota = RotaFalsa('https://x/app.js', b'v2!')
+    await cache._handle_route(rota)
+    ok = verificar(rota.buscas == 0 and rota.entregue == b'v2!', "próxima requisição é HIT") and ok
+
+    print("\n✅ Asset cache OK" if ok else "\n❌ Asset cache com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
@@ -5,12 +5,24 @@ Teste da função de captura direta de links
 
 import asyncio
 from playwright.async_api import async_playwright
+from prontidao import aguardar_pagina_pronta
+from database import slug_municipio
 import logging
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SELETORES_RESULTADOS_VIVAREAL = [
+    '[data-testid="results-title"]',
+    'h1[class*="results"]',
+    'span[class*="results"]',
+    'div[class*="results-summary"]',
+    'div[class*="listing-counter"]',
+    'strong[class*="results"]',
+    '.results__title'
+]
+
 async def capturar_link_direto(cidade: str, estado: str, tipo_operacao: str) -> dict:
     """
     Função para capturar o link diretamente usando Playwright
@@ -21,7 +33,7 @@ async def capturar_link_direto(cidade: str, estado: str, tipo_operacao: str) ->
     
     try:
         # Formatar URL
-        cidade_formatada = cidade.lower().replace(" ", "-")
+        cidade_formatada = slug_municipio(cidade, 'VivaReal', estado)
         estado_formatado = estado.lower()
         url = f"https://www.vivareal.com.br/{tipo_operacao}/{estado_formatado}/{cidade_formatada}/"
         
@@ -48,8 +60,11 @@ async def capturar_link_direto(cidade: str, estado: str, tipo_operacao: str) ->
         logger.info("📄 Navegando para a página...")
         response = await page.goto(url, wait_until='domcontentloaded')
         
-        # Aguardar um pouco para garantir carregamento
-        await page.wait_for_timeout(5000)
+        # Aguardar o contador de resultados, rede ociosa ou DOM estável
+        pronta = await aguardar_pagina_pronta(
+            page, SELETORES_RESULTADOS_VIVAREAL, prazo=10, quieto_ms=1000, rotulo='teste_captura_direta'
+        )
+        logger.info(f"⏱️ Página pronta por {pronta['sinal']} em {pronta['espera_s']:.2f}s")
         
         # Capturar informações
         titulo = await page.title()
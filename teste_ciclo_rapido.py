@@ -6,7 +6,7 @@ Teste rápido de um ciclo de busca
 import asyncio
 import logging
 from automacao_completa import AutomacaoBuscaCompleta
-from database import db
+from database import db, aplanejar_ciclo
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,41 +17,38 @@ async def teste_ciclo():
     automacao = AutomacaoBuscaCompleta()
     automacao.delay_entre_buscas = 5  # Reduzir delay para teste
     
-    # Obter configurações
-    config = automacao.get_configuracoes_ativas()
+    # Primeira combinação pendente do planejador (a mesma ordem do ciclo real)
+    plano = await aplanejar_ciclo(max_idade_horas=automacao.max_idade_link_horas, limite=1)
     
-    if not config:
-        logger.error("Erro ao obter configurações")
+    if not plano['pendentes']:
+        logger.warning("Nenhuma combinação pendente para testar")
         return
     
-    # Testar apenas a primeira combinação
-    cidade = config['cidades'][0]
-    plataforma = config['plataformas'][0]
-    tipo_busca = config['tipos_busca'][0]
+    combinacao = plano['pendentes'][0]
     
     logger.info(f"Testando busca para:")
-    logger.info(f"  Cidade: {cidade['cidade']}/{cidade['estado_sigla']}")
-    logger.info(f"  Plataforma: {plataforma['nome']}")
-    logger.info(f"  Tipo: {tipo_busca['nome']}")
+    logger.info(f"  Cidade: {combinacao['cidade']}/{combinacao['estado_sigla']}")
+    logger.info(f"  Plataforma: {combinacao['plataforma_nome']}")
+    logger.info(f"  Tipo: {combinacao['tipo_busca']}")
     
     # Fazer a busca
     resultado = await automacao.buscar_link_plataforma(
-        cidade['cidade'],
-        cidade['estado_sigla'],
-        plataforma['nome'],
-        tipo_busca['nome']
+        combinacao['cidade'],
+        combinacao['estado_sigla'],
+        combinacao['plataforma_nome'],
+        combinacao['tipo_busca']
     )
     
     if resultado:
         logger.info(f"✅ Resultado obtido: {resultado}")
         
         # Tentar salvar
-        sucesso = automacao.salvar_link(
+        sucesso = await automacao.salvar_link(
             resultado,
-            cidade['municipio_id'],
-            cidade['estado_id'],
-            plataforma['id'],
-            tipo_busca['id']
+            combinacao['municipio_id'],
+            combinacao['estado_id'],
+            combinacao['plataforma_id'],
+            combinacao['tipo_busca_id']
         )
         
         if sucesso:
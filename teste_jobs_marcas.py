@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Teste das marcas de jobs em execução entre workers (estado_compartilhado.py + jobs.py)
+
+Usa o SQLite compartilhado real num arquivo temporário e dois
+EstadoCompartilhado (dois "workers" no mesmo processo); o banco MariaDB é
+substituído por um objeto que só conta o claim. Verifica:
+- uma cópia antiga da fila de B não sobrescreve nem apaga a marca de A,
+  e B não tenta o claim do job;
+- o job continua em ajobs_em_workers_vivos enquanto A executa;
+- a marca de um worker morto (sem heartbeat) é assumida.
+"""
+
+import asyncio
+import os
+import tempfile
+
+from estado_compartilhado import EstadoCompartilhado
+from jobs import JobManager
+
+INTERVALO_HEARTBEAT = 10
+
+
+class BancoFalso:
+    """Só o claim de _executar_marcado: nenhum job está pendente"""
+
+    def __init__(self):
+        self.claims = 0
+
+    async def aexecute(self, query, params=None):
+        self.claims += 1
+        return 0
+
+
+async def executor(parametros, emitir):
+    return {}
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+async def teste():
+    caminho = os.path.join(tempfile.mkdtemp(), 'estado.db')
+    a, b = EstadoCompartilhado(caminho), EstadoCompartilhado(caminho)
+    await a.aheartbeat()
+    await b.aheartbeat()
+    max_idade = INTERVALO_HEARTBEAT * 3
+
+    print("1️⃣ Cópia antiga do job na fila de outro worker")
+    ok = verificar(await a.amarcar_job('j1', max_idade), "A marca j1")
+    banco = BancoFalso()
+    jobs_b = JobManager(banco, 'teste', executor, estado=b, intervalo_heartbeat=INTERVALO_HEARTBEAT)
+    await jobs_b._executar('j1')
+    vivos = await b.ajobs_em_workers_vivos(max_idade)
+    ok = verificar(banco.claims == 0, "B descarta a cópia sem tentar o claim") and ok
+    ok = verificar(vivos == {'j1'}, f"j1 continua marcado enquanto A executa ({vivos})") and ok
+    ok = verificar(not await a.amarcar_job('j1', max_idade), "A também não marca duas vezes") and ok
+
+    print("2️⃣ Marca de um worker morto é assumida")
+    await a._rodar(lambda conn: conn.execute(
+        "UPDATE workers SET heartbeat = heartbeat - ? WHERE id = ?", (max_idade + 1, a.worker_id)
+    ))
+    ok = verificar(await b.amarcar_job('j1', max_idade), "B assume j1") and ok
+    await b.adesmarcar_job('j1')
+    ok = verificar(await b.ajobs_em_workers_vivos(max_idade) == set(), "B desmarca j1 ao terminar") and ok
+
+    print("\n✅ Marcas de jobs OK" if ok else "\n❌ Marcas de jobs com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Teste da gravação e do ritmo do lote (/buscar-links-lote)
+
+Roda executar_lote dentro de um StreamingResponse (como no endpoint), com a
+captura e o banco substituídos por funções locais (não precisa de navegador
+nem de MariaDB). Verifica:
+- requisição única coalescida numa captura do lote é gravada mesmo se o
+  cliente do lote desconecta no meio da captura;
+- item do lote coalescido numa captura de requisição única é gravado uma
+  única vez;
+- itens esperando o intervalo de um domínio não seguram a vaga de outro.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from starlette.responses import StreamingResponse
+
+import api_imoveis_mariadb as api
+from api_imoveis_mariadb import BuscaLote, BuscaUnica, ResultadoBuscaUnica, RitmoPorDominio
+
+DURACAO_CAPTURA = 0.3
+capturas = []
+gravados = []
+terminadas = []
+
+
+class RefFake:
+    def plataforma(self, nome, somente_ativas=True):
+        return None
+
+    def resolver_municipio(self, cidade, estado, plataforma=None):
+        return None
+
+
+async def aget_fake():
+    return RefFake()
+
+
+async def sem_cache(busca, chave):
+    return None
+
+
+async def executar_busca_fake(busca: BuscaUnica) -> ResultadoBuscaUnica:
+    capturas.append(busca.cidade)
+    await asyncio.sleep(DURACAO_CAPTURA)
+    resultado = ResultadoBuscaUnica(
+        cidade=busca.cidade,
+        estado=busca.estado,
+        tipo_operacao=busca.tipo_operacao,
+        plataforma=busca.plataforma,
+        link_unico=f"https://teste.invalid/{busca.cidade}/",
+        titulo_pagina=busca.cidade,
+        data_busca=datetime.now().isoformat(),
+        status="sucesso",
+        tier="http"
+    )
+    # Mesmo caminho de gravação da captura real
+    await api.salvar_link_unico(resultado)
+    terminadas.append(busca.cidade)
+    return resultado
+
+
+async def preparar_fake(resultado: ResultadoBuscaUnica) -> dict:
+    return {'url': resultado.link_unico}
+
+
+async def aupsert_fake(itens: list):
+    gravados.extend(item['url'] for item in itens)
+
+
+async def consumir_lote(lote: BuscaLote, concorrencia: int) -> list:
+    """Roda o lote como o StreamingResponse do endpoint e devolve as linhas NDJSON"""
+    linhas = []
+
+    async def send(mensagem):
+        if mensagem['type'] == 'http.response.body' and mensagem.get('body'):
+            linhas.append(mensagem['body'])
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    resposta = StreamingResponse(api.executar_lote(lote, concorrencia), media_type="application/x-ndjson")
+    await asyncio.wait_for(resposta({'type': 'http'}, receive, send), timeout=10)
+    return linhas
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+async def teste_unica_no_voo_do_lote() -> bool:
+    print("1️⃣ Lote desconecta durante uma captura que uma requisição única também espera")
+    lote = BuscaLote(itens=[BuscaUnica(cidade='Campinas', estado='SP')])
+    tarefa_lote = asyncio.create_task(consumir_lote(lote, 1))
+    await asyncio.sleep(0.05)
+    chave = await api.chave_busca(BuscaUnica(cidade='Campinas', estado='SP'))
+    unica = asyncio.create_task(api.buscas_em_andamento.executar(
+        chave, lambda: api.capturar_e_cachear(BuscaUnica(cidade='Campinas', estado='SP'), chave)
+    ))
+    await asyncio.sleep(0.05)
+    # Conexão do lote cai no meio da captura
+    tarefa_lote.cancel()
+    await asyncio.gather(tarefa_lote, return_exceptions=True)
+    resultado = await unica
+    return (verificar(resultado.link_unico.endswith('/Campinas/'), "requisição única recebe o resultado")
+            and verificar(capturas.count('Campinas') == 1, "uma captura")
+            and verificar(gravados.count('https://teste.invalid/Campinas/') == 1, "gravado uma vez"))
+
+
+async def teste_lote_no_voo_da_unica() -> bool:
+    print("2️⃣ Item do lote coalescido numa captura de requisição única")
+    busca = BuscaUnica(cidade='Santos', estado='SP')
+    chave = await api.chave_busca(busca)
+    unica = asyncio.create_task(api.buscas_em_andamento.executar(
+        chave, lambda: api.capturar_e_cachear(busca, chave)
+    ))
+    await asyncio.sleep(0.05)
+    linhas = await consumir_lote(BuscaLote(itens=[busca]), 1)
+    await unica
+    return (verificar(len(linhas) == 1 and capturas.count('Santos') == 1, "uma captura para os dois")
+            and verificar(gravados.count('https://teste.invalid/Santos/') == 1, "gravado uma vez"))
+
+
+async def teste_ritmo_fora_da_vaga() -> bool:
+    print("3️⃣ Espera de ritmo de um domínio não segura a vaga de outro")
+    api.ritmo_dominios = RitmoPorDominio(1.0)
+    terminadas.clear()
+    lote = BuscaLote(itens=[
+        BuscaUnica(cidade='Sorocaba', estado='SP', plataforma='VivaReal'),
+        BuscaUnica(cidade='Jundiai', estado='SP', plataforma='VivaReal'),
+        BuscaUnica(cidade='Curitiba', estado='PR', plataforma='ZapImoveis'),
+    ])
+    inicio = time.monotonic()
+    await consumir_lote(lote, 1)
+    duracao = time.monotonic() - inicio
+    return (verificar(terminadas.index('Curitiba') < terminadas.index('Jundiai'),
+                      f"ordem de término: {terminadas}")
+            and verificar(duracao < 1 + 3 * DURACAO_CAPTURA, f"lote em {duracao:.2f}s"))
+
+
+async def teste():
+    api.refdata = SimpleNamespace(aget=aget_fake)
+    api.buscar_em_cache = sem_cache
+    api.executar_busca_link_unico = executar_busca_fake
+    api.preparar_link_unico = preparar_fake
+    api.aupsert_links_unicos = aupsert_fake
+    # Sem intervalo entre capturas nos dois primeiros casos
+    api.ritmo_dominios = RitmoPorDominio(0)
+
+    resultados = [await teste_unica_no_voo_do_lote(), await teste_lote_no_voo_da_unica(),
+                  await teste_ritmo_fora_da_vaga()]
+    ok = all(resultados)
+    print("\n✅ Lote grava cada captura uma vez" if ok else "\n❌ Lote com falhas de gravação ou ritmo")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
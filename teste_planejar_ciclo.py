@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Teste do planejador de ciclo contra a lógica antiga, combinação a combinação
+
+Para uma plataforma e um tipo de busca (os primeiros ativos, ou os IDs
+passados na linha de comando), compara o conjunto de pendentes de
+aplanejar_ciclo com o que o loop antigo buscaria: para cada cidade ativa,
+a consulta de "link recente nas últimas N horas" que o ciclo fazia antes de
+cada busca. Só lê o banco.
+
+Uso: python teste_planejar_ciclo.py [plataforma_id] [tipo_busca_id]
+"""
+
+import asyncio
+import sys
+
+from database import db, refdata, aplanejar_ciclo
+
+MAX_IDADE_HORAS = 24
+
+# Consulta de AutomacaoBuscaCompleta.verificar_link_existente, antes do planejador
+QUERY_LINK_RECENTE = """
+    SELECT id, url, updated_at
+    FROM links_duckduckgo
+    WHERE plataforma_id = %s
+    AND tipo_busca_id = %s
+    AND estado_id = %s
+    AND municipio_id = %s
+    AND (updated_at > DATE_SUB(NOW(), INTERVAL %s HOUR)
+         OR created_at > DATE_SUB(NOW(), INTERVAL %s HOUR))
+"""
+
+
+async def pendentes_logica_antiga(ref, plataforma_id: int, tipo_busca_id: int) -> set:
+    estados_ativos = {e['id'] for e in ref.estados if e.get('ativo')}
+    pendentes = set()
+    for municipio in ref.municipios:
+        if not municipio.get('ativo') or municipio['estado_id'] not in estados_ativos:
+            continue
+        recente = await db.afetch(QUERY_LINK_RECENTE, (
+            plataforma_id, tipo_busca_id, municipio['estado_id'], municipio['id'],
+            MAX_IDADE_HORAS, MAX_IDADE_HORAS
+        ))
+        if not recente:
+            pendentes.add(municipio['id'])
+    return pendentes
+
+
+async def teste():
+    ok = True
+    try:
+        ref = await refdata.aget()
+        plataformas = [p for p in ref.plataformas if p.get('ativo')]
+        if not plataformas or not ref.tipos_busca:
+            print("⚠️ Sem plataformas ativas ou tipos de busca para comparar")
+            return False
+        plataforma_id = int(sys.argv[1]) if len(sys.argv) > 1 else plataformas[0]['id']
+        tipo_busca_id = int(sys.argv[2]) if len(sys.argv) > 2 else ref.tipos_busca[0]['id']
+        print(f"Plataforma {plataforma_id}, tipo de busca {tipo_busca_id}, idade máxima {MAX_IDADE_HORAS}h")
+
+        print("1️⃣ Mesmos pendentes que o loop por combinação")
+        plano = await aplanejar_ciclo(MAX_IDADE_HORAS, plataforma_ids=[plataforma_id],
+                                      tipo_busca_ids=[tipo_busca_id])
+        novos = {p['municipio_id'] for p in plano['pendentes']}
+        antigos = await pendentes_logica_antiga(ref, plataforma_id, tipo_busca_id)
+        if novos == antigos:
+            print(f"   ✅ {len(novos)} pendentes nos dois")
+        else:
+            print(f"   ❌ Só no planejador: {sorted(novos - antigos)[:20]}")
+            print(f"   ❌ Só na lógica antiga: {sorted(antigos - novos)[:20]}")
+            ok = False
+
+        print("2️⃣ Contagens e ordem")
+        if len(plano['pendentes']) == len(novos) <= plano['total_combinacoes']:
+            print(f"   ✅ Sem duplicatas, {plano['total_combinacoes']} combinações no total")
+        else:
+            print(f"   ❌ {len(plano['pendentes'])} linhas para {len(novos)} cidades")
+            ok = False
+        datas = [p['ultima_atualizacao'] for p in plano['pendentes']]
+        nunca = [d is None for d in datas]
+        capturadas = [d for d in datas if d is not None]
+        if nunca == sorted(nunca, reverse=True) and capturadas == sorted(capturadas):
+            print("   ✅ Nunca capturadas primeiro, depois da mais antiga para a mais recente")
+        else:
+            print("   ❌ Ordem dos pendentes incorreta")
+            ok = False
+    finally:
+        await db.aclose()
+
+    print("\n✅ Planejador de ciclo OK" if ok else "\n❌ Planejador de ciclo com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Teste do ConnectionPool (database.py) com conexões falsas, sem MariaDB
+
+Verifica:
+- checkout com o pool cheio espera e levanta PoolExhaustedError no tempo limite;
+- um checkout em espera recebe a conexão devolvida por outra thread;
+- conexão morta (ping falha) é descartada e trocada por uma nova;
+- conexão fechada ou velha demais não volta para o uso.
+"""
+
+import threading
+import time
+
+from database import ConnectionPool, PoolExhaustedError
+
+
+class ConexaoFalsa:
+    """Imita o que o pool usa de uma conexão pymysql"""
+
+    def __init__(self, numero: int):
+        self.numero = numero
+        self.open = True
+        self.viva = True
+
+    def ping(self, reconnect=False):
+        if not self.viva:
+            raise ConnectionError("conexão perdida")
+
+    def close(self):
+        self.open = False
+
+
+class PoolFalso(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__({}, **kwargs)
+        self.criadas = []
+
+    def _connect(self):
+        conexao = ConexaoFalsa(len(self.criadas) + 1)
+        self.criadas.append(conexao)
+        with self._cond:
+            self._criadas_em[id(conexao)] = time.monotonic()
+            self._stats['conexoes_criadas'] += 1
+        return conexao
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+def teste_timeout_checkout() -> bool:
+    print("1️⃣ Pool cheio: checkout espera e levanta PoolExhaustedError")
+    pool = PoolFalso(min_size=0, max_size=2, checkout_timeout=0.3)
+    pool.acquire(), pool.acquire()
+    inicio = time.monotonic()
+    try:
+        pool.acquire()
+        return verificar(False, "terceiro checkout deveria falhar")
+    except PoolExhaustedError:
+        espera = time.monotonic() - inicio
+    stats = pool.stats()
+    return (verificar(0.25 <= espera < 1, f"falhou depois de {espera:.2f}s (limite 0.3s)")
+            and verificar(stats['timeouts_checkout'] == 1 and stats['esgotamentos'] == 1,
+                          "timeouts_checkout e esgotamentos contados"))
+
+
+def teste_espera_devolucao() -> bool:
+    print("2️⃣ Checkout em espera recebe a conexão devolvida")
+    pool = PoolFalso(min_size=0, max_size=1, checkout_timeout=2)
+    conexao = pool.acquire()
+    threading.Timer(0.2, pool.release, args=(conexao,)).start()
+    inicio = time.monotonic()
+    recebida = pool.acquire()
+    espera = time.monotonic() - inicio
+    return (verificar(recebida is conexao, "mesma conexão reaproveitada")
+            and verificar(0.15 <= espera < 1, f"esperou {espera:.2f}s pela devolução")
+            and verificar(len(pool.criadas) == 1, "nenhuma conexão extra aberta"))
+
+
+def teste_conexao_morta() -> bool:
+    print("3️⃣ Conexão morta é trocada no checkout")
+    pool = PoolFalso(min_size=0, max_size=1, ping_interval=0)
+    conexao = pool.acquire()
+    pool.release(conexao)
+    conexao.viva = False
+    time.sleep(0.01)
+    nova = pool.acquire()
+    stats = pool.stats()
+    return (verificar(nova is not conexao and nova.viva, "checkout devolveu uma conexão nova")
+            and verificar(not conexao.open, "conexão morta foi fechada")
+            and verificar(stats['falhas_health_check'] == 1 and stats['conexoes_descartadas'] == 1,
+                          "falha de health check e descarte contados"))
+
+
+def teste_fechada_e_velha() -> bool:
+    print("4️⃣ Conexão fechada ou acima de max_lifetime não é reutilizada")
+    pool = PoolFalso(min_size=0, max_size=1, max_lifetime=0.1)
+    fechada = pool.acquire()
+    fechada.close()
+    pool.release(fechada)
+    velha = pool.acquire()
+    ok = verificar(velha is not fechada, "conexão fechada descartada na devolução")
+    pool.release(velha)
+    time.sleep(0.15)
+    nova = pool.acquire()
+    return (ok and verificar(nova is not velha and not velha.open, "conexão velha trocada no checkout")
+            and verificar(pool.stats()['conexoes_descartadas'] == 2, "vagas liberadas pelos descartes"))
+
+
+def teste():
+    resultados = [teste_timeout_checkout(), teste_espera_devolucao(),
+                  teste_conexao_morta(), teste_fechada_e_velha()]
+    ok = all(resultados)
+    print("\n✅ Pool de conexões OK" if ok else "\n❌ Pool de conexões com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    teste()
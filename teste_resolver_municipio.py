@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Teste do índice de municípios (ReferenceData.resolver_municipio) e da chave de busca
+
+Sem banco: o ReferenceData é montado com linhas em memória. Verifica:
+- aliases ('Embu' -> 'Embu das Artes');
+- acentos, caixa e hífens ('sao-paulo', 'SÃO PAULO');
+- UF no próprio nome ('Campinas/SP', 'Campinas - SP', 'Campinas, sp');
+- nome que existe em mais de uma UF só resolve com a UF;
+- chave_busca dá a mesma chave para nomes que resolvem no mesmo município.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from database import ReferenceData
+
+PLATAFORMAS = [{'id': 1, 'nome': 'VivaReal', 'url_base': 'https://www.vivareal.com.br', 'ativo': 1}]
+TIPOS_BUSCA = [{'id': 1, 'nome': 'VENDA'}]
+ESTADOS = [
+    {'id': 35, 'nome': 'São Paulo', 'sigla': 'SP', 'ativo': 1},
+    {'id': 33, 'nome': 'Rio de Janeiro', 'sigla': 'RJ', 'ativo': 1},
+    {'id': 31, 'nome': 'Minas Gerais', 'sigla': 'MG', 'ativo': 1},
+]
+MUNICIPIOS = [
+    {'id': 3515004, 'nome': 'Embu das Artes', 'estado_id': 35, 'ativo': 1},
+    {'id': 3550308, 'nome': 'São Paulo', 'estado_id': 35, 'ativo': 1},
+    {'id': 3509502, 'nome': 'Campinas', 'estado_id': 35, 'ativo': 1},
+    {'id': 3303807, 'nome': 'Paraty', 'estado_id': 33, 'ativo': 1},
+    {'id': 3541406, 'nome': 'Presidente Prudente', 'estado_id': 35, 'ativo': 1},
+    {'id': 3550605, 'nome': 'São Sebastião', 'estado_id': 35, 'ativo': 1},
+    {'id': 3164704, 'nome': 'São Sebastião do Paraíso', 'estado_id': 31, 'ativo': 1},
+    {'id': 3302403, 'nome': 'Macaé', 'estado_id': 33, 'ativo': 1},
+    {'id': 3138203, 'nome': 'Bom Jesus', 'estado_id': 31, 'ativo': 1},
+    {'id': 3306701, 'nome': 'Bom Jesus', 'estado_id': 33, 'ativo': 1},
+]
+
+CASOS = [
+    # (nome, uf, municipio_id esperado)
+    ('Embu', 'SP', 3515004),
+    ('Embu das Artes', 'SP', 3515004),
+    ('embu', None, 3515004),
+    ('Parati', 'RJ', 3303807),
+    ('sao-paulo', 'SP', 3550308),
+    ('SÃO PAULO', 'sp', 3550308),
+    ('Sao Paulo', None, 3550308),
+    ('Macae', 'RJ', 3302403),
+    ('Campinas/SP', None, 3509502),
+    ('Campinas - SP', None, 3509502),
+    ('Campinas, sp', None, 3509502),
+    ('Embu/SP', None, 3515004),
+    ('Bom Jesus', 'RJ', 3306701),
+    ('Bom Jesus', None, None),
+    ('Campinas', 'RJ', None),
+    ('Cidade Inexistente', 'SP', None),
+]
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+def teste_resolver(ref: ReferenceData) -> bool:
+    print("1️⃣ resolver_municipio: aliases, acentos e UF no nome")
+    ok = True
+    for nome, uf, esperado in CASOS:
+        resolvido = ref.resolver_municipio(nome, uf)
+        obtido = resolvido['municipio_id'] if resolvido else None
+        ok = verificar(obtido == esperado, f"{nome!r}, {uf!r} -> {obtido}") and ok
+    resolvido = ref.resolver_municipio('Embu', 'SP')
+    return verificar(resolvido['sigla'] == 'SP' and resolvido['slug'] == 'embu-das-artes',
+                     f"sigla e slug do oficial: {resolvido['sigla']}, {resolvido['slug']}") and ok
+
+
+async def teste_chave(ref: ReferenceData) -> bool:
+    print("2️⃣ chave_busca usa o município resolvido")
+    import api_imoveis_mariadb as api
+    from api_imoveis_mariadb import BuscaUnica
+
+    async def aget():
+        return ref
+
+    api.refdata = SimpleNamespace(aget=aget)
+    embu = await api.chave_busca(BuscaUnica(cidade='Embu', estado='SP'))
+    ok = verificar(embu == await api.chave_busca(BuscaUnica(cidade='Embu das Artes', estado='sp')),
+                   f"'Embu' e 'Embu das Artes' dão {embu}")
+    ok = verificar(embu[3] == 'vivareal', "plataforma continua no fim da chave") and ok
+    desconhecida = await api.chave_busca(BuscaUnica(cidade='Cidade Inexistente', estado='sp'))
+    return verificar(desconhecida[:2] == ('cidade inexistente', 'SP'),
+                     f"sem resolução, nome normalizado e UF: {desconhecida}") and ok
+
+
+async def teste():
+    ref = ReferenceData(PLATAFORMAS, TIPOS_BUSCA, ESTADOS, MUNICIPIOS)
+    resultados = [teste_resolver(ref), await teste_chave(ref)]
+    ok = all(resultados)
+    print("\n✅ Resolução de municípios OK" if ok else "\n❌ Resolução de municípios com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Teste de respostas.py: negociação de Accept-Encoding e resposta_json
+
+Sem banco. Verifica:
+- negociar_codificacao respeita q=0, '*', maiúsculas e a ausência do brotli;
+- resposta_json só comprime acima do tamanho mínimo, sempre com Vary;
+- o corpo comprimido volta ao JSON original;
+- ler_campos recusa campos desconhecidos com 400.
+"""
+
+import gzip
+
+import orjson
+from fastapi import HTTPException
+
+import respostas
+from respostas import TAMANHO_MINIMO_COMPRESSAO, ler_campos, negociar_codificacao, resposta_json
+
+CASOS_SEM_BROTLI = [
+    (None, None),
+    ('', None),
+    ('gzip', 'gzip'),
+    ('GZIP, deflate', 'gzip'),
+    ('deflate', None),
+    ('br', None),
+    ('br, gzip', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=0, *', None),
+    ('*', 'gzip'),
+    ('*;q=0', None),
+    ('gzip;q=abc', None),
+    ('identity, gzip;q=0.5', 'gzip'),
+]
+
+CASOS_COM_BROTLI = [
+    ('br', 'br'),
+    ('gzip, deflate, br', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'gzip'),
+]
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+def verificar_casos(casos) -> bool:
+    ok = True
+    for accept, esperado in casos:
+        obtido = negociar_codificacao(accept)
+        ok = verificar(obtido == esperado, f"{accept!r} -> {obtido!r}") and ok
+    return ok
+
+
+def teste_negociacao() -> bool:
+    brotli_original = respostas.brotli
+    try:
+        print("1️⃣ negociar_codificacao sem o pacote brotli")
+        respostas.brotli = None
+        ok = verificar_casos(CASOS_SEM_BROTLI)
+        print("2️⃣ negociar_codificacao com o pacote brotli")
+        respostas.brotli = object()
+        return verificar_casos(CASOS_COM_BROTLI) and ok
+    finally:
+        respostas.brotli = brotli_original
+
+
+def teste_resposta_json() -> bool:
+    print("3️⃣ resposta_json comprime só acima do tamanho mínimo")
+    pequeno = {'total': 1, 'cidades': [{'id': 1, 'nome': 'Campinas'}]}
+    grande = {'total': 500, 'cidades': [{'id': i, 'nome': f'Cidade {i}'} for i in range(500)]}
+
+    resposta = resposta_json(pequeno, 'gzip')
+    ok = verificar('content-encoding' not in resposta.headers and resposta.headers.get('vary') == 'Accept-Encoding',
+                   f"corpo de {len(resposta.body)} bytes sai sem compressão, com Vary")
+
+    resposta = resposta_json(grande, 'gzip')
+    corpo = gzip.decompress(resposta.body)
+    ok = verificar(resposta.headers.get('content-encoding') == 'gzip'
+                   and len(corpo) >= TAMANHO_MINIMO_COMPRESSAO
+                   and orjson.loads(corpo) == grande,
+                   f"{len(corpo)} bytes -> {len(resposta.body)} com gzip, mesmo JSON") and ok
+
+    resposta = resposta_json(grande, None)
+    return verificar('content-encoding' not in resposta.headers and orjson.loads(resposta.body) == grande,
+                     "sem Accept-Encoding, JSON puro") and ok
+
+
+def teste_campos() -> bool:
+    print("4️⃣ ler_campos")
+    ok = verificar(ler_campos('nome, id,nome', ('id', 'nome')) == ['nome', 'id'],
+                   "ordem pedida, sem repetições")
+    try:
+        ler_campos('id,senha', ('id', 'nome'))
+        return verificar(False, "campo desconhecido deveria dar 400")
+    except HTTPException as e:
+        return verificar(e.status_code == 400 and 'senha' in e.detail, "campo desconhecido: 400") and ok
+
+
+def teste():
+    resultados = [teste_negociacao(), teste_resposta_json(), teste_campos()]
+    ok = all(resultados)
+    print("\n✅ Respostas OK" if ok else "\n❌ Respostas com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    teste()
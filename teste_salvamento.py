@@ -37,7 +37,7 @@ async def teste_salvamento():
     logger.info(f"Testando salvamento com dados: {dados_teste}")
     
     # Tentar salvar
-    resultado = automacao.salvar_link(
+    resultado = await automacao.salvar_link(
         dados_teste,
         municipio_id,
         estado_id,
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Teste do SingleFlight (single_flight.py), sem banco nem navegador
+
+Verifica:
+- chamadas simultâneas com a mesma chave rodam a fábrica uma única vez;
+- a exceção da execução chega a todas as chamadas;
+- cancelar uma das chamadas não cancela a execução das demais;
+- cancelar todas cancela a execução e libera a chave;
+- depois de terminar, a mesma chave roda de novo.
+"""
+
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def verificar(condicao: bool, mensagem: str) -> bool:
+    print(f"   {'✅' if condicao else '❌'} {mensagem}")
+    return condicao
+
+
+class Fabrica:
+    """Conta execuções e deixa o teste decidir quando cada uma termina"""
+
+    def __init__(self, erro: Exception = None):
+        self.execucoes = 0
+        self.canceladas = 0
+        self.liberar = asyncio.Event()
+        self.erro = erro
+
+    async def __call__(self):
+        self.execucoes += 1
+        try:
+            await self.liberar.wait()
+        except asyncio.CancelledError:
+            self.canceladas += 1
+            raise
+        if self.erro:
+            raise self.erro
+        return f"resultado {self.execucoes}"
+
+
+async def teste_coalescencia() -> bool:
+    print("1️⃣ Chamadas simultâneas rodam a fábrica uma vez")
+    voos, fabrica = SingleFlight('teste'), Fabrica()
+    chamadas = [asyncio.create_task(voos.executar('sp', fabrica)) for _ in range(5)]
+    await asyncio.sleep(0)
+    fabrica.liberar.set()
+    resultados = await asyncio.gather(*chamadas)
+    stats = voos.stats()
+    return (verificar(fabrica.execucoes == 1, f"{fabrica.execucoes} execução")
+            and verificar(set(resultados) == {"resultado 1"}, "todas recebem o mesmo resultado")
+            and verificar(stats['coalescidas'] == 4 and stats['em_andamento'] == 0,
+                          "4 coalescidas, chave liberada"))
+
+
+async def teste_excecao() -> bool:
+    print("2️⃣ A exceção chega a todas as chamadas")
+    voos, fabrica = SingleFlight('teste'), Fabrica(erro=RuntimeError("falhou"))
+    chamadas = [asyncio.create_task(voos.executar('sp', fabrica)) for _ in range(3)]
+    await asyncio.sleep(0)
+    fabrica.liberar.set()
+    resultados = await asyncio.gather(*chamadas, return_exceptions=True)
+    return verificar(all(isinstance(r, RuntimeError) for r in resultados), "3 RuntimeError")
+
+
+async def teste_cancelar_uma() -> bool:
+    print("3️⃣ Cancelar uma chamada não afeta as outras")
+    voos, fabrica = SingleFlight('teste'), Fabrica()
+    cancelada = asyncio.create_task(voos.executar('sp', fabrica))
+    restante = asyncio.create_task(voos.executar('sp', fabrica))
+    await asyncio.sleep(0)
+    cancelada.cancel()
+    await asyncio.sleep(0)
+    fabrica.liberar.set()
+    resultado = await restante
+    return (verificar(cancelada.cancelled(), "chamada cancelada levanta CancelledError")
+            and verificar(resultado == "resultado 1" and fabrica.canceladas == 0,
+                          "a outra recebe o resultado da mesma execução")
+            and verificar(voos.stats()['abandonadas'] == 0, "nenhuma execução abandonada"))
+
+
+async def teste_cancelar_todas() -> bool:
+    print("4️⃣ Cancelar todas cancela a execução e libera a chave")
+    voos, fabrica = SingleFlight('teste'), Fabrica()
+    chamadas = [asyncio.create_task(voos.executar('sp', fabrica)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for chamada in chamadas:
+        chamada.cancel()
+    await asyncio.gather(*chamadas, return_exceptions=True)
+    await asyncio.sleep(0)
+    stats = voos.stats()
+    ok = (verificar(fabrica.canceladas == 1, "execução órfã cancelada")
+          and verificar(stats['abandonadas'] == 1 and stats['em_andamento'] == 0, "chave liberada"))
+
+    nova = asyncio.create_task(voos.executar('sp', fabrica))
+    await asyncio.sleep(0)
+    fabrica.liberar.set()
+    return ok and verificar(await nova == "resultado 2", "nova chamada roda uma nova execução")
+
+
+async def teste():
+    resultados = [await teste_coalescencia(), await teste_excecao(),
+                  await teste_cancelar_uma(), await teste_cancelar_todas()]
+    ok = all(resultados)
+    print("\n✅ SingleFlight OK" if ok else "\n❌ SingleFlight com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
@@ -23,7 +23,7 @@ async def teste():
     
     if resultado:
         # Tentar salvar
-        sucesso = automacao.salvar_link(
+        sucesso = await automacao.salvar_link(
             resultado,
             municipio_id=4106902,  # Curitiba
             estado_id=41,          # PR
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Teste do upsert de links únicos contra o MariaDB
+
+Usa uma combinação fictícia (IDs 999990+, sem FK em links_duckduckgo) e
+apaga as linhas criadas no fim. Verifica que:
+- uma URL já gravada como link de SERP (link_unico NULL) é promovida e
+  aparece em abuscar_link_unico;
+- trocar o link da combinação para uma URL que pertence a outra linha não
+  quebra o lote: a linha antiga é rebaixada e a outra promovida;
+- termo_busca é atualizado no upsert.
+"""
+
+import asyncio
+import uuid
+
+from database import db, aupsert_links_unicos, abuscar_link_unico
+
+PLATAFORMA, TIPO, ESTADO, MUNICIPIO = 999990, 999991, 999992, 999993
+
+
+def item(url: str, termo: str) -> dict:
+    return {
+        'url': url, 'plataforma_id': PLATAFORMA, 'tipo_busca_id': TIPO,
+        'estado_id': ESTADO, 'municipio_id': MUNICIPIO, 'termo_busca': termo,
+    }
+
+
+async def inserir_serp(url: str):
+    await db.aexecute(
+        """INSERT INTO links_duckduckgo (url, plataforma_id, tipo_busca_id, estado_id, municipio_id,
+                                         termo_busca, posicao_busca, processado)
+           VALUES (%s, %s, %s, %s, %s, 'serp', 3, 0)""",
+        (url, PLATAFORMA, TIPO, ESTADO, MUNICIPIO)
+    )
+
+
+async def teste():
+    prefixo = f"https://teste.invalid/{uuid.uuid4().hex}"
+    url_a, url_b = f"{prefixo}/a", f"{prefixo}/b"
+    ok = True
+    try:
+        print("1️⃣ URL já gravada como link de SERP é promovida a link único")
+        await inserir_serp(url_a)
+        await aupsert_links_unicos([item(url_a, 'termo 1')])
+        link = await abuscar_link_unico(PLATAFORMA, TIPO, ESTADO, MUNICIPIO)
+        if link and link['url'] == url_a and link['termo_busca'] == 'termo 1':
+            print("   ✅ abuscar_link_unico retorna a URL promovida")
+        else:
+            print(f"   ❌ Esperado {url_a}, obtido {link}")
+            ok = False
+
+        print("2️⃣ Troca para uma URL que pertence a outra linha")
+        await inserir_serp(url_b)
+        await aupsert_links_unicos([item(url_b, 'termo 2')])
+        link = await abuscar_link_unico(PLATAFORMA, TIPO, ESTADO, MUNICIPIO)
+        linhas = await db.afetch(
+            "SELECT url, link_unico FROM links_duckduckgo WHERE url IN (%s, %s)", (url_a, url_b)
+        )
+        estado_links = {linha['url']: linha['link_unico'] for linha in linhas}
+        if link and link['url'] == url_b and estado_links == {url_a: None, url_b: 1}:
+            print("   ✅ Link anterior rebaixado, nova URL promovida, sem duplicatas")
+        else:
+            print(f"   ❌ Link: {link}, linhas: {estado_links}")
+            ok = False
+
+        print("3️⃣ Upsert repetido só atualiza termo_busca")
+        await aupsert_links_unicos([item(url_b, 'termo 3')])
+        link = await abuscar_link_unico(PLATAFORMA, TIPO, ESTADO, MUNICIPIO)
+        if link and link['termo_busca'] == 'termo 3':
+            print("   ✅ termo_busca atualizado")
+        else:
+            print(f"   ❌ termo_busca: {link and link['termo_busca']}")
+            ok = False
+    finally:
+        await db.aexecute("DELETE FROM links_duckduckgo WHERE url LIKE %s", (prefixo + '%',))
+        await db.aclose()
+
+    print("\n✅ Upsert de link único OK" if ok else "\n❌ Upsert de link único com falhas")
+    return ok
+
+
+if __name__ == "__main__":
+    asyncio.run(teste())
@@ -4,6 +4,7 @@ Script para verificar e configurar dados necessários no banco MariaDB
 """
 
 from database import db
+from migracoes import aplicar_migracoes, verificar_schema
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -106,31 +107,16 @@ def verificar_estrutura_tabela():
             count = db.execute_query("SELECT COUNT(*) as total FROM links_duckduckgo")
             logger.info(f"📊 Total de registros: {count[0]['total']}")
             
+            # Migrações pendentes, índices ausentes e full scans das queries quentes
+            relatorio = verificar_schema()
+            if not relatorio['indices_ausentes'] and not relatorio['full_scans']:
+                logger.info("✅ Índices das queries quentes OK")
+            
         else:
             logger.error("❌ Tabela links_duckduckgo NÃO existe!")
             logger.info("Criando tabela...")
             
-            create_query = """
-            CREATE TABLE IF NOT EXISTS links_duckduckgo (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                url VARCHAR(500) NOT NULL,
-                plataforma_id INT,
-                tipo_busca_id INT,
-                estado_id INT,
-                municipio_id INT,
-                distrito_id INT,
-                termo_busca VARCHAR(255),
-                posicao_busca INT DEFAULT 0,
-                processado TINYINT DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP NULL ON UPDATE CURRENT_TIMESTAMP,
-                INDEX idx_plataforma (plataforma_id),
-                INDEX idx_tipo_busca (tipo_busca_id),
-                INDEX idx_local (estado_id, municipio_id),
-                UNIQUE KEY uk_url (url)
-            )
-            """
-            db.execute_update(create_query)
+            aplicar_migracoes()
             logger.info("✅ Tabela criada com sucesso")
             
     except Exception as e: